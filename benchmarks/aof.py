@@ -0,0 +1,47 @@
+"""
+SET throughput with AOF logging under each appendfsync policy. Commands are
+processed in batches, as they would be for one read on a pipelining client,
+and the AOF is flushed after every batch.
+
+    python -m benchmarks.aof
+"""
+import os
+import tempfile
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.persistence import APPENDFSYNC_POLICIES, AppendOnlyPersister
+from pyredis.types import Array, BulkString
+
+COMMANDS = 20_000
+BATCHES = (1, 16)
+
+
+def run(persister, batch):
+    datastore = Datastore(thread_safe=False)
+    command = Array([BulkString(b"SET"), BulkString(b"key"), BulkString(b"value")])
+    start = perf_counter()
+    for _ in range(COMMANDS // batch):
+        for _ in range(batch):
+            handle_command(command, datastore, persister)
+        if persister:
+            persister.flush()
+    return COMMANDS / (perf_counter() - start)
+
+
+def main():
+    print(f"{'appendfsync':<12}" + "".join(f"{f'batch {b}':>14}" for b in BATCHES))
+    print(f"{'(no aof)':<12}" + "".join(f"{run(None, b):>14,.0f}" for b in BATCHES))
+    with tempfile.TemporaryDirectory() as directory:
+        for policy in APPENDFSYNC_POLICIES:
+            rates = []
+            for batch in BATCHES:
+                persister = AppendOnlyPersister(os.path.join(directory, f"{policy}-{batch}.aof"), policy)
+                rates.append(run(persister, batch))
+                persister.close()
+            print(f"{policy:<12}" + "".join(f"{rate:>14,.0f}" for rate in rates))
+
+
+if __name__ == '__main__':
+    main()
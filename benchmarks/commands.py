@@ -0,0 +1,35 @@
+"""
+Throughput of command dispatch and reply encoding for GET, SET and INCR,
+calling handle_command directly so that network and parsing costs are
+excluded, with command statistics on and off.
+
+    python -m benchmarks.commands
+"""
+from timeit import repeat
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.protocol import encode_message
+from pyredis.stats import STATS
+from pyredis.types import Array, BulkString
+
+ITERATIONS = 200_000
+
+
+def bench(name, command, datastore):
+    elapsed = min(repeat(lambda: encode_message(handle_command(command, datastore)), number=ITERATIONS, repeat=5))
+    print(f"{name:<6} {ITERATIONS / elapsed:>12,.0f} ops/sec")
+
+
+def main():
+    for enabled in (True, False):
+        STATS.enabled = enabled
+        print(f"stats {'on' if enabled else 'off'}")
+        datastore = Datastore()
+        bench("SET", Array([BulkString(b"SET"), BulkString(b"key"), BulkString(b"value")]), datastore)
+        bench("GET", Array([BulkString(b"GET"), BulkString(b"key")]), datastore)
+        bench("INCR", Array([BulkString(b"INCR"), BulkString(b"counter")]), datastore)
+
+
+if __name__ == '__main__':
+    main()
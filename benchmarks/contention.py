@@ -0,0 +1,58 @@
+"""
+Datastore lock contention: N threads issuing a GET/SET/INCR mix against one
+store, comparing a single lock with lock striping. Run it on a free-threaded
+CPython build (python3.13t or later) to see the effect without the GIL.
+
+    python -m benchmarks.contention
+"""
+import sys
+from threading import Barrier, Thread
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.types import Array, BulkString
+
+THREADS = (1, 2, 4, 8, 16, 32, 64)
+STRIPES = (1, 16, 64)
+OPS_PER_THREAD = 20_000
+KEYS = 1024
+
+
+def worker(datastore, thread_id, barrier):
+    commands = []
+    for i in range(KEYS):
+        key = f"key:{(i * 31 + thread_id) % KEYS}".encode()
+        commands.append(Array([BulkString(b"SET"), BulkString(key), BulkString(b"value")]))
+        commands.append(Array([BulkString(b"GET"), BulkString(key)]))
+        commands.append(Array([BulkString(b"INCR"), BulkString(b"counter:" + key)]))
+
+    barrier.wait()
+    for i in range(OPS_PER_THREAD):
+        handle_command(commands[i % len(commands)], datastore)
+
+
+def run(threads, stripes):
+    datastore = Datastore(lock_stripes=stripes)
+    barrier = Barrier(threads + 1)
+    workers = [Thread(target=worker, args=(datastore, i, barrier)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = perf_counter()
+    for w in workers:
+        w.join()
+    return threads * OPS_PER_THREAD / (perf_counter() - start)
+
+
+def main():
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    print("threads " + "".join(f"{f'{s} stripes':>16}" for s in STRIPES))
+    for threads in THREADS:
+        rates = "".join(f"{run(threads, stripes):>16,.0f}" for stripes in STRIPES)
+        print(f"{threads:>7} {rates}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Eviction under maxmemory. A cache-aside workload, where a miss is followed
+by a SET of the key, runs against a store limited to about a quarter of the
+keyspace, with accesses skewed towards a minority of hot keys. The hit ratio
+of each policy is compared with that of an exact LRU cache of the same
+number of keys. Then the time per SET with eviction on every write, against
+no limit, at two store sizes, shows that sampling keeps the cost of
+eviction independent of the number of keys.
+
+    python -m benchmarks.eviction
+"""
+import random
+from collections import OrderedDict
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import ALLKEYS_LFU, ALLKEYS_LRU, VOLATILE_LRU, VOLATILE_TTL, Datastore
+from pyredis.types import Array, BulkString
+
+KEYSPACE = 100_000
+OPERATIONS = 300_000
+CACHED_SHARE = 4
+VALUE = b"x" * 100
+STORE_SIZES = (100_000, 1_000_000)
+
+
+def workload(seed=1):
+    rng = random.Random(seed)
+    # Cubing a uniform number skews the accesses, the hottest 10% of keys
+    # get close to half of them.
+    return [b"key:%d" % int(KEYSPACE * rng.random() ** 3) for _ in range(OPERATIONS)]
+
+
+def run_policy(policy, keys):
+    datastore = Datastore(thread_safe=False, maxmemory_policy=policy)
+    for i in range(KEYSPACE // CACHED_SHARE):
+        datastore.set_with_expiry(b"key:%d" % i, VALUE, 3600)
+    datastore.maxmemory = datastore.used_memory
+
+    get = [BulkString(b"GET"), None]
+    set_ = [BulkString(b"SET"), None, BulkString(VALUE), BulkString(b"EX"), BulkString(b"3600")]
+    hits = 0
+    start = perf_counter()
+    for key in keys:
+        get[1] = set_[1] = BulkString(key)
+        if handle_command(Array(get), datastore).data is not None:
+            hits += 1
+        else:
+            handle_command(Array(set_), datastore)
+    elapsed = perf_counter() - start
+    return hits / len(keys), elapsed / len(keys), datastore.evicted_keys
+
+
+def run_exact_lru(keys):
+    capacity = KEYSPACE // CACHED_SHARE
+    cache = OrderedDict()
+    hits = 0
+    for key in keys:
+        if key in cache:
+            cache.move_to_end(key)
+            hits += 1
+        else:
+            cache[key] = VALUE
+            if len(cache) > capacity:
+                cache.popitem(last=False)
+    return hits / len(keys)
+
+
+def set_cost(size, limit):
+    datastore = Datastore(thread_safe=False, maxmemory_policy=ALLKEYS_LRU)
+    for i in range(size):
+        datastore[b"key:%d" % i] = VALUE
+    if limit:
+        datastore.maxmemory = datastore.used_memory
+
+    command = [BulkString(b"SET"), None, BulkString(VALUE)]
+    writes = 100_000
+    start = perf_counter()
+    for i in range(size, size + writes):
+        command[1] = BulkString(b"key:%d" % i)
+        handle_command(Array(command), datastore)
+    return (perf_counter() - start) / writes
+
+
+def main():
+    keys = workload()
+    print(f"{'policy':<14}{'hit ratio':>10}{'us/op':>8}{'evicted':>10}")
+    print(f"{'exact LRU':<14}{run_exact_lru(keys):>10.3f}")
+    for policy in (ALLKEYS_LRU, ALLKEYS_LFU, VOLATILE_LRU, VOLATILE_TTL):
+        ratio, seconds, evicted = run_policy(policy, keys)
+        print(f"{policy:<14}{ratio:>10.3f}{seconds * 1e6:>8.2f}{evicted:>10,}")
+
+    print()
+    print(f"{'keys':>10}{'us per SET, no limit':>22}{'evicting':>10}")
+    for size in STORE_SIZES:
+        print(f"{size:>10,}{set_cost(size, False) * 1e6:>22.2f}{set_cost(size, True) * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
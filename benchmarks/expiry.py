@@ -0,0 +1,47 @@
+"""
+Cost of the active expiry cycle on a large keyspace where 1% of the keys
+have a TTL. Reports the duration of an idle tick, when nothing is due, and
+the ticks needed to expire every volatile key once they are all due.
+
+    python -m benchmarks.expiry [keys]
+"""
+import sys
+from time import perf_counter, sleep
+
+from pyredis.datastore import Datastore
+
+VOLATILE_PERCENT = 1
+TTL = 0.5
+
+
+def main(keys=1_000_000):
+    datastore = Datastore(thread_safe=False)
+    volatile = keys * VOLATILE_PERCENT // 100
+
+    for i in range(keys - volatile):
+        datastore[b"key:%d" % i] = b"value"
+    for i in range(volatile):
+        datastore.set_with_expiry(b"volatile:%d" % i, b"value", TTL)
+
+    start = perf_counter()
+    datastore.remove_expired_keys()
+    idle = perf_counter() - start
+    print(f"{keys:,} keys, {volatile:,} volatile")
+    print(f"idle tick:        {idle * 1000:>10.3f} ms")
+
+    sleep(TTL)
+    ticks = 0
+    removed = 0
+    longest = 0
+    start = perf_counter()
+    while removed < volatile:
+        tick_start = perf_counter()
+        removed += datastore.remove_expired_keys()
+        longest = max(longest, perf_counter() - tick_start)
+        ticks += 1
+    total = perf_counter() - start
+    print(f"expire all:       {total * 1000:>10.3f} ms in {ticks} ticks, longest tick {longest * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
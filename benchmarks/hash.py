@@ -0,0 +1,89 @@
+"""
+Hashes against one string key per field, for user sessions of 10 fields.
+Memory per field is the growth in resident set size of a fresh process
+storing 100k sessions each way, with the hashes in the compact encoding
+and converted to dicts. Throughput is HSET and HGET through handle_command
+on a hash of 10 fields and on one of 1000, which is converted, against SET
+and GET of a key per field.
+
+    python -m benchmarks.hash
+"""
+import multiprocessing
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.hash import HASH_MAX_LISTPACK_VALUE
+from pyredis.types import Array, BulkString
+
+SESSIONS = 100_000
+FIELDS = (b"user_id", b"name", b"email", b"role", b"created", b"last_seen", b"ip", b"agent", b"locale", b"csrf")
+OPERATIONS = 200_000
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def session(i):
+    return [(field, b"%s:%d" % (field, i)) for field in FIELDS]
+
+
+def fill(layout, results):
+    before = resident_bytes()
+    datastore = Datastore(thread_safe=False)
+    for i in range(SESSIONS):
+        if layout == "string keys":
+            datastore.mset((b"session:%d:%s" % (i, field), value) for field, value in session(i))
+        else:
+            datastore.hset(b"session:%d" % i, session(i))
+            if layout == "hash, dict":
+                long_field = b"x" * (HASH_MAX_LISTPACK_VALUE + 1)
+                datastore.hset(b"session:%d" % i, [(long_field, b"")])
+                datastore.hdel(b"session:%d" % i, [long_field])
+    fields = SESSIONS * len(FIELDS)
+    results.put(((resident_bytes() - before) / fields, datastore.used_memory / fields))
+
+
+def throughput(commands, datastore):
+    start = perf_counter()
+    for command in commands:
+        handle_command(command, datastore)
+    return len(commands) / (perf_counter() - start)
+
+
+def main():
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"bytes per field, {SESSIONS:,} sessions of {len(FIELDS)} fields")
+    print(f"{'':<14}{'resident':>10}{'estimated':>11}")
+    for layout in ("string keys", "hash, compact", "hash, dict"):
+        process = context.Process(target=fill, args=(layout, results))
+        process.start()
+        resident, estimated = results.get()
+        process.join()
+        print(f"{layout:<14}{resident:>10.0f}{estimated:>11.0f}")
+
+    print()
+    print(f"{'ops/sec':<26}{'write':>10}{'read':>10}")
+    for size in (len(FIELDS), 1000):
+        datastore = Datastore(thread_safe=False)
+        fields = [BulkString(b"field:%d" % (i % size)) for i in range(OPERATIONS)]
+        value = BulkString(b"value")
+        key = BulkString(b"h")
+        writes = [Array([BulkString(b"HSET"), key, field, value]) for field in fields]
+        reads = [Array([BulkString(b"HGET"), key, field]) for field in fields]
+        write_rate = throughput(writes, datastore)
+        encoding = datastore._data[b"h"].encoding
+        print(f"{f'hash of {size}, {encoding}':<26}{write_rate:>10,.0f}{throughput(reads, datastore):>10,.0f}")
+
+    datastore = Datastore(thread_safe=False)
+    keys = [BulkString(b"h:field:%d" % (i % len(FIELDS))) for i in range(OPERATIONS)]
+    writes = [Array([BulkString(b"SET"), key, BulkString(b"value")]) for key in keys]
+    reads = [Array([BulkString(b"GET"), key]) for key in keys]
+    print(f"{'string key per field':<26}{throughput(writes, datastore):>10,.0f}{throughput(reads, datastore):>10,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Request latency (p50/p99) and throughput of the asyncio server for each
+event loop backend that is installed, with TCP_NODELAY on and off. The
+server runs in its own process. Clients send one GET or SET at a time, for
+latency, then pipelines of 16, for throughput.
+
+    python -m benchmarks.latency
+"""
+import asyncio
+import multiprocessing
+import socket
+from time import perf_counter, perf_counter_ns, sleep
+
+from pyredis.asyncserver import (
+    LOOP_ASYNCIO, LOOP_UVLOOP, RedisServerProtocol, ServerOptions, create_server, loop_factory, run,
+)
+from pyredis.datastore import Datastore
+
+CONNECTIONS = 8
+DURATION = 2
+DEPTH = 16
+PORT = 6420
+
+GET = b"*2\r\n$3\r\nGET\r\n$3\r\nkey\r\n"
+SET = b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$5\r\nvalue\r\n"
+# GET replies with the value, SET with +OK.
+REPLY_SIZE = len(b"$5\r\nvalue\r\n")
+SET_REPLY_SIZE = len(b"+OK\r\n")
+
+
+def serve(backend, options):
+    async def main():
+        datastore = Datastore(thread_safe=False)
+        datastore[b"key"] = b"value"
+        server = await create_server(lambda: RedisServerProtocol(datastore), "127.0.0.1", PORT, options)
+        async with server:
+            await server.serve_forever()
+
+    run(main(), backend)
+
+
+async def connection(deadline, depth, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    batch = (GET + SET) * (depth // 2) if depth > 1 else GET
+    expected = (REPLY_SIZE + SET_REPLY_SIZE) * (depth // 2) if depth > 1 else REPLY_SIZE
+    done = 0
+
+    while perf_counter() < deadline:
+        start = perf_counter_ns()
+        writer.write(batch)
+        await reader.readexactly(expected)
+        latencies.append(perf_counter_ns() - start)
+        done += depth
+
+    writer.close()
+    return done
+
+
+async def load(depth):
+    latencies = []
+    deadline = perf_counter() + DURATION
+    counts = await asyncio.gather(*(connection(deadline, depth, latencies) for _ in range(CONNECTIONS)))
+    latencies.sort()
+    return sum(counts) / DURATION, latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100]
+
+
+def wait_for_port():
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT)).close()
+            return
+        except OSError:
+            sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def installed_backends():
+    backends = [LOOP_ASYNCIO]
+    try:
+        loop_factory(LOOP_UVLOOP)
+        backends.append(LOOP_UVLOOP)
+    except ImportError:
+        pass
+    return backends
+
+
+def main():
+    context = multiprocessing.get_context("spawn")
+    print(f"{'backend':<10}{'nodelay':<9}{'p50 us':>9}{'p99 us':>9}{'req/s':>10}{'pipelined/s':>13}")
+
+    for backend in installed_backends():
+        for tcp_nodelay in (True, False):
+            server = context.Process(target=serve, args=(backend, ServerOptions(tcp_nodelay=tcp_nodelay)), daemon=True)
+            server.start()
+            try:
+                wait_for_port()
+                rate, p50, p99 = asyncio.run(load(1))
+                pipelined, _, _ = asyncio.run(load(DEPTH))
+            finally:
+                server.terminate()
+                server.join()
+            print(
+                f"{backend:<10}{str(tcp_nodelay):<9}{p50 / 1000:>9.0f}{p99 / 1000:>9.0f}"
+                f"{rate:>10,.0f}{pipelined:>13,.0f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+List operations on a 1M element list, comparing the QuickList engine with a
+plain collections.deque.
+
+    python -m benchmarks.lists
+"""
+from collections import deque
+from itertools import islice
+from timeit import timeit
+
+from pyredis.quicklist import QuickList
+
+SIZE = 1_000_000
+
+
+def report(name, quicklist_seconds, deque_seconds, number):
+    print(f"{name:<28}{quicklist_seconds / number * 10 ** 9:>14.0f}{deque_seconds / number * 10 ** 9:>14.0f}")
+
+
+def main():
+    quicklist = QuickList(range(SIZE))
+    items = deque(range(SIZE))
+    print(f"{'ns/op on 1M elements':<28}{'quicklist':>14}{'deque':>14}")
+
+    number = 200_000
+    report(
+        "push + pop both ends",
+        timeit(lambda: (quicklist.appendleft(0), quicklist.append(0), quicklist.popleft(), quicklist.pop()),
+               number=number),
+        timeit(lambda: (items.appendleft(0), items.append(0), items.popleft(), items.pop()), number=number),
+        number,
+    )
+
+    number = 100_000
+    report("index middle", timeit(lambda: quicklist[SIZE // 2], number=number),
+           timeit(lambda: items[SIZE // 2], number=number), number)
+    report("index -10", timeit(lambda: quicklist[-10], number=number),
+           timeit(lambda: items[-10], number=number), number)
+
+    number = 1_000
+    report("range 100 from head", timeit(lambda: quicklist.range(0, 99), number=number),
+           timeit(lambda: list(islice(items, 0, 100)), number=number), number)
+    report("range 100 from middle", timeit(lambda: quicklist.range(SIZE // 2, SIZE // 2 + 99), number=number),
+           timeit(lambda: list(islice(items, SIZE // 2, SIZE // 2 + 100)), number=number), number)
+    report("range 100 from tail", timeit(lambda: quicklist.range(-100, -1), number=number),
+           timeit(lambda: list(islice(items, SIZE - 100, SIZE)), number=number), number)
+
+    number = 10
+    report("range all", timeit(lambda: quicklist.range(0, -1), number=number),
+           timeit(lambda: list(items), number=number), number)
+
+
+if __name__ == '__main__':
+    main()
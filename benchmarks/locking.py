@@ -0,0 +1,37 @@
+"""
+Per-operation cost of Datastore locking: the default thread safe store
+against the lock free store used by the asyncio server.
+
+    python -m benchmarks.locking
+"""
+from timeit import repeat
+
+from pyredis.datastore import Datastore
+
+ITERATIONS = 500_000
+
+
+def bench(statement, datastore):
+    elapsed = min(repeat(statement, globals={"ds": datastore}, number=ITERATIONS, repeat=5))
+    return elapsed / ITERATIONS * 10 ** 9
+
+
+def main():
+    statements = {
+        "get": "ds[b'key']",
+        "set": "ds[b'key'] = b'value'",
+        "incr": "ds.incr(b'counter')",
+        "exists": "ds.exists((b'key', b'other'))",
+    }
+    locked = Datastore({b"key": b"value"})
+    unlocked = Datastore({b"key": b"value"}, thread_safe=False)
+
+    print(f"{'op':<8}{'locked ns':>12}{'unlocked ns':>14}{'saved':>8}")
+    for name, statement in statements.items():
+        with_lock = bench(statement, locked)
+        without_lock = bench(statement, unlocked)
+        print(f"{name:<8}{with_lock:>12.0f}{without_lock:>14.0f}{1 - without_lock / with_lock:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
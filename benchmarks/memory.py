@@ -0,0 +1,73 @@
+"""
+Memory per key of the store at 1M and 10M keys, for counters, short
+repeated strings and 100 byte strings, against the layout it replaced,
+where every value was wrapped in a DataEntry dataclass holding the value
+and expiry. Each run is a fresh process and memory is its growth in
+resident set size, so it includes the allocator's overheads.
+
+    python -m benchmarks.memory [keys ...]
+"""
+import multiprocessing
+import sys
+from dataclasses import dataclass
+from typing import Any
+
+from pyredis.datastore import Datastore
+
+KEYS = (1_000_000, 10_000_000)
+
+
+@dataclass
+class DataEntry:
+    """The entry every key used to be stored as."""
+    value: Any
+    expiry: int = 0
+
+
+VALUES = {
+    "counter": lambda i: b"%d" % (i * 7919 % 1_000_000),
+    "short": lambda i: (b"active", b"pending", b"closed")[i % 3],
+    "100 bytes": lambda i: b"%100d" % i,
+}
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def fill(layout, kind, keys, results):
+    make_value = VALUES[kind]
+    before = resident_bytes()
+
+    if layout == "compact":
+        datastore = Datastore(thread_safe=False)
+        for i in range(keys):
+            datastore[b"key:%d" % i] = make_value(i)
+    else:
+        data = {}
+        for i in range(keys):
+            data[b"key:%d" % i] = DataEntry(make_value(i))
+
+    results.put((resident_bytes() - before) / keys)
+
+
+def main(*keys):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print("bytes per key")
+    print(f"{'keys':>12}  {'values':<10}{'DataEntry':>11}{'compact':>9}")
+
+    for count in keys or KEYS:
+        for kind in VALUES:
+            usage = {}
+            for layout in ("DataEntry", "compact"):
+                process = context.Process(target=fill, args=(layout, kind, count, results))
+                process.start()
+                usage[layout] = results.get()
+                process.join()
+            print(f"{count:>12,}  {kind:<10}{usage['DataEntry']:>11.0f}{usage['compact']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
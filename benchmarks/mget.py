@@ -0,0 +1,69 @@
+"""
+Keys read or written per second through the asyncio server in batches of
+100: one MGET or MSET of 100 keys against 100 pipelined GETs or SETs, and
+against 100 GETs sent one round trip at a time.
+
+    python -m benchmarks.mget
+"""
+import asyncio
+from time import perf_counter
+
+from pyredis.asyncserver import RedisServerProtocol
+from pyredis.datastore import Datastore
+from pyredis.persistence import encode_command
+
+BATCH = 100
+TOTAL_KEYS = 200_000
+VALUE = b"x" * 32
+
+KEYS = [b"key:%d" % i for i in range(BATCH)]
+
+
+async def run(port, requests, expected, round_trips):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    batch = b"".join(requests)
+    rounds = TOTAL_KEYS // BATCH
+
+    start = perf_counter()
+    for _ in range(rounds):
+        if round_trips:
+            for request, size in zip(requests, expected):
+                writer.write(request)
+                await reader.readexactly(size)
+        else:
+            writer.write(batch)
+            await reader.readexactly(sum(expected))
+    elapsed = perf_counter() - start
+
+    writer.close()
+    await writer.wait_closed()
+    return rounds * BATCH / elapsed
+
+
+async def main():
+    datastore = Datastore(thread_safe=False)
+    datastore.mset((key, VALUE) for key in KEYS)
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: RedisServerProtocol(datastore, None), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    get_reply = len(b"$%d\r\n%b\r\n" % (len(VALUE), VALUE))
+    mget_reply = len(b"*%d\r\n" % BATCH) + BATCH * get_reply
+    cases = [
+        ("MGET", [encode_command([b"MGET", *KEYS])], [mget_reply], False),
+        ("pipelined GET", [encode_command([b"GET", key]) for key in KEYS], [get_reply] * BATCH, False),
+        ("GET round trips", [encode_command([b"GET", key]) for key in KEYS], [get_reply] * BATCH, True),
+        ("MSET", [encode_command([b"MSET", *(arg for key in KEYS for arg in (key, VALUE))])], [5], False),
+        ("pipelined SET", [encode_command([b"SET", key, VALUE]) for key in KEYS], [5] * BATCH, False),
+    ]
+
+    print(f"{BATCH} keys per batch")
+    print(f"{'':<18}{'keys/sec':>12}")
+    async with server:
+        for name, requests, expected, round_trips in cases:
+            rate = await run(port, requests, expected, round_trips)
+            print(f"{name:<18}{rate:>12,.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""
+Microbenchmark for the RESP parser on large MSET style arrays and
+multi-megabyte bulk strings, plus the incremental decoder on a large value
+arriving in small chunks.
+
+    python -m benchmarks.parser
+"""
+from time import perf_counter
+
+from pyredis.protocol import RespDecoder, parse_frame
+
+
+def bulk_string(data):
+    return b"$%d\r\n%b\r\n" % (len(data), data)
+
+
+def mset_command(pairs):
+    payload = bytearray(b"*%d\r\n" % (pairs * 2 + 1))
+    payload.extend(bulk_string(b"MSET"))
+    for i in range(pairs):
+        payload.extend(bulk_string(b"key:%d" % i))
+        payload.extend(bulk_string(b"value:%d" % i))
+    return payload
+
+
+def bench(name, payload, repeat):
+    buffer = bytearray(payload)
+    start = perf_counter()
+    for _ in range(repeat):
+        frame, end = parse_frame(buffer)
+        assert end == len(buffer)
+    elapsed = (perf_counter() - start) / repeat
+    print(f"{name:<28} {elapsed * 1000:>10.3f} ms/parse {len(buffer) / elapsed / 2 ** 20:>10.1f} MB/s")
+
+
+def bench_chunked(name, payload, chunk_size):
+    decoder = RespDecoder()
+    start = perf_counter()
+    frames = []
+    with memoryview(payload) as view:
+        for i in range(0, len(view), chunk_size):
+            frames.extend(decoder.feed(view[i:i + chunk_size]))
+    elapsed = perf_counter() - start
+    assert len(frames) == 1
+    print(f"{name:<28} {elapsed * 1000:>10.3f} ms total  {len(payload) / elapsed / 2 ** 20:>10.1f} MB/s")
+
+
+def main():
+    for pairs in (1_000, 10_000, 100_000):
+        bench(f"MSET {pairs} pairs", mset_command(pairs), 5)
+    for size in (1, 16, 64):
+        bench(f"bulk string {size} MB", bulk_string(b"x" * size * 2 ** 20), 5)
+    bench_chunked("50 MB in 2 KB reads", bulk_string(b"x" * 50 * 2 ** 20), 2048)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure SET commands/sec served by the asyncio server at different pipeline
+depths, without an AOF and with AOF logging under each appendfsync policy.
+
+    python -m benchmarks.pipeline [appendfsync ...]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from pyredis.asyncserver import RedisServerProtocol
+from pyredis.datastore import Datastore
+from pyredis.persistence import APPENDFSYNC_POLICIES, AppendOnlyPersister
+
+DEPTHS = (1, 16, 128, 1024)
+TOTAL_COMMANDS = 100_000
+
+SET_COMMAND = b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$5\r\nvalue\r\n"
+SET_REPLY = b"+OK\r\n"
+
+
+async def run_depth(port, depth):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    batch = SET_COMMAND * depth
+    expected = len(SET_REPLY) * depth
+    rounds = max(1, TOTAL_COMMANDS // depth)
+
+    start = perf_counter()
+    for _ in range(rounds):
+        writer.write(batch)
+        await reader.readexactly(expected)
+    elapsed = perf_counter() - start
+
+    writer.close()
+    await writer.wait_closed()
+    return rounds * depth / elapsed
+
+
+async def serve(persister):
+    datastore = Datastore(thread_safe=False)
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: RedisServerProtocol(datastore, persister), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        return [await run_depth(port, depth) for depth in DEPTHS]
+
+
+async def main(policies):
+    print(f"{'appendfsync':<12}" + "".join(f"{f'depth {depth}':>14}" for depth in DEPTHS))
+    baseline = await serve(None)
+    print(f"{'(no aof)':<12}" + "".join(f"{rate:>14,.0f}" for rate in baseline))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for policy in policies:
+            persister = AppendOnlyPersister(os.path.join(directory, f"{policy}.aof"), policy)
+            rates = await serve(persister)
+            persister.close()
+            print(f"{policy:<12}" + "".join(
+                f"{rate:>9,.0f} {rate / base - 1:>+4.0%}" for rate, base in zip(rates, baseline)
+            ))
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:] or APPENDFSYNC_POLICIES))
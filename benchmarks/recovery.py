@@ -0,0 +1,58 @@
+"""
+Recovery time as the write history grows: replaying the full AOF against
+loading the same data after a rewrite into a snapshot preamble followed by
+an AOF tail. The keyspace is fixed, so the history grows while the data
+doesn't.
+
+    python -m benchmarks.recovery [keys]
+"""
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from pyredis.datastore import Datastore
+from pyredis.persistence import AppendOnlyPersister, encode_command, load_aof
+
+
+def write_history(filename, keys, writes):
+    with open(filename, "wb") as f:
+        buffer = bytearray()
+        for i in range(writes):
+            buffer += encode_command([b"SET", b"key:%d" % (i % keys), b"value:%d" % i])
+            if len(buffer) > 1 << 20:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
+
+
+def timed_load(filename):
+    datastore = Datastore(thread_safe=False)
+    start = perf_counter()
+    assert load_aof(filename, datastore)
+    return datastore, perf_counter() - start
+
+
+def main(keys=100_000):
+    print(f"{'writes':>12}{'AOF MB':>10}{'replay s':>10}{'hybrid MB':>12}{'load s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "recovery.aof")
+        for multiple in (1, 2, 5, 10):
+            writes = keys * multiple
+            write_history(filename, keys, writes)
+            datastore, replayed = timed_load(filename)
+            size = os.path.getsize(filename)
+
+            persister = AppendOnlyPersister(filename, "no")
+            persister.rewrite(datastore)
+            persister.close()
+            _, loaded = timed_load(filename)
+
+            print(
+                f"{writes:>12,}{size / 2 ** 20:>10.1f}{replayed:>10.2f}"
+                f"{os.path.getsize(filename) / 2 ** 20:>12.1f}{loaded:>10.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,114 @@
+"""
+The selectors engine in pyredis.server, running commands inline and on a
+worker pool, against the thread-per-connection engine it replaced, with
+100, 1,000 and 10,000 concurrent clients. The server runs in its own
+process. Every client keeps one GET in flight, and the time to connect all
+of them is reported as well.
+
+    python -m benchmarks.server
+"""
+import multiprocessing
+import selectors
+import socket
+from time import perf_counter, perf_counter_ns, sleep
+
+from pyredis.datastore import Datastore
+from pyredis.server import Server, ThreadedServer
+
+CONNECTIONS = (100, 1_000, 10_000)
+DURATION = 3
+PORT = 6430
+
+GET = b"*2\r\n$3\r\nGET\r\n$3\r\nkey\r\n"
+REPLY_SIZE = len(b"$5\r\nvalue\r\n")
+
+
+def serve(engine):
+    if engine == "threaded":
+        server = ThreadedServer(PORT)
+        server._datastore[b"key"] = b"value"
+    else:
+        datastore = Datastore()
+        datastore[b"key"] = b"value"
+        server = Server(PORT, workers=0 if engine == "selectors" else 4, max_connections=20_000, datastore=datastore)
+    server.run()
+
+
+def load(connections):
+    start = perf_counter()
+    sockets = [socket.create_connection(("127.0.0.1", PORT)) for _ in range(connections)]
+    connect_time = perf_counter() - start
+
+    selector = selectors.DefaultSelector()
+    # Per client: when its request was sent and how much of the reply is in.
+    states = {}
+    for sock in sockets:
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        states[sock] = [perf_counter_ns(), 0]
+        selector.register(sock, selectors.EVENT_READ)
+        sock.send(GET)
+
+    latencies = []
+    deadline = perf_counter() + DURATION
+    while perf_counter() < deadline:
+        for key, _ in selector.select(0.1):
+            sock = key.fileobj
+            state = states[sock]
+            state[1] += len(sock.recv(4096))
+            if state[1] == REPLY_SIZE:
+                now = perf_counter_ns()
+                latencies.append(now - state[0])
+                state[0], state[1] = now, 0
+                sock.send(GET)
+
+    # Collect the replies still in flight before closing, so no client is
+    # reset with a reply unread.
+    waiting = sum(1 for state in states.values() if state[1] < REPLY_SIZE)
+    while waiting:
+        for key, _ in selector.select():
+            state = states[key.fileobj]
+            state[1] += len(key.fileobj.recv(4096))
+            if state[1] == REPLY_SIZE:
+                selector.unregister(key.fileobj)
+                waiting -= 1
+
+    for sock in sockets:
+        sock.close()
+    latencies.sort()
+    median, p99 = latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100]
+    return connect_time, len(latencies) / DURATION, median, p99
+
+
+def wait_for_port():
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT)).close()
+            return
+        except OSError:
+            sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    context = multiprocessing.get_context("spawn")
+    print(f"{'engine':<12}{'clients':>8}{'connect s':>11}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+
+    for connections in CONNECTIONS:
+        for engine in ("threaded", "selectors", "pool"):
+            server = context.Process(target=serve, args=(engine,), daemon=True)
+            server.start()
+            try:
+                wait_for_port()
+                connect_time, rate, p50, p99 = load(connections)
+            finally:
+                server.terminate()
+                server.join()
+            print(
+                f"{engine:<12}{connections:>8,}{connect_time:>11.2f}{rate:>10,.0f}"
+                f"{p50 / 1e6:>9.2f}{p99 / 1e6:>9.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+A leaderboard sorted set of 5M members: the memory per member, and the time
+per ZINCRBY, ZRANK, top 10 ZRANGE and ZRANGEBYSCORE page, against answering
+the same top 10 by sorting the scores on every read. Then the memory of a
+set of 512 small integers in the intset encoding against the same set once
+converted.
+
+    python -m benchmarks.sets [members]
+"""
+import random
+import sys
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.set import SET_MAX_INTSET_ENTRIES
+from pyredis.types import Array, BulkString
+
+MEMBERS = 5_000_000
+BATCH = 10_000
+OPERATIONS = 20_000
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def command(*args):
+    return Array([BulkString(arg) for arg in args])
+
+
+def per_op(commands, datastore):
+    start = perf_counter()
+    for args in commands:
+        handle_command(args, datastore)
+    return (perf_counter() - start) / len(commands)
+
+
+def leaderboard(members):
+    rng = random.Random(1)
+    datastore = Datastore(thread_safe=False)
+    before = resident_bytes()
+    start = perf_counter()
+    for i in range(0, members, BATCH):
+        datastore.zadd(b"board", [(b"player:%d" % j, float(rng.randrange(1_000_000))) for j in range(i, i + BATCH)])
+    load = perf_counter() - start
+    print(f"{members:,} members loaded in {load:.1f}s, {(resident_bytes() - before) / members:.0f} bytes per member")
+
+    players = [b"player:%d" % rng.randrange(members) for _ in range(OPERATIONS)]
+    cases = [
+        ("ZINCRBY", [command(b"ZINCRBY", b"board", b"%d" % rng.randrange(100), player) for player in players]),
+        ("ZRANK", [command(b"ZRANK", b"board", player) for player in players]),
+        ("ZRANGE top 10", [command(b"ZRANGE", b"board", b"0", b"9", b"REV", b"WITHSCORES")] * OPERATIONS),
+        ("ZRANGEBYSCORE page", [
+            command(b"ZRANGEBYSCORE", b"board", b"%d" % rng.randrange(1_000_000), b"+inf", b"LIMIT", b"0", b"10")
+            for _ in range(OPERATIONS)
+        ]),
+    ]
+    print(f"{'':<20}{'us/op':>10}")
+    for name, commands in cases:
+        print(f"{name:<20}{per_op(commands, datastore) * 1e6:>10.1f}")
+
+    scores = dict(datastore._data[b"board"].items())
+    start = perf_counter()
+    sorted(scores.items(), key=lambda item: item[1], reverse=True)[:10]
+    print(f"{'top 10 by sorting':<20}{(perf_counter() - start) * 1e6:>10.0f}")
+
+
+def intsets():
+    members = [b"%d" % i for i in range(SET_MAX_INTSET_ENTRIES)]
+    datastore = Datastore(thread_safe=False)
+    datastore.sadd(b"intset", members)
+    datastore.sadd(b"converted", members + [b"x"])
+    datastore.srem(b"converted", [b"x"])
+    print()
+    print(f"bytes per member of a set of {SET_MAX_INTSET_ENTRIES} integers")
+    for key in (b"intset", b"converted"):
+        print(f"{key.decode():<20}{datastore.memory_usage(key) / SET_MAX_INTSET_ENTRIES:>10.1f}")
+
+
+def main(members=MEMBERS):
+    leaderboard(members)
+    intsets()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
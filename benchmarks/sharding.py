@@ -0,0 +1,112 @@
+"""
+Throughput of the sharded server from 1 to N worker processes on a 50/50
+GET/SET mix over random keys, so with N workers about (N - 1) / N of the
+commands a worker receives are forwarded to another shard. Load comes from
+one client process per worker, each with a few pipelining connections.
+
+    python -m benchmarks.sharding [max workers]
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+from pyredis.sharding import run_shard
+
+DURATION = 3
+CONNECTIONS = 4
+DEPTH = 16
+KEYS = 100_000
+
+
+def command(*args):
+    return b"*%d\r\n" % len(args) + b"".join(b"$%d\r\n%b\r\n" % (len(arg), arg) for arg in args)
+
+
+async def client_connection(port, deadline, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    done = 0
+
+    while perf_counter() < deadline:
+        batch = bytearray()
+        for _ in range(DEPTH):
+            key = b"key:%d" % rng.randrange(KEYS)
+            batch += command(b"GET", key) if rng.random() < 0.5 else command(b"SET", key, b"value")
+        writer.write(batch)
+
+        # Every reply here is a single line: +OK, $-1 or $5 followed by the value.
+        replies = 0
+        while replies < DEPTH:
+            line = await reader.readline()
+            if line.startswith(b"$") and line != b"$-1\r\n":
+                await reader.readline()
+            replies += 1
+        done += DEPTH
+
+    writer.close()
+    return done
+
+
+def run_client(port, seed, results):
+    async def run():
+        deadline = perf_counter() + DURATION
+        counts = await asyncio.gather(*(client_connection(port, deadline, seed * 100 + i) for i in range(CONNECTIONS)))
+        return sum(counts)
+
+    results.put(asyncio.run(run()))
+
+
+def wait_for_port(port):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def bench(workers, port, directory):
+    context = multiprocessing.get_context("spawn")
+    servers = [
+        context.Process(target=run_shard, args=(shard, workers, port, "no", directory), daemon=True)
+        for shard in range(workers)
+    ]
+    for server in servers:
+        server.start()
+
+    try:
+        wait_for_port(port)
+        results = context.Queue()
+        clients = [context.Process(target=run_client, args=(port, i, results)) for i in range(workers)]
+        for client in clients:
+            client.start()
+        total = sum(results.get() for _ in clients)
+        for client in clients:
+            client.join()
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+    return total / DURATION
+
+
+def main(max_workers=os.cpu_count()):
+    print(f"{os.cpu_count()} CPUs")
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        # Shards write their AOFs to the working directory.
+        os.chdir(directory)
+        for workers in range(1, max_workers + 1):
+            rate = bench(workers, 6400 + workers, directory)
+            baseline = baseline or rate
+            print(f"{workers:>3} workers {rate:>12,.0f} commands/sec {rate / baseline:>6.2f}x")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
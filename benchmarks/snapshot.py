@@ -0,0 +1,55 @@
+"""
+Snapshot against AOF: time to write and load the same store, and the size of
+each file, for a mix of plain strings, integer strings, lists and keys with
+a TTL.
+
+    python -m benchmarks.snapshot [keys]
+"""
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from pyredis.datastore import Datastore
+from pyredis.persistence import load_aof, write_rewrite
+from pyredis.snapshot import load_snapshot, write_snapshot
+
+
+def populate(keys):
+    datastore = Datastore(thread_safe=False)
+    for i in range(keys):
+        match i % 4:
+            case 0:
+                datastore[b"key:%d" % i] = b"value:%d" % i
+            case 1:
+                datastore[b"counter:%d" % i] = b"%d" % (i * 7919)
+            case 2:
+                datastore.append(b"list:%d" % i, *(b"item:%d" % j for j in range(10)))
+            case 3:
+                datastore.set_with_expiry(b"ttl:%d" % i, b"value", 3600)
+    return datastore
+
+
+def bench(name, write, load, datastore, filename):
+    start = perf_counter()
+    write(datastore, filename)
+    written = perf_counter() - start
+
+    start = perf_counter()
+    load(filename, Datastore(thread_safe=False))
+    loaded = perf_counter() - start
+
+    size = os.path.getsize(filename)
+    print(f"{name:<10}{size / 2 ** 20:>10.1f} MB{written:>10.2f} s write{loaded:>10.2f} s load")
+
+
+def main(keys=1_000_000):
+    datastore = populate(keys)
+    print(f"{keys:,} keys")
+    with tempfile.TemporaryDirectory() as directory:
+        bench("AOF", write_rewrite, load_aof, datastore, os.path.join(directory, "bench.aof"))
+        bench("snapshot", write_snapshot, load_snapshot, datastore, os.path.join(directory, "bench.rdb"))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,71 @@
+"""
+Startup time: loading an AOF with load_aof compared with replaying it the way
+restore_from_file used to, 4 KB reads through parse_frame and handle_command.
+
+    python -m benchmarks.startup [commands]
+"""
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.persistence import encode_command, load_aof
+from pyredis.protocol import parse_frame
+
+
+def write_aof(filename, commands):
+    with open(filename, "wb") as f:
+        buffer = bytearray()
+        for i in range(commands):
+            match i % 4:
+                case 0:
+                    buffer += encode_command([b"SET", b"key:%d" % i, b"value:%d" % i])
+                case 1:
+                    buffer += encode_command([b"INCR", b"counter:%d" % (i % 1000)])
+                case 2:
+                    buffer += encode_command([b"RPUSH", b"list:%d" % (i % 1000), b"item:%d" % i])
+                case 3:
+                    buffer += encode_command([b"SET", b"ttl:%d" % i, b"value", b"EX", b"3600"])
+            if len(buffer) > 1 << 20:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
+
+
+def replay_frames(filename, datastore):
+    buffer = bytearray()
+    with open(filename, "rb") as f:
+        while data := f.read(4096):
+            buffer.extend(data)
+            offset = 0
+            while True:
+                frame, end = parse_frame(buffer, offset)
+                if frame is None:
+                    break
+                offset = end
+                handle_command(frame, datastore)
+            del buffer[:offset]
+
+
+def bench(name, load, filename, size):
+    datastore = Datastore(thread_safe=False)
+    start = perf_counter()
+    load(filename, datastore)
+    elapsed = perf_counter() - start
+    print(f"{name:<16}{elapsed:>10.2f} s{size / 2 ** 20 / elapsed:>10.1f} MB/s")
+
+
+def main(commands=1_000_000):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "startup.aof")
+        write_aof(filename, commands)
+        size = os.path.getsize(filename)
+        print(f"{commands:,} commands, {size / 2 ** 20:.1f} MB")
+        bench("handle_command", replay_frames, filename, size)
+        bench("load_aof", load_aof, filename, size)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,13 +1,18 @@
 import asyncio
 import threading
-from time import sleep
+from time import perf_counter, sleep
 
 import typer
 
-from pyredis.asyncserver import RedisServerProtocol
-from pyredis.datastore import Datastore
-from pyredis.persistence import AppendOnlyPersister, restore_from_file
+from pyredis.asyncserver import (
+    LOOP_AUTO, LOOP_BACKENDS, READ_SIZE, RedisServerProtocol, ServerOptions, check_aof_rewrite_task,
+    check_expiry_task, create_server, run,
+)
+from pyredis.datastore import MAXMEMORY_POLICIES, NOEVICTION, Datastore
+from pyredis.persistence import APPENDFSYNC_EVERYSEC, APPENDFSYNC_POLICIES, AppendOnlyPersister, load_data
 from pyredis.server import Server
+from pyredis.sharding import run_workers
+from pyredis.stats import STATS
 
 REDIS_DEFAULT_PORT = 6379
 
@@ -34,13 +39,23 @@ def check_expiry(datastore):
         sleep(0.1)
 
 
-async def check_expiry_task(datastore):
-    while True:
-        datastore.remove_expired_keys()
-        await asyncio.sleep(0.1)
+def load_progress_reporter():
+    start = perf_counter()
+
+    def report(loaded, total):
+        elapsed = max(perf_counter() - start, 1e-9)
+        print(
+            f"Loading AOF: {loaded / 2 ** 20:.1f} of {total / 2 ** 20:.1f} MB "
+            f"({loaded / total:.0%}), {loaded / 2 ** 20 / elapsed:.1f} MB/s"
+        )
 
+    return report
 
-async def main(port=None):
+
+async def main(
+    port=None, appendfsync=APPENDFSYNC_EVERYSEC, options=ServerOptions(), stats=True, maxmemory=0,
+    maxmemory_policy=NOEVICTION,
+):
 # def main(port=None):
     if port is None:
         port = REDIS_DEFAULT_PORT
@@ -49,22 +64,39 @@ async def main(port=None):
 
     print(f"Starting PyRedis on port: {port}")
 
-    datastore = Datastore()
-    if not restore_from_file('ccdb.aof', datastore):
+    # Command counters, latency histograms and the latency monitor.
+    STATS.enabled = stats
+
+    # Every command runs on the event loop thread, so the store needs no locks.
+    datastore = Datastore(thread_safe=False)
+    if not load_data(datastore, 'ccdb.aof', 'ccdb.rdb', load_progress_reporter()):
         return -1
+    # Set once loaded, so nothing is evicted while loading.
+    datastore.maxmemory = maxmemory
+    datastore.maxmemory_policy = maxmemory_policy
+    # Keys that expire from now on are logged as DELs.
+    datastore.track_expired()
 
-    persister = AppendOnlyPersister('ccdb.aof')
+    persister = AppendOnlyPersister('ccdb.aof', appendfsync, snapshot_filename='ccdb.rdb', datastore=datastore)
 
     loop = asyncio.get_running_loop()
 
-    task = loop.create_task(check_expiry_task(datastore))
+    # Held until the server stops, as the loop only keeps weak references to tasks.
+    tasks = [
+        loop.create_task(check_expiry_task(datastore, persister)),
+        loop.create_task(check_aof_rewrite_task(datastore, persister)),
+    ]
 
-    server = await loop.create_server(
-        lambda: RedisServerProtocol(datastore, persister), "127.0.0.1", port
+    server = await create_server(
+        lambda: RedisServerProtocol(datastore, persister), "127.0.0.1", port, options
     )
 
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
 
     # expiration_monitor = threading.Thread(target=check_expiry, args=(datastore,))
     # expiration_monitor.start()
@@ -73,6 +105,54 @@ async def main(port=None):
     # server.run()
 
 
+def _check_choice(name, value, choices):
+    if value not in choices:
+        raise typer.BadParameter(f'must be one of {", ".join(choices)}', param_hint=f"'--{name}'")
+
+
+def serve(
+    port: int = REDIS_DEFAULT_PORT,
+    appendfsync: str = APPENDFSYNC_EVERYSEC,
+    workers: int = 1,
+    loop_backend: str = LOOP_AUTO,
+    stats: bool = True,
+    maxmemory: int = 0,
+    maxmemory_policy: str = NOEVICTION,
+    tcp_nodelay: bool = True,
+    backlog: int = 511,
+    recv_buffer_size: int = 0,
+    send_buffer_size: int = 0,
+    read_size: int = READ_SIZE,
+):
+    """
+    Start PyRedis. With one worker a single process serves every client
+    from an event loop of loop_backend, with more there is a process per
+    shard, each with its share of maxmemory. The socket options are those
+    of ServerOptions, buffer sizes of 0 leave the operating system's.
+    """
+    _check_choice('appendfsync', appendfsync, APPENDFSYNC_POLICIES)
+    _check_choice('loop-backend', loop_backend, LOOP_BACKENDS)
+    _check_choice('maxmemory-policy', maxmemory_policy, MAXMEMORY_POLICIES)
+    if read_size < 1:
+        raise typer.BadParameter('must be at least 1', param_hint="'--read-size'")
+
+    options = ServerOptions(
+        tcp_nodelay=tcp_nodelay,
+        backlog=backlog,
+        recv_buffer_size=recv_buffer_size,
+        send_buffer_size=send_buffer_size,
+        read_size=read_size,
+    )
+
+    if workers > 1:
+        print(f"Starting PyRedis on port: {port}")
+        if run_workers(port, appendfsync, workers, options, loop_backend, stats, maxmemory, maxmemory_policy) == -1:
+            raise typer.Exit(1)
+        return
+
+    if run(main(port, appendfsync, options, stats, maxmemory, maxmemory_policy), loop_backend) == -1:
+        raise typer.Exit(1)
+
+
 if __name__ == '__main__':
-    typer.run(asyncio.run(main()))
-    # typer.run(main)
+    typer.run(serve)
@@ -1,28 +1,304 @@
 import asyncio
+import socket
+from dataclasses import dataclass
+from itertools import count
+from time import monotonic, perf_counter_ns
 
-from pyredis.commands import handle_command
+from pyredis.commands import handle_command, internal_error, log_expired_keys
 from pyredis.datastore import Datastore
-from pyredis.protocol import extract_frame_from_buffer, encode_message
+from pyredis.protocol import ProtocolError, RespDecoder, encode_message
+from pyredis.stats import STATS, LatencyTimer
+from pyredis.types import Array, Error
 
+LOOP_AUTO = 'auto'
+LOOP_ASYNCIO = 'asyncio'
+LOOP_UVLOOP = 'uvloop'
+LOOP_BACKENDS = (LOOP_AUTO, LOOP_ASYNCIO, LOOP_UVLOOP)
 
-class RedisServerProtocol(asyncio.Protocol):
-    def __init__(self, datastore):
+READ_SIZE = 64 * 1024
+
+EXPIRY_INTERVAL = 0.1
+
+_client_ids = count(1)
+
+_PROTOCOL_ERROR = Error("ERR Protocol error").resp_encode()
+
+
+def loop_factory(backend=LOOP_AUTO):
+    """
+    Return the function that creates event loops for backend: uvloop's if
+    it is requested, or for 'auto' if it is installed, else asyncio's.
+    """
+    if backend not in LOOP_BACKENDS:
+        raise ValueError(f'loop backend must be one of {", ".join(LOOP_BACKENDS)}')
+
+    if backend != LOOP_ASYNCIO:
+        try:
+            import uvloop
+        except ImportError:
+            if backend == LOOP_UVLOOP:
+                raise
+        else:
+            return uvloop.new_event_loop
+    return asyncio.new_event_loop
+
+
+def _command_name(frame):
+    """The name of the command in frame as CLIENT LIST shows it, 'NULL' for a frame that is not a command."""
+    if isinstance(frame, Array) and frame.data:
+        name = getattr(frame.data[0], 'data', None)
+        if isinstance(name, bytes):
+            return name.decode(errors='replace').lower()
+    return 'NULL'
+
+
+def run(main, backend=LOOP_AUTO):
+    """Run the coroutine main to completion, as asyncio.run does, on a loop from backend."""
+    with asyncio.Runner(loop_factory=loop_factory(backend)) as runner:
+        return runner.run(main)
+
+
+@dataclass(frozen=True)
+class OutputBufferLimit:
+    """
+    How much of its replies a client may leave unread, as with Redis's
+    client-output-buffer-limit. A client is disconnected once more than
+    hard_limit bytes are waiting to be sent to it, or more than soft_limit
+    bytes for soft_seconds. A limit of 0 is no limit.
+    """
+    hard_limit: int = 256 * 2 ** 20
+    soft_limit: int = 64 * 2 ** 20
+    soft_seconds: float = 60
+
+
+@dataclass(frozen=True)
+class ServerOptions:
+    """
+    Socket settings for the server. Buffer sizes of 0 leave the operating
+    system defaults. read_size is the most read from a connection at once.
+    """
+    tcp_nodelay: bool = True
+    backlog: int = 511
+    recv_buffer_size: int = 0
+    send_buffer_size: int = 0
+    read_size: int = READ_SIZE
+    reuse_port: bool = False
+    output_buffer_limit: OutputBufferLimit = OutputBufferLimit()
+
+
+async def create_server(protocol_factory, host, port, options=ServerOptions()):
+    """
+    Start a server for protocol_factory, whose protocols are
+    RedisServerProtocols, listening on host and port with options applied.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if options.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Accepted connections inherit the buffer sizes of the listening socket.
+        if options.recv_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, options.recv_buffer_size)
+        if options.send_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, options.send_buffer_size)
+        sock.bind((host, port))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+
+    # Each read is handled in full before the next one, so every connection
+    # of the server can read into the same buffer.
+    read_buffer = memoryview(bytearray(options.read_size))
+    clients = {}
+
+    def configured_protocol():
+        protocol = protocol_factory()
+        protocol.read_buffer = read_buffer
+        protocol.tcp_nodelay = options.tcp_nodelay
+        protocol.output_buffer_limit = options.output_buffer_limit
+        protocol.clients = clients
+        return protocol
+
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(configured_protocol, sock=sock, backlog=options.backlog)
+
+
+class RedisServerProtocol(asyncio.BufferedProtocol):
+    """
+    A client connection. While the transport has more replies buffered than
+    its high-water mark the client's commands are not read, so a client that
+    does not read its replies stops being served rather than making the
+    server buffer without end, and it is disconnected if it goes over the
+    output buffer limit.
+    """
+
+    # Set by create_server. Whether to set TCP_NODELAY on the connection,
+    # None leaves the loop's default, the buffer to read into, which is
+    # allocated for the connection if not given, the OutputBufferLimit, None
+    # for no limit, and the connections of the server by id.
+    tcp_nodelay = None
+    read_buffer = None
+    output_buffer_limit = None
+    clients = None
+
+    def __init__(self, datastore, persister=None):
         self.transport = None
-        self.buffer = bytearray()
+        self.decoder = RespDecoder()
         self.datastore = datastore
+        self.persister = persister
+        self.id = next(_client_ids)
+        self.created = self.last_interaction = monotonic()
+        self.last_command = None
+        # Set once the client has sent something that is not RESP.
+        self.protocol_error = False
+        self._soft_limit_timer = None
 
     def connection_made(self, transport):
         self.transport = transport
+        if self.tcp_nodelay is not None:
+            sock = transport.get_extra_info('socket')
+            if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay))
+        if self.clients is None:
+            self.clients = {}
+        self.clients[self.id] = self
+
+    def connection_lost(self, exc):
+        self.clients.pop(self.id, None)
+        if self._soft_limit_timer is not None:
+            self._soft_limit_timer.cancel()
+            self._soft_limit_timer = None
+
+    def pause_writing(self):
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+        # The buffer is down to the low-water mark, well under any soft limit.
+        if self._soft_limit_timer is not None:
+            self._soft_limit_timer.cancel()
+            self._soft_limit_timer = None
+
+    def get_buffer(self, sizehint):
+        if self.read_buffer is None:
+            self.read_buffer = memoryview(bytearray(READ_SIZE))
+        return self.read_buffer
+
+    def buffer_updated(self, nbytes):
+        self.data_received(self.read_buffer[:nbytes])
+
+    def decode(self, data):
+        """
+        Return the frames completed by data. If data is not valid RESP, the
+        ones before the error, setting protocol_error so the client is sent
+        a protocol error after their replies and disconnected.
+        """
+        try:
+            return self.decoder.feed(data)
+        except ProtocolError as e:
+            self.protocol_error = True
+            return e.frames
 
     def data_received(self, data: bytes) -> None:
         if not data:
             self.transport.close()
 
-        self.buffer.extend(data)
+        # A client may pipeline many commands in a single segment, so process
+        # every frame completed by this read and send all the replies back
+        # with a single write.
+        replies = bytearray()
+
+        for frame in self.decode(data):
+            self.last_command = frame
+            try:
+                reply = encode_message(handle_command(frame, self.datastore, self.persister, self))
+            except Exception as e:
+                reply = internal_error(e).resp_encode()
+            replies.extend(reply)
+
+        self.last_interaction = monotonic()
+
+        # Write out the commands logged for this read before acknowledging
+        # them, so a reply is never sent for a write that a crash of the
+        # process would lose. Under appendfsync always this also fsyncs.
+        if self.persister is not None:
+            self.persister.flush()
+
+        if self.protocol_error:
+            replies += _PROTOCOL_ERROR
+        if replies:
+            self.write(bytes(replies))
+        if self.protocol_error:
+            self.transport.close()
+
+    def write(self, data):
+        """Send data to the client, disconnecting it if that takes it over the output buffer limit."""
+        transport = self.transport
+        transport.write(data)
+
+        limit = self.output_buffer_limit
+        if limit is None:
+            return
+
+        size = transport.get_write_buffer_size()
+        if limit.hard_limit and size > limit.hard_limit:
+            transport.abort()
+        elif limit.soft_limit and size > limit.soft_limit:
+            if self._soft_limit_timer is None:
+                self._soft_limit_timer = asyncio.get_running_loop().call_later(
+                    limit.soft_seconds, self._soft_limit_reached
+                )
+        elif self._soft_limit_timer is not None:
+            self._soft_limit_timer.cancel()
+            self._soft_limit_timer = None
+
+    def _soft_limit_reached(self):
+        self._soft_limit_timer = None
+        if self.transport.get_write_buffer_size() > self.output_buffer_limit.soft_limit:
+            self.transport.abort()
+
+    def client_info(self):
+        """The fields of this connection's line in CLIENT LIST."""
+        transport = self.transport
+        peer = transport.get_extra_info('peername')
+        sock = transport.get_extra_info('socket')
+        now = monotonic()
+        output_size = transport.get_write_buffer_size()
+        return {
+            'id': self.id,
+            'addr': f'{peer[0]}:{peer[1]}' if isinstance(peer, tuple) else '',
+            'fd': sock.fileno() if sock is not None else -1,
+            'age': int(now - self.created),
+            'idle': int(now - self.last_interaction),
+            'qbuf': self.decoder.buffered,
+            'omem': output_size,
+            'events': ('r' if transport.is_reading() else '') + ('w' if output_size else ''),
+            'cmd': _command_name(self.last_command),
+        }
+
+
+async def check_expiry_task(datastore, persister=None):
+    """
+    Expire keys every EXPIRY_INTERVAL, logging a DEL to persister for each
+    one, and sample the command rate as well. How long each expiry cycle
+    takes and how late the task wakes up, which is how long something else
+    held up the loop, are latency events.
+    """
+    interval_ns = int(EXPIRY_INTERVAL * 10 ** 9)
+    while True:
+        with LatencyTimer('expire-cycle'):
+            datastore.remove_expired_keys()
+        if persister is not None:
+            log_expired_keys(datastore, persister)
+        STATS.track_ops()
+
+        start = perf_counter_ns()
+        await asyncio.sleep(EXPIRY_INTERVAL)
+        STATS.latency_event('event-loop', perf_counter_ns() - start - interval_ns)
 
-        frame, frame_size = extract_frame_from_buffer(self.buffer)
 
-        if frame:
-            self.buffer = self.buffer[frame_size:]
-            result = handle_command(frame, self.datastore)
-            self.transport.write(encode_message(result))
+async def check_aof_rewrite_task(datastore, persister):
+    while True:
+        persister.rewrite_if_needed(datastore)
+        await asyncio.sleep(0.1)
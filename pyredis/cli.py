@@ -3,7 +3,7 @@ import socket
 import typer
 from typing_extensions import Annotated
 
-from pyredis.protocol import encode_message, extract_frame_from_buffer
+from pyredis.protocol import encode_message, parse_frame
 from pyredis.types import Array, BulkString
 
 DEFAULT_PORT = 6379
@@ -38,10 +38,10 @@ def main(
                     data = client_socket.recv(RECV_SIZE)
                     buffer.extend(data)
 
-                    frame, frame_size = extract_frame_from_buffer(buffer)
+                    frame, frame_size = parse_frame(buffer)
 
-                    if frame:
-                        buffer = buffer[frame_size:]
+                    if frame is not None:
+                        del buffer[:frame_size]
                         if isinstance(frame, Array):
                             for count, item in enumerate(frame.data):
                                 print(f'{count + 1} "{item.as_str()}"')
@@ -1,194 +1,1045 @@
-from pyredis.types import BulkString, Error, SimpleString, Integer, Array
+import os
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from time import monotonic, perf_counter_ns, time_ns
+from typing import Callable
 
+from pyredis.datastore import MAXMEMORY_POLICIES
+from pyredis.stats import STATS
+from pyredis.types import BulkString, Error, SimpleString, Integer, Array, NULL_BULK_STRING, OK, PONG
+from pyredis.zset import format_score
 
-def _handle_echo(command, datastore):
-    if len(command) == 2:
-        message = command[1].data.decode()
-        return BulkString(f'{message}')
-    return Error("ERR wrong number of arguments for 'echo' command")
 
+@dataclass(frozen=True)
+class CommandSpec:
+    """
+    Metadata for a command. Arity follows the Redis convention: a positive
+    value is the exact number of arguments including the command name, a
+    negative value is the minimum number. Key positions are indexes into the
+    arguments, last_key is -1 when the keys run to the end of the command.
+    Handlers of persistence commands are passed the persister as well, and
+    handlers of client commands the connection the command came in on.
+    Commands that may add data are denyoom, refused while the store is over
+    maxmemory. A write command with propagate is logged to the AOF as the
+    command it returns for the one that ran, for commands whose effect
+    depends on when they run.
+    """
+    name: bytes
+    handler: Callable
+    arity: int
+    write: bool = False
+    first_key: int = 0
+    last_key: int = 0
+    key_step: int = 0
+    persistence: bool = False
+    client: bool = False
+    denyoom: bool = False
+    propagate: Callable = None
 
-def _handle_ping(command, datastore):
-    if len(command) > 1:
-        message = command[1].data.decode()
-        return BulkString(f'{message}')
-    return SimpleString('PONG')
+    @property
+    def flags(self):
+        flags = ['write'] if self.write else ['readonly']
+        if self.denyoom:
+            flags.append('denyoom')
+        return flags
 
+    def keys(self, args):
+        """Return the keys among args, the arguments of a call to this command."""
+        if not self.first_key:
+            return []
+        last = len(args) if self.last_key == -1 else self.last_key + 1
+        return args[self.first_key:last:self.key_step]
+
+
+COMMANDS = {}
+
+
+def command(
+    name, arity, write=False, first_key=0, last_key=0, key_step=0, persistence=False, client=False, denyoom=False,
+    propagate=None,
+):
+    """Register the decorated function as the handler for the named command."""
+    def register(handler):
+        spec = CommandSpec(
+            name, handler, arity, write, first_key, last_key, key_step, persistence, client, denyoom, propagate,
+        )
+        COMMANDS[name] = spec
+        COMMANDS[name.lower()] = spec
+        return handler
+    return register
+
+
+def _wrong_type_error():
+    return Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+def _not_an_integer_error():
+    return Error("ERR value is not an integer or out of range")
+
+
+def _overflow_error():
+    return Error("ERR increment or decrement would overflow")
+
+
+@command(b'ECHO', 2)
+def _handle_echo(args, datastore):
+    return BulkString(args[1])
 
-def _handle_unrecognised_command(command):
-    args = ' '.join((f"'{c.data.decode()}'" for c in command[1:]))
-    return Error(
-        f"ERR unknown command '{command[0].data.decode()}', with args beginning with: {args}"
-    )
 
+@command(b'PING', -1)
+def _handle_ping(args, datastore):
+    if len(args) > 1:
+        return BulkString(args[1])
+    return PONG
 
-def _handle_get(command, datastore):
-    if len(command) == 2:
-        key = command[1].data.decode()
+
+@command(b'GET', 2, first_key=1, last_key=1, key_step=1)
+def _handle_get(args, datastore):
+    try:
+        value = datastore[args[1]]
+    except KeyError:
+        return NULL_BULK_STRING
+    if not isinstance(value, bytes):
+        return _wrong_type_error()
+    return BulkString(value)
+
+
+def _propagate_set(command):
+    """
+    A SET with a relative expiry as one with the absolute time it expires
+    at, as Redis logs it, so replaying the AOF later doesn't extend it.
+    """
+    args = command.data
+    if len(args) == 5:
+        expiry_mode = args[3].data.lower()
+        if expiry_mode in (b'ex', b'px'):
+            ttl = int(args[4].data) * (1000 if expiry_mode == b'ex' else 1)
+            return Array([*args[:3], BulkString(b'PXAT'), BulkString(b'%d' % (time_ns() // 10 ** 6 + ttl))])
+    return command
+
+
+@command(b'SET', -3, write=True, first_key=1, last_key=1, key_step=1, denyoom=True, propagate=_propagate_set)
+def _handle_set(args, datastore):
+    length = len(args)
+    key = args[1]
+    value = args[2]
+
+    if length == 3:
+        datastore[key] = value
+        return OK
+    elif length == 5:
+        expiry_mode = args[3].lower()
         try:
-            value = datastore[key]
-        except KeyError:
-            return BulkString(None)
-        return BulkString(value)
-    return Error("ERR wrong number of arguments for 'get' command")
-
-
-def _handle_set(command, datastore, persister=None):
-    length = len(command)
-
-    if length >= 3:
-        key = command[1].data.decode()
-        value = command[2].data.decode()
-
-        if length == 3:
-            datastore[key] = value
-            if persister:
-                persister.log_command(command)
-            return SimpleString('OK')
-        elif length == 5:
-            expiry_mode = command[3].data.decode()
-            try:
-                expiry = int(command[4].data.decode())
-            except ValueError:
-                return Error('ERR value is not an integer or out of range')
-
-            if expiry_mode == 'ex':
-                datastore.set_with_expiry(key, value, expiry)
-                if persister:
-                    persister.log_command(command)
-                return SimpleString('OK')
-            elif expiry_mode == 'px':
-                datastore.set_with_expiry(key, value, expiry / 1000)
-                if persister:
-                    persister.log_command(command)
-                return SimpleString('OK')
+            expiry = int(args[4])
+        except ValueError:
+            return _not_an_integer_error()
+
+        if expiry_mode == b'ex':
+            datastore.set_with_expiry(key, value, expiry)
+            return OK
+        elif expiry_mode == b'px':
+            datastore.set_with_expiry(key, value, expiry / 1000)
+            return OK
+        elif expiry_mode == b'exat':
+            datastore.set_with_expiry_at(key, value, expiry * 10 ** 9)
+            return OK
+        elif expiry_mode == b'pxat':
+            datastore.set_with_expiry_at(key, value, expiry * 10 ** 6)
+            return OK
+    return Error('ERR syntax error')
+
+
+@command(b'MGET', -2, first_key=1, last_key=-1, key_step=1)
+def _handle_mget(args, datastore):
+    return Array([
+        BulkString(value) if value is not None else NULL_BULK_STRING for value in datastore.mget(args[1:])
+    ])
+
+
+def _key_value_pairs(args):
+    """Return the key value pairs of MSET style arguments, or None if one has no value."""
+    if len(args) % 2 == 0:
+        return None
+    return list(zip(args[1::2], args[2::2]))
+
+
+@command(b'MSET', -3, write=True, first_key=1, last_key=-1, key_step=2, denyoom=True)
+def _handle_mset(args, datastore):
+    items = _key_value_pairs(args)
+    if items is None:
+        return Error("ERR wrong number of arguments for 'mset' command")
+    datastore.mset(items)
+    return OK
+
+
+@command(b'MSETNX', -3, write=True, first_key=1, last_key=-1, key_step=2, denyoom=True)
+def _handle_msetnx(args, datastore):
+    items = _key_value_pairs(args)
+    if items is None:
+        return Error("ERR wrong number of arguments for 'msetnx' command")
+    return Integer(int(datastore.msetnx(items)))
+
+
+@command(b'EXISTS', -2, first_key=1, last_key=-1, key_step=1)
+def _handle_exists(args, datastore):
+    return Integer(datastore.exists(args[1:]))
+
+
+@command(b'DEL', -2, write=True, first_key=1, last_key=-1, key_step=1)
+def _handle_del(args, datastore):
+    return Integer(datastore.delete(args[1:]))
+
+
+@command(b'INCR', 2, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_incr(args, datastore):
+    try:
+        return Integer(datastore.incr(args[1]))
+    except TypeError:
+        return _wrong_type_error()
+    except (KeyError, ValueError):
+        return _not_an_integer_error()
+    except OverflowError:
+        return _overflow_error()
+
+
+@command(b'DECR', 2, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_decr(args, datastore):
+    try:
+        return Integer(datastore.decr(args[1]))
+    except TypeError:
+        return _wrong_type_error()
+    except (KeyError, ValueError):
+        return _not_an_integer_error()
+    except OverflowError:
+        return _overflow_error()
+
+
+def _parse_integers(*args):
+    """Parse integer arguments, returning None if any of them is not an integer."""
+    try:
+        return [int(arg) for arg in args]
+    except ValueError:
+        return None
+
+
+@command(b'LPUSH', -3, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_lpush(args, datastore):
+    try:
+        return Integer(datastore.prepend(args[1], *args[2:]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'RPUSH', -3, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_rpush(args, datastore):
+    try:
+        return Integer(datastore.append(args[1], *args[2:]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+def _pop(args, pop):
+    count = None
+    if len(args) == 3:
+        count = _parse_integers(args[2])
+        if count is None or count[0] < 0:
+            return Error("ERR value is out of range, must be positive")
+        count = count[0]
+    elif len(args) > 3:
         return Error('ERR syntax error')
-    return Error("Error wrong number of arguments for 'set' command")
-
-
-def _handle_exists(command, datastore):
-    if len(command) >= 2:
-        count = 0
-        for c in command[1:]:
-            key = c.data.decode()
-            if key in datastore:
-                count += 1
-        return Integer(count)
-    return Error("ERR wrong number of arguments for 'exists' command")
-
-
-def _handle_del(command, datastore, persister=None):
-    if len(command) > 2:
-        count = 0
-        for c in command[1:]:
-            key = c.data.decode()
-            if key in datastore:
-                del datastore[key]
-                count += 1
-        if persister: 
-            persister.log_command(command)
-        return Integer(count)
-    return Error("ERR wrong number of arguments for 'del' command")
-
-
-def _handle_incr(command, datastore, persister=None):
-    if len(command) == 2:
-        key = command[1].data.decode()
-        try:
-            result = datastore.incr(key)
-            if persister:
-                persister.log_command(command)
-            return Integer(result)
-        except:
-            return Error("ERR value is not an integer or out of range")
-    return Error("ERR wrong number of arguments for 'incr' command")
-
-
-def _handle_decr(command, datastore, persister=None):
-    if len(command) == 2:
-        key = command[1].data.decode()
-        try:
-            result = datastore.decr(key)
-            if persister: 
-                persister.log_command(command)
-            return Integer(result)
-        except:
-            return Error("ERR value is not an integer or out of range")
-    return Error("ERR wrong number of arguments for 'decr' command")
 
+    try:
+        result = pop(args[1], count)
+    except TypeError:
+        return _wrong_type_error()
 
-def _handle_lpush(command, datastore, persister=None):
-    if len(command) >= 2:
-        count = 0
-        key = command[1].data.decode()
+    if count is None:
+        return BulkString(result) if result is not None else NULL_BULK_STRING
+    return Array([BulkString(i) for i in result]) if result is not None else Array(None)
 
-        try:
-            for c in command[2:]:
-                item = c.data.decode()
-                count = datastore.prepend(key, item)
-            if persister: 
-                persister.log_command(command)
-            return Integer(count)
-        except TypeError:
-            return Error("WRONGTYPE Operation against a key holding the wrong kind of value")
-    return Error("ERR wrong number of arguments for 'lpush' command")
-
-
-def _handle_rpush(command, datastore, persister=None):
-    if len(command) >= 2:
-        count = 0
-        key = command[1].data.decode()
 
-        try:
-            for c in command[2:]:
-                item = c.data.decode()
-                count = datastore.append(key, item)
-            if persister: 
-                persister.log_command(command)
-            return Integer(count)
-        except TypeError:
-            return Error("WRONGTYPE Operation against a key holding the wrong kind of value")
-    return Error("ERR wrong number of arguments for 'rpush' command")
-
-
-def _handle_lrange(command, datastore):
-    if len(command) == 4:
-        key = command[1].data.decode()
-        start = int(command[2].data.decode())
-        stop = int(command[3].data.decode())
+@command(b'LPOP', -2, write=True, first_key=1, last_key=1, key_step=1)
+def _handle_lpop(args, datastore):
+    return _pop(args, datastore.lpop)
 
-        try:
-            items = datastore.lrange(key, start, stop)
-            return Array([BulkString(i) for i in items])
-        except TypeError:
-            return Error("WRONGTYPE Operation against a key holding the wrong kind of value")
-
-    return Error("ERR wrong number of arguments for 'lrange' command")
-
-
-def handle_command(command, datastore, persister=None):
-    match command[0].data.decode().upper():
-        case "ECHO":
-            return _handle_echo(command, datastore)
-        case "PING":
-            return _handle_ping(command, datastore)
-        case "GET":
-            return _handle_get(command, datastore)
-        case "SET":
-            return _handle_set(command, datastore, persister)
-        case "DECR":
-            return _handle_decr(command, datastore, persister)
-        case "DEL":
-            return _handle_del(command, datastore, persister)
-        case "EXISTS":
-            return _handle_exists(command, datastore)
-        case "INCR":
-            return _handle_incr(command, datastore, persister)
-        case "LPUSH":
-            return _handle_lpush(command, datastore, persister)
-        case "LRANGE":
-            return _handle_lrange(command, datastore)
-        case "RPUSH":
-            return _handle_rpush(command, datastore, persister)
-
-    return _handle_unrecognised_command(command)
+
+@command(b'RPOP', -2, write=True, first_key=1, last_key=1, key_step=1)
+def _handle_rpop(args, datastore):
+    return _pop(args, datastore.rpop)
+
+
+@command(b'LLEN', 2, first_key=1, last_key=1, key_step=1)
+def _handle_llen(args, datastore):
+    try:
+        return Integer(datastore.llen(args[1]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'LINDEX', 3, first_key=1, last_key=1, key_step=1)
+def _handle_lindex(args, datastore):
+    index = _parse_integers(args[2])
+    if index is None:
+        return _not_an_integer_error()
+
+    try:
+        value = datastore.lindex(args[1], index[0])
+    except TypeError:
+        return _wrong_type_error()
+    return BulkString(value) if value is not None else NULL_BULK_STRING
+
+
+@command(b'LSET', 4, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_lset(args, datastore):
+    index = _parse_integers(args[2])
+    if index is None:
+        return _not_an_integer_error()
+
+    try:
+        datastore.lset(args[1], index[0], args[3])
+    except KeyError:
+        return Error('ERR no such key')
+    except IndexError:
+        return Error('ERR index out of range')
+    except TypeError:
+        return _wrong_type_error()
+    return OK
+
+
+@command(b'LRANGE', 4, first_key=1, last_key=1, key_step=1)
+def _handle_lrange(args, datastore):
+    indexes = _parse_integers(args[2], args[3])
+    if indexes is None:
+        return _not_an_integer_error()
+
+    try:
+        items = datastore.lrange(args[1], *indexes)
+        return Array([BulkString(i) for i in items])
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'LTRIM', 4, write=True, first_key=1, last_key=1, key_step=1)
+def _handle_ltrim(args, datastore):
+    indexes = _parse_integers(args[2], args[3])
+    if indexes is None:
+        return _not_an_integer_error()
+
+    try:
+        datastore.ltrim(args[1], *indexes)
+    except TypeError:
+        return _wrong_type_error()
+    return OK
+
+
+@command(b'HSET', -4, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_hset(args, datastore):
+    if len(args) % 2:
+        return Error("ERR wrong number of arguments for 'hset' command")
+    try:
+        return Integer(datastore.hset(args[1], zip(args[2::2], args[3::2])))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'HGET', 3, first_key=1, last_key=1, key_step=1)
+def _handle_hget(args, datastore):
+    try:
+        value = datastore.hget(args[1], args[2])
+    except TypeError:
+        return _wrong_type_error()
+    return BulkString(value) if value is not None else NULL_BULK_STRING
+
+
+@command(b'HMGET', -3, first_key=1, last_key=1, key_step=1)
+def _handle_hmget(args, datastore):
+    try:
+        values = datastore.hmget(args[1], args[2:])
+    except TypeError:
+        return _wrong_type_error()
+    return Array([BulkString(value) if value is not None else NULL_BULK_STRING for value in values])
+
+
+@command(b'HGETALL', 2, first_key=1, last_key=1, key_step=1)
+def _handle_hgetall(args, datastore):
+    try:
+        items = datastore.hgetall(args[1])
+    except TypeError:
+        return _wrong_type_error()
+    return Array([BulkString(item) for pair in items for item in pair])
+
+
+@command(b'HDEL', -3, write=True, first_key=1, last_key=1, key_step=1)
+def _handle_hdel(args, datastore):
+    try:
+        return Integer(datastore.hdel(args[1], args[2:]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'HINCRBY', 4, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_hincrby(args, datastore):
+    increment = _parse_integers(args[3])
+    if increment is None or not -2 ** 63 <= increment[0] < 2 ** 63:
+        return _not_an_integer_error()
+
+    try:
+        return Integer(datastore.hincrby(args[1], args[2], increment[0]))
+    except TypeError:
+        return _wrong_type_error()
+    except ValueError:
+        return Error('ERR hash value is not an integer')
+    except OverflowError:
+        return _overflow_error()
+
+
+@command(b'HLEN', 2, first_key=1, last_key=1, key_step=1)
+def _handle_hlen(args, datastore):
+    try:
+        return Integer(datastore.hlen(args[1]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'HSCAN', -3, first_key=1, last_key=1, key_step=1)
+def _handle_hscan(args, datastore):
+    cursor = _parse_integers(args[2])
+    if cursor is None or cursor[0] < 0:
+        return Error('ERR invalid cursor')
+
+    pattern = None
+    count = 10
+    options = args[3:]
+    if len(options) % 2:
+        return Error('ERR syntax error')
+    for name, value in zip(options[::2], options[1::2]):
+        name = name.upper()
+        if name == b'MATCH':
+            pattern = value
+        elif name == b'COUNT':
+            count = _parse_integers(value)
+            if count is None:
+                return _not_an_integer_error()
+            count = count[0]
+            if count < 1:
+                return Error('ERR syntax error')
+        else:
+            return Error('ERR syntax error')
+
+    try:
+        cursor, items = datastore.hscan(args[1], cursor[0], count)
+    except TypeError:
+        return _wrong_type_error()
+    if pattern is not None:
+        items = [(field, value) for field, value in items if fnmatchcase(field, pattern)]
+    return Array([
+        BulkString(b'%d' % cursor),
+        Array([BulkString(item) for pair in items for item in pair]),
+    ])
+
+
+@command(b'SADD', -3, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_sadd(args, datastore):
+    try:
+        return Integer(datastore.sadd(args[1], args[2:]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'SREM', -3, write=True, first_key=1, last_key=1, key_step=1)
+def _handle_srem(args, datastore):
+    try:
+        return Integer(datastore.srem(args[1], args[2:]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'SISMEMBER', 3, first_key=1, last_key=1, key_step=1)
+def _handle_sismember(args, datastore):
+    try:
+        return Integer(int(datastore.sismember(args[1], args[2])))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'SMEMBERS', 2, first_key=1, last_key=1, key_step=1)
+def _handle_smembers(args, datastore):
+    try:
+        return Array([BulkString(member) for member in datastore.smembers(args[1])])
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'SCARD', 2, first_key=1, last_key=1, key_step=1)
+def _handle_scard(args, datastore):
+    try:
+        return Integer(datastore.scard(args[1]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'SINTER', -2, first_key=1, last_key=-1, key_step=1)
+def _handle_sinter(args, datastore):
+    try:
+        return Array([BulkString(member) for member in datastore.sinter(args[1:])])
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'SUNION', -2, first_key=1, last_key=-1, key_step=1)
+def _handle_sunion(args, datastore):
+    try:
+        return Array([BulkString(member) for member in datastore.sunion(args[1:])])
+    except TypeError:
+        return _wrong_type_error()
+
+
+def _parse_score(arg):
+    """Parse a score, returning None if it is not a float. NaN is not a score."""
+    try:
+        score = float(arg)
+    except ValueError:
+        return None
+    return score if score == score else None
+
+
+def _parse_score_bound(arg):
+    """Parse a ZRANGEBYSCORE bound, a score or ( then a score for an exclusive one, as (score, exclusive)."""
+    exclusive = arg[:1] == b'('
+    score = _parse_score(arg[1:] if exclusive else arg)
+    return (score, exclusive) if score is not None else None
+
+
+def _not_a_float_error():
+    return Error('ERR value is not a valid float')
+
+
+def _scored_members(pairs, with_scores):
+    if with_scores:
+        return Array([BulkString(item) for member, score in pairs for item in (member, format_score(score))])
+    return Array([BulkString(member) for member, _ in pairs])
+
+
+_ZADD_OPTIONS = (b'NX', b'XX', b'GT', b'LT', b'CH', b'INCR')
+
+
+@command(b'ZADD', -4, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_zadd(args, datastore):
+    options = set()
+    position = 2
+    while position < len(args) and args[position].upper() in _ZADD_OPTIONS:
+        options.add(args[position].upper())
+        position += 1
+
+    rest = args[position:]
+    if not rest or len(rest) % 2:
+        return Error('ERR syntax error')
+    nx, xx, gt, lt = (option in options for option in (b'NX', b'XX', b'GT', b'LT'))
+    if nx and xx:
+        return Error('ERR XX and NX options at the same time are not compatible')
+    if ((gt or lt) and nx) or (gt and lt):
+        return Error('ERR GT, LT, and/or NX options at the same time are not compatible')
+    if b'INCR' in options and len(rest) > 2:
+        return Error('ERR INCR option supports a single increment-element pair')
+
+    items = []
+    for score, member in zip(rest[::2], rest[1::2]):
+        score = _parse_score(score)
+        if score is None:
+            return _not_a_float_error()
+        items.append((member, score))
+
+    try:
+        if b'INCR' in options:
+            member, increment = items[0]
+            score = datastore.zincrby(args[1], member, increment, nx, xx, gt, lt)
+            return BulkString(format_score(score)) if score is not None else NULL_BULK_STRING
+        added, changed = datastore.zadd(args[1], items, nx, xx, gt, lt)
+    except TypeError:
+        return _wrong_type_error()
+    except ValueError:
+        return Error('ERR resulting score is not a number (NaN)')
+    return Integer(changed if b'CH' in options else added)
+
+
+@command(b'ZINCRBY', 4, write=True, first_key=1, last_key=1, key_step=1, denyoom=True)
+def _handle_zincrby(args, datastore):
+    increment = _parse_score(args[2])
+    if increment is None:
+        return _not_a_float_error()
+
+    try:
+        return BulkString(format_score(datastore.zincrby(args[1], args[3], increment)))
+    except TypeError:
+        return _wrong_type_error()
+    except ValueError:
+        return Error('ERR resulting score is not a number (NaN)')
+
+
+@command(b'ZREM', -3, write=True, first_key=1, last_key=1, key_step=1)
+def _handle_zrem(args, datastore):
+    try:
+        return Integer(datastore.zrem(args[1], args[2:]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'ZSCORE', 3, first_key=1, last_key=1, key_step=1)
+def _handle_zscore(args, datastore):
+    try:
+        score = datastore.zscore(args[1], args[2])
+    except TypeError:
+        return _wrong_type_error()
+    return BulkString(format_score(score)) if score is not None else NULL_BULK_STRING
+
+
+@command(b'ZCARD', 2, first_key=1, last_key=1, key_step=1)
+def _handle_zcard(args, datastore):
+    try:
+        return Integer(datastore.zcard(args[1]))
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'ZRANK', 3, first_key=1, last_key=1, key_step=1)
+def _handle_zrank(args, datastore):
+    try:
+        rank = datastore.zrank(args[1], args[2])
+    except TypeError:
+        return _wrong_type_error()
+    return Integer(rank) if rank is not None else NULL_BULK_STRING
+
+
+def _zrange(args, datastore, by_score, reverse, options):
+    """
+    Reply to a ZRANGE style command whose start and stop, or min and max if
+    by_score, are args[2] and args[3], with the remaining options.
+    """
+    with_scores = False
+    limit = None
+    while options:
+        option = options[0].upper()
+        if option == b'WITHSCORES':
+            with_scores = True
+            options = options[1:]
+        elif option == b'LIMIT' and len(options) >= 3:
+            limit = _parse_integers(options[1], options[2])
+            if limit is None:
+                return _not_an_integer_error()
+            options = options[3:]
+        else:
+            return Error('ERR syntax error')
+
+    if limit is not None and not by_score:
+        return Error('ERR syntax error, LIMIT is only supported in combination with either BYSCORE or BYLEX')
+
+    try:
+        if not by_score:
+            indexes = _parse_integers(args[2], args[3])
+            if indexes is None:
+                return _not_an_integer_error()
+            return _scored_members(datastore.zrange(args[1], *indexes, reverse=reverse), with_scores)
+
+        bounds = _parse_score_bound(args[2]), _parse_score_bound(args[3])
+        if None in bounds:
+            return Error('ERR min or max is not a float')
+        # In reverse the maximum comes first.
+        (minimum, exclude_minimum), (maximum, exclude_maximum) = bounds[::-1] if reverse else bounds
+        offset, count = limit or (0, -1)
+        if offset < 0:
+            return Array([])
+        pairs = datastore.zrangebyscore(
+            args[1], minimum, maximum, exclude_minimum, exclude_maximum, reverse, offset, count,
+        )
+        return _scored_members(pairs, with_scores)
+    except TypeError:
+        return _wrong_type_error()
+
+
+@command(b'ZRANGE', -4, first_key=1, last_key=1, key_step=1)
+def _handle_zrange(args, datastore):
+    by_score = reverse = False
+    options = []
+    for option in args[4:]:
+        if option.upper() == b'BYSCORE':
+            by_score = True
+        elif option.upper() == b'REV':
+            reverse = True
+        else:
+            options.append(option)
+    return _zrange(args, datastore, by_score, reverse, options)
+
+
+@command(b'ZRANGEBYSCORE', -4, first_key=1, last_key=1, key_step=1)
+def _handle_zrangebyscore(args, datastore):
+    return _zrange(args, datastore, True, False, args[4:])
+
+
+# The key of USAGE, the only subcommand, follows it, so a sharded server
+# runs MEMORY USAGE on the shard that owns the key.
+@command(b'MEMORY', -2, first_key=2, last_key=2, key_step=1)
+def _handle_memory(args, datastore):
+    subcommand = args[1].upper()
+
+    if subcommand == b'USAGE' and len(args) in (3, 5):
+        # SAMPLES is accepted but not needed, as lists, hashes, sets and
+        # sorted sets keep count of the size of their elements.
+        if len(args) == 5 and (args[3].upper() != b'SAMPLES' or _parse_integers(args[4]) is None):
+            return Error('ERR syntax error')
+        usage = datastore.memory_usage(args[2])
+        return Integer(usage) if usage is not None else NULL_BULK_STRING
+
+    return Error(f"ERR unknown subcommand '{args[1].decode()}'. Try MEMORY HELP.")
+
+
+@command(b'BGREWRITEAOF', 1, persistence=True)
+def _handle_bgrewriteaof(args, datastore, persister):
+    if persister is None:
+        return Error('ERR append only file is not enabled')
+    if not persister.rewrite(datastore):
+        return Error('ERR Background append only file rewriting already in progress')
+    return SimpleString('Background append only file rewriting started')
+
+
+def _snapshotting_disabled(persister):
+    return persister is None or persister.snapshot_filename is None
+
+
+def _child_running_error(persister):
+    if persister.rewrite_in_progress:
+        return Error('ERR Background append only file rewriting in progress')
+    return Error('ERR Background save already in progress')
+
+
+@command(b'SAVE', 1, persistence=True)
+def _handle_save(args, datastore, persister):
+    if _snapshotting_disabled(persister):
+        return Error('ERR snapshotting is not enabled')
+    if not persister.save(datastore):
+        return _child_running_error(persister)
+    return OK
+
+
+@command(b'BGSAVE', 1, persistence=True)
+def _handle_bgsave(args, datastore, persister):
+    if _snapshotting_disabled(persister):
+        return Error('ERR snapshotting is not enabled')
+    if not persister.background_save(datastore):
+        return _child_running_error(persister)
+    return SimpleString('Background saving started')
+
+
+def _command_info(spec):
+    return Array([
+        BulkString(spec.name.lower()),
+        Integer(spec.arity),
+        Array([SimpleString(flag) for flag in spec.flags]),
+        Integer(spec.first_key),
+        Integer(spec.last_key),
+        Integer(spec.key_step),
+    ])
+
+
+@command(b'COMMAND', -1)
+def _handle_command(args, datastore):
+    if len(args) == 1:
+        return Array([_command_info(spec) for name, spec in COMMANDS.items() if name == spec.name])
+
+    subcommand = args[1].upper()
+
+    if subcommand == b'COUNT' and len(args) == 2:
+        return Integer(sum(1 for name, spec in COMMANDS.items() if name == spec.name))
+    if subcommand == b'INFO':
+        reply = []
+        for name in args[2:]:
+            spec = COMMANDS.get(name.upper())
+            reply.append(_command_info(spec) if spec else Array(None))
+        return Array(reply)
+
+    return Error(f"ERR unknown subcommand '{args[1].decode()}'. Try COMMAND HELP.")
+
+
+@command(b'CLIENT', -2, client=True)
+def _handle_client(args, datastore, client):
+    subcommand = args[1].upper()
+
+    if client is None:
+        return Error('ERR CLIENT is not supported on this connection')
+    if subcommand == b'ID' and len(args) == 2:
+        return Integer(client.id)
+    if subcommand == b'LIST' and len(args) == 2:
+        lines = (
+            ' '.join(f'{field}={value}' for field, value in connection.client_info().items())
+            for connection in client.clients.values()
+        )
+        return BulkString(''.join(f'{line}\n' for line in lines).encode())
+
+    return Error(f"ERR unknown subcommand '{args[1].decode()}'. Try CLIENT HELP.")
+
+
+# Multipliers of the units memory sizes may be given in, as in redis.conf.
+_MEMORY_UNITS = {
+    b'': 1, b'b': 1, b'k': 1000, b'kb': 1024, b'm': 1000 ** 2, b'mb': 1024 ** 2, b'g': 1000 ** 3, b'gb': 1024 ** 3,
+}
+
+
+def _parse_memory(value):
+    """Parse a size such as 100mb into bytes, returning None if it is not one."""
+    value = value.lower()
+    digits = value.rstrip(b'bkmg')
+    multiplier = _MEMORY_UNITS.get(value[len(digits):])
+    if multiplier is None or not digits.isdigit():
+        return None
+    return int(digits) * multiplier
+
+
+def _config_get(datastore):
+    return {
+        b'maxmemory': b'%d' % datastore.maxmemory,
+        b'maxmemory-policy': datastore.maxmemory_policy.encode(),
+        b'maxmemory-samples': b'%d' % datastore.maxmemory_samples,
+    }
+
+
+def _config_set(datastore, name, value):
+    """Apply one CONFIG SET parameter, returning False if the value is not valid for it."""
+    if name == b'maxmemory':
+        size = _parse_memory(value)
+        if size is None:
+            return False
+        datastore.maxmemory = size
+    elif name == b'maxmemory-policy':
+        policy = value.lower().decode()
+        if policy not in MAXMEMORY_POLICIES:
+            return False
+        datastore.maxmemory_policy = policy
+    else:
+        samples = _parse_integers(value)
+        if samples is None or samples[0] < 1:
+            return False
+        datastore.maxmemory_samples = samples[0]
+    return True
+
+
+@command(b'CONFIG', -2)
+def _handle_config(args, datastore):
+    subcommand = args[1].upper()
+
+    if subcommand == b'GET' and len(args) > 2:
+        parameters = _config_get(datastore)
+        reply = []
+        for name, value in parameters.items():
+            if any(fnmatchcase(name, pattern.lower()) for pattern in args[2:]):
+                reply += [BulkString(name), BulkString(value)]
+        return Array(reply)
+    if subcommand == b'SET' and len(args) > 2 and len(args) % 2 == 0:
+        parameters = _config_get(datastore)
+        for name, value in zip(args[2::2], args[3::2]):
+            name = name.lower()
+            if name not in parameters:
+                return Error(f"ERR Unknown option or number of arguments for CONFIG SET - '{name.decode()}'")
+            if not _config_set(datastore, name, value):
+                return Error(f"ERR CONFIG SET failed (possibly related to argument '{name.decode()}')")
+        return OK
+    if subcommand == b'RESETSTAT' and len(args) == 2:
+        STATS.reset()
+        datastore.reset_stats()
+        return OK
+
+    return Error(f"ERR unknown subcommand '{args[1].decode()}'. Try CONFIG HELP.")
+
+
+def _human_bytes(size):
+    """Format a number of bytes as INFO does, as in 1.50M."""
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024 or unit == 'G':
+            return f'{size}B' if unit == 'B' else f'{size:.2f}{unit}'
+        size /= 1024
+
+
+# The sections INFO gives when none are asked for, then the rest.
+INFO_DEFAULT_SECTIONS = ('server', 'clients', 'memory', 'stats', 'persistence', 'keyspace')
+INFO_SECTIONS = INFO_DEFAULT_SECTIONS + ('commandstats', 'latencystats')
+
+
+def _info_fields(section, datastore, client):
+    """Return the fields of an INFO section as (name, value) pairs."""
+    persister = client.persister if client is not None else None
+
+    if section == 'server':
+        return [('process_id', os.getpid()), ('uptime_in_seconds', int(monotonic() - STATS.started))]
+    if section == 'clients':
+        return [('connected_clients', len(client.clients) if client is not None else 0)]
+    if section == 'memory':
+        return [
+            ('used_memory', datastore.used_memory),
+            ('used_memory_human', _human_bytes(datastore.used_memory)),
+            ('maxmemory', datastore.maxmemory),
+            ('maxmemory_human', _human_bytes(datastore.maxmemory)),
+            ('maxmemory_policy', datastore.maxmemory_policy),
+        ]
+    if section == 'stats':
+        lookups = datastore.keyspace_hits + datastore.keyspace_misses
+        return [
+            ('total_commands_processed', STATS.total_commands),
+            ('instantaneous_ops_per_sec', STATS.ops_per_sec),
+            ('expired_keys', datastore.expired_keys),
+            ('evicted_keys', datastore.evicted_keys),
+            ('keyspace_hits', datastore.keyspace_hits),
+            ('keyspace_misses', datastore.keyspace_misses),
+            ('keyspace_hit_ratio', f'{datastore.keyspace_hits / lookups if lookups else 0:.4f}'),
+        ]
+    if section == 'persistence':
+        fields = [('aof_enabled', int(persister is not None))]
+        if persister is not None:
+            fields += [
+                ('aof_rewrite_in_progress', int(persister.rewrite_in_progress)),
+                ('aof_current_size', persister.size),
+                ('aof_base_size', persister.base_size),
+                ('aof_bytes_written', persister.bytes_written),
+            ]
+        return fields
+    if section == 'keyspace':
+        keys = len(datastore)
+        return [('db0', f'keys={keys},expires={datastore.expiring_keys},avg_ttl=0')] if keys else []
+    if section == 'commandstats':
+        return [
+            (
+                f'cmdstat_{name.decode().lower()}',
+                f'calls={stats.calls},usec={stats.total_ns // 1000},'
+                f'usec_per_call={stats.total_ns / stats.calls / 1000:.2f},failed_calls={stats.failed_calls}'
+            )
+            for name, stats in STATS.commands.items()
+        ]
+    if section == 'latencystats':
+        return [
+            (
+                f'latency_percentiles_usec_{name.decode().lower()}',
+                ','.join(f'p{p:g}={stats.percentile(p) / 1000:.3f}' for p in (50, 99, 99.9))
+            )
+            for name, stats in STATS.commands.items()
+        ]
+
+
+@command(b'INFO', -1, client=True)
+def _handle_info(args, datastore, client):
+    sections = [arg.decode().lower() for arg in args[1:]] or ['default']
+    wanted = []
+    for section in sections:
+        if section == 'default':
+            wanted += INFO_DEFAULT_SECTIONS
+        elif section in ('all', 'everything'):
+            wanted += INFO_SECTIONS
+        elif section in INFO_SECTIONS:
+            wanted.append(section)
+
+    text = []
+    for section in dict.fromkeys(wanted):
+        if section == 'clients' and client is None:
+            continue
+        lines = [f'# {section.capitalize()}']
+        lines += [f'{name}:{value}' for name, value in _info_fields(section, datastore, client)]
+        text.append('\r\n'.join(lines) + '\r\n')
+    return BulkString('\r\n'.join(text).encode())
+
+
+@command(b'LATENCY', -2)
+def _handle_latency(args, datastore):
+    subcommand = args[1].upper()
+
+    if subcommand == b'LATEST' and len(args) == 2:
+        return Array([
+            Array([BulkString(event.encode()), Integer(timestamp), Integer(latest), Integer(highest)])
+            for event, timestamp, latest, highest in STATS.latency_latest()
+        ])
+    if subcommand == b'HISTORY' and len(args) == 3:
+        history = STATS.latency_events.get(args[2].decode(), ())
+        return Array([Array([Integer(timestamp), Integer(ms)]) for timestamp, ms in history])
+    if subcommand == b'RESET':
+        return Integer(STATS.reset_latency([arg.decode() for arg in args[2:]] or None))
+
+    return Error(f"ERR unknown subcommand '{args[1].decode()}'. Try LATENCY HELP.")
+
+
+def _handle_unrecognised_command(args):
+    arguments = ' '.join((f"'{a.decode()}'" for a in args[1:]))
+    return Error(
+        f"ERR unknown command '{args[0].decode()}', with args beginning with: {arguments}"
+    )
+
+
+_DEL = BulkString(b'DEL')
+
+
+def _free_memory(spec, datastore, persister):
+    """
+    Evict keys before a write while the store is over maxmemory, logging a
+    DEL for each so the AOF does not bring them back. Returns the error
+    to reply with if the command may not run.
+    """
+    evicted = datastore.evict()
+    if persister is not None:
+        for key in evicted:
+            persister.log_command([_DEL, BulkString(key)])
+
+    if spec.denyoom and datastore.used_memory > datastore.maxmemory:
+        return Error("OOM command not allowed when used memory > 'maxmemory'.")
+    return None
+
+
+def log_expired_keys(datastore, persister):
+    """Log a DEL for each key datastore has expired since the last call, so the AOF does not bring them back."""
+    for key in datastore.take_expired():
+        persister.log_command([_DEL, BulkString(key)])
+
+
+def internal_error(exc):
+    """The reply to a command whose handling raised exc, so the server can carry on with the next."""
+    return Error(f"ERR internal error: {type(exc).__name__}{f': {exc}' if str(exc) else ''}")
+
+
+def execute_command(args, datastore, persister=None, client=None):
+    """
+    Run the command given as a list of raw byte arguments. Returns the spec
+    of the command, None if it is unknown, and the reply.
+    """
+    if not args:
+        return None, Error('ERR empty command')
+    spec = COMMANDS.get(args[0]) or COMMANDS.get(args[0].upper())
+    if spec is None:
+        return None, _handle_unrecognised_command(args)
+
+    arity = spec.arity
+    if (arity > 0 and len(args) != arity) or len(args) < -arity:
+        return spec, Error(f"ERR wrong number of arguments for '{spec.name.lower().decode()}' command")
+
+    if spec.write and datastore.maxmemory and datastore.used_memory > datastore.maxmemory:
+        error = _free_memory(spec, datastore, persister)
+        if error is not None:
+            return spec, error
+
+    if spec.persistence:
+        return spec, spec.handler(args, datastore, persister)
+    if spec.client:
+        return spec, spec.handler(args, datastore, client)
+    return spec, spec.handler(args, datastore)
+
+
+def handle_command(command, datastore, persister=None, client=None):
+    args = [item.data for item in command]
+
+    if STATS.enabled:
+        start = perf_counter_ns()
+        spec, result = execute_command(args, datastore, persister, client)
+        if spec is not None:
+            STATS.record_command(spec.name, perf_counter_ns() - start, isinstance(result, Error))
+    else:
+        spec, result = execute_command(args, datastore, persister, client)
+
+    if persister and spec is not None and spec.write and not isinstance(result, Error):
+        # Keys the command found expired are logged as deleted before it.
+        if datastore.pending_expired:
+            log_expired_keys(datastore, persister)
+        persister.log_command(command if spec.propagate is None else spec.propagate(command))
+
+    return result
@@ -1,122 +1,1153 @@
-from collections import deque
-from dataclasses import dataclass
-from itertools import islice
-from random import sample
+import sys
+from contextlib import ExitStack, nullcontext
+from heapq import heapify, heappop, heappush
+from random import random
 from threading import Lock
-from time import time_ns
-from typing import Any
+from time import monotonic_ns, time_ns
 
-from pyredis.types import Error
+from pyredis.hash import Hash
+from pyredis.quicklist import QuickList
+from pyredis.set import Set
+from pyredis.utils import normalise_range
+from pyredis.zset import SortedSet
+
+
+DEFAULT_LOCK_STRIPES = 16
+
+# Share of each expiry cycle's interval that remove_expired_keys may use.
+ACTIVE_EXPIRE_TIME_BUDGET = 0.025
+
+# String values that are integers from 0 below this are stored as one shared
+# int object each, as with Redis's shared integers. CPython itself only
+# shares ints up to 256.
+SHARED_INTEGERS = 10_000
+
+# Other string values up to this long are shared as well, through a table
+# that takes the first SHARED_STRINGS_LIMIT distinct ones seen.
+SHARED_STRING_MAX_SIZE = 16
+SHARED_STRINGS_LIMIT = 65_536
+
+# Estimated bytes used by an entry of a dict beyond its key and value: its
+# slot in the hash table and index, allowing for the table's load factor.
+DICT_ENTRY_OVERHEAD = 48
+
+# Estimated bytes used by a TTL: its expires entry and int, and the
+# (expiry, key) tuple in the expiry heap.
+EXPIRY_ENTRY_SIZE = DICT_ENTRY_OVERHEAD + sys.getsizeof(2 ** 62) + sys.getsizeof((0, b'')) + 8
+
+# What to do when the store is over maxmemory, as with Redis's
+# maxmemory-policy: refuse commands that add data, or evict the least
+# recently used key, the least frequently used, the least recently used of
+# those with a TTL, or the one whose TTL is nearest.
+NOEVICTION = 'noeviction'
+ALLKEYS_LRU = 'allkeys-lru'
+ALLKEYS_LFU = 'allkeys-lfu'
+VOLATILE_LRU = 'volatile-lru'
+VOLATILE_TTL = 'volatile-ttl'
+MAXMEMORY_POLICIES = (NOEVICTION, ALLKEYS_LRU, ALLKEYS_LFU, VOLATILE_LRU, VOLATILE_TTL)
+
+# Keys sampled for each one evicted, as with maxmemory-samples. More is
+# closer to true LRU or LFU and slower.
+MAXMEMORY_SAMPLES = 5
+EVICTION_POOL_SIZE = 16
+
+# The LFU counter is a logarithmic access count from 0 to 255 as in Redis:
+# new keys start at LFU_INIT_VAL, so they are not evicted straight away, an
+# access increments it with a probability that falls as it grows, by
+# LFU_LOG_FACTOR, and it is decremented for every LFU_DECAY_TIME minutes the
+# key is not accessed.
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10
+LFU_DECAY_TIME = 1
+
+_SHARED_INTEGERS = tuple(range(SHARED_INTEGERS))
+_shared_strings = {}
+_INTEGER_START = frozenset(b'-0123456789')
+_BYTES_OVERHEAD = sys.getsizeof(b'')
+
+_NO_LOCK = nullcontext()
+
+# The types that are not strings, which keep count of their own size.
+_COLLECTIONS = (QuickList, Hash, Set, SortedSet)
+
+
+def _no_lock(_):
+    return _NO_LOCK
 
 
 def to_ns(seconds):
     return seconds * 10 ** 9
 
 
-@dataclass
-class DataEntry:
-    """Class to represent a data entry. Contains the data and the expiry."""
-    value: Any
-    expiry: int = 0
+def to_bytes(value):
+    """Return a stored value as bytes, values given as initial_data may be str or int."""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, int):
+        return b'%d' % value
+    return str(value).encode()
+
+
+def compact_value(value):
+    """
+    Return the form a string value is stored in. Values that are the
+    canonical decimal form of a 64 bit integer become ints, as with Redis's
+    int encoding, so INCR needs no parsing, and small ones and short strings
+    are shared rather than stored once per key. Other values are returned
+    as they are. to_bytes gives back the original bytes.
+    """
+    if type(value) is int:
+        return _SHARED_INTEGERS[value] if 0 <= value < SHARED_INTEGERS else value
+    if type(value) is not bytes:
+        return value
+
+    size = len(value)
+    if size <= 20 and size and value[0] in _INTEGER_START:
+        try:
+            number = int(value)
+        except ValueError:
+            pass
+        else:
+            if b'%d' % number == value and -2 ** 63 <= number < 2 ** 63:
+                return _SHARED_INTEGERS[number] if 0 <= number < SHARED_INTEGERS else number
+
+    if size <= SHARED_STRING_MAX_SIZE:
+        shared = _shared_strings.get(value)
+        if shared is not None:
+            return shared
+        if len(_shared_strings) < SHARED_STRINGS_LIMIT:
+            _shared_strings[value] = value
+    return value
+
+
+def value_memory_usage(value):
+    """Estimate the bytes used by a stored value."""
+    # Checked first and sized without a call to sys.getsizeof, as this runs
+    # for every write.
+    if type(value) is bytes:
+        size = len(value)
+        if size <= SHARED_STRING_MAX_SIZE and _shared_strings.get(value) is value:
+            return 0
+        return size + _BYTES_OVERHEAD
+    if type(value) is int and 0 <= value < SHARED_INTEGERS:
+        return 0
+    if isinstance(value, _COLLECTIONS):
+        return value.memory_usage()
+    return sys.getsizeof(value)
+
+
+def _integer_value(value):
+    """Return the stored value as a 64 bit integer, raising TypeError or ValueError if it isn't one."""
+    if type(value) is int:
+        return value
+    if isinstance(value, _COLLECTIONS):
+        raise TypeError
+    number = int(value)
+    if not -2 ** 63 <= number < 2 ** 63:
+        raise ValueError(value)
+    return number
+
+
+def lru_clock():
+    """The time, in milliseconds of an arbitrary clock, recorded as a key's last access under LRU policies."""
+    return monotonic_ns() // 1_000_000
+
+
+def _lfu_minutes():
+    return monotonic_ns() // 60_000_000_000
+
+
+def lfu_counter(access, now=None):
+    """
+    Return the LFU counter packed in access, the minute of the last access
+    shifted left by 8 bits and the counter, decayed to minute now.
+    """
+    if now is None:
+        now = _lfu_minutes()
+    counter = access & 255
+    if LFU_DECAY_TIME:
+        counter -= (now - (access >> 8)) // LFU_DECAY_TIME
+    return max(counter, 0)
+
+
+def lfu_access(access=None):
+    """Return access updated for an access now, or the value for a new key if it is None."""
+    now = _lfu_minutes()
+    if access is None:
+        counter = LFU_INIT_VAL
+    else:
+        counter = lfu_counter(access, now)
+        if counter < 255 and random() * (max(counter - LFU_INIT_VAL, 0) * LFU_LOG_FACTOR + 1) < 1:
+            counter += 1
+    return now << 8 | counter
 
 
 class Datastore:
     """
     The core data store, provides a thread safe dictionary extended with
     the interface needed to support Redis functionality.
+
+    Values are stored in the dictionary as they are, without a wrapper, and
+    the expiry times of keys with a TTL are kept in a side table, as Redis
+    keeps its expires dictionary. Strings go through compact_value.
+
+    Access is guarded by a set of lock stripes rather than a single lock, the
+    stripe for a key is chosen by its hash so that threads working on
+    different keys rarely contend. Operations on several keys take their
+    stripes in index order to avoid deadlocks.
+
+    When every access comes from a single thread, such as an asyncio event
+    loop, pass thread_safe=False to skip locking altogether.
+
+    used_memory is a running estimate of the bytes used by the keys, values
+    and TTLs, not by the process as a whole. Once it is over maxmemory,
+    evict removes keys as maxmemory_policy says, choosing each one from a
+    sample of maxmemory_samples keys rather than scanning them all, as
+    Redis does, except under volatile-ttl, where the expiry heap already
+    gives the key with the nearest expiry. For that the store keeps, while
+    the policy needs them, the time of the last access or an LFU counter of
+    every key in a side table, and a list of the keys to sample from. Keys
+    are not removed from that list when deleted, they are dropped when
+    sampled, and the list is rebuilt if it grows to twice the number of
+    keys.
     """
 
-    def __init__(self, initial_data=None):
+    def __init__(
+        self, initial_data=None, lock_stripes=DEFAULT_LOCK_STRIPES, thread_safe=True,
+        maxmemory=0, maxmemory_policy=NOEVICTION,
+    ):
         self._data = dict()
-        self._lock = Lock()
+        # Absolute expiry in nanoseconds of each key with a TTL.
+        self._expires = dict()
+        self._locks = [Lock() for _ in range(lock_stripes)] if thread_safe else []
+        # Min-heap of (expiry, key) for keys with a TTL. Entries are not
+        # removed when a key is overwritten or deleted, instead they are
+        # skipped when popped and compacted away once they outnumber the
+        # live ones.
+        self._expiry_heap = []
+        self._expiry_lock = Lock() if thread_safe else _NO_LOCK
+        self._stale_expiries = 0
+        # Keys removed because their TTL passed that the AOF has still to
+        # log a DEL for, None unless track_expired has been called.
+        self.pending_expired = None
+        self._eviction_lock = Lock() if thread_safe else _NO_LOCK
+        # Guards used_memory and the INFO counters below, which threads
+        # holding different stripes all update.
+        self._counter_lock = Lock() if thread_safe else _NO_LOCK
+        # The memory limit in bytes, 0 for none.
+        self.maxmemory = maxmemory
+        self.maxmemory_samples = MAXMEMORY_SAMPLES
+        self.used_memory = 0
+        # For INFO: keys deleted because their TTL passed or to free memory,
+        # and reads that found their key or did not.
+        self.expired_keys = 0
+        self.evicted_keys = 0
+        self.keyspace_hits = 0
+        self.keyspace_misses = 0
+        if not thread_safe:
+            self._lock_for = self._locks_for = _no_lock
+            # Lock free versions of the hottest counter updates, as the
+            # no-op context manager has a cost of its own.
+            self._add_memory = self._add_memory_unlocked
+            self._lookup = self._lookup_unlocked
         if initial_data:
             if not isinstance(initial_data, dict):
                 raise TypeError('Initial Data should be of type dict')
 
             for key, value in initial_data.items():
-                self._data[key] = DataEntry(value)
+                self._data[key] = value
+                self._add_memory(self._entry_size(key, value))
+        # Sets up _access and _eviction_keys.
+        self.maxmemory_policy = maxmemory_policy
 
-    def __getitem__(self, key):
-        with self._lock:
-            item = self._data[key]
+    @property
+    def maxmemory_policy(self):
+        return self._maxmemory_policy
+
+    @maxmemory_policy.setter
+    def maxmemory_policy(self, policy):
+        if policy not in MAXMEMORY_POLICIES:
+            raise ValueError(f'unknown maxmemory policy {policy!r}')
+        self._maxmemory_policy = policy
+        self._lfu = policy == ALLKEYS_LFU
+
+        # The last access time or LFU counter of each key, only kept while
+        # the policy uses them. Keys there already count as accessed now.
+        if policy in (ALLKEYS_LRU, ALLKEYS_LFU, VOLATILE_LRU):
+            self._access = dict.fromkeys(self._data, lfu_access() if self._lfu else lru_clock())
+        else:
+            self._access = None
+        # Keys for allkeys policies to sample, volatile ones sample the expiry heap.
+        self._eviction_keys = list(self._data) if policy in (ALLKEYS_LRU, ALLKEYS_LFU) else None
+        self._eviction_pool = {}
+
+    def reset_stats(self):
+        """Zero the counters reported by INFO, as CONFIG RESETSTAT does."""
+        self.expired_keys = self.evicted_keys = 0
+        self.keyspace_hits = self.keyspace_misses = 0
+
+    def _add_memory(self, delta):
+        with self._counter_lock:
+            self.used_memory += delta
+
+    def _add_memory_unlocked(self, delta):
+        self.used_memory += delta
+
+    def _lock_for(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+    def _locks_for(self, keys):
+        stripes = len(self._locks)
+        indexes = sorted({hash(key) % stripes for key in keys})
+
+        if len(indexes) == 1:
+            return self._locks[indexes[0]]
+
+        stack = ExitStack()
+        for index in indexes:
+            stack.enter_context(self._locks[index])
+        return stack
+
+    def _get_value(self, key):
+        """Return the value of key if it is live, expiring it if needed, else None. Caller holds the lock."""
+        value = self._data.get(key)
+        if value is None:
+            return None
+
+        if self._expires:
+            expiry = self._expires.get(key)
+            if expiry is not None and expiry < time_ns():
+                self._delete_entry(key)
+                with self._counter_lock:
+                    self.expired_keys += 1
+                if self.pending_expired is not None:
+                    with self._expiry_lock:
+                        self.pending_expired.append(key)
+                return None
+
+        if self._access is not None:
+            self._touch(key)
+        return value
+
+    def _lookup(self, key):
+        """_get_value for a read, counted as a keyspace hit or miss. Caller holds the lock."""
+        value = self._get_value(key)
+        with self._counter_lock:
+            if value is None:
+                self.keyspace_misses += 1
+            else:
+                self.keyspace_hits += 1
+        return value
+
+    def _lookup_unlocked(self, key):
+        value = self._get_value(key)
+        if value is None:
+            self.keyspace_misses += 1
+        else:
+            self.keyspace_hits += 1
+        return value
+
+    def _touch(self, key):
+        """Record an access to key for LRU or LFU eviction. Caller holds the lock."""
+        if self._lfu:
+            self._access[key] = lfu_access(self._access.get(key))
+        else:
+            self._access[key] = lru_clock()
+
+    @staticmethod
+    def _entry_size(key, value):
+        return DICT_ENTRY_OVERHEAD + sys.getsizeof(key) + value_memory_usage(value)
 
-            if item.expiry and item.expiry < time_ns():
-                del self._data[key]
-                raise KeyError
+    def entries(self):
+        """
+        Yield (key, value, expiry) for every live key, expiry is 0 for keys
+        without a TTL. No locks are taken, so this is for use where nothing
+        else can write to the store, such as a forked child process.
+        """
+        now = time_ns()
+        expires = self._expires
+        for key, value in self._data.items():
+            expiry = expires.get(key, 0) if expires else 0
+            if not expiry or expiry >= now:
+                yield key, value, expiry
 
-            return item.value
+    def __len__(self):
+        """The number of keys, including any that have expired but not been removed yet."""
+        return len(self._data)
+
+    @property
+    def expiring_keys(self):
+        """The number of keys with a TTL."""
+        return len(self._expires)
+
+    def __getitem__(self, key):
+        """
+        Return the value of key, strings stored as ints by compact_value
+        as bytes again. Raises KeyError if there is none.
+        """
+        with self._lock_for(key):
+            value = self._lookup(key)
+
+        if value is None:
+            raise KeyError(key)
+        if type(value) is int:
+            return b'%d' % value
+        return value
 
     def __setitem__(self, key, value):
-        with self._lock:
-            self._data[key] = DataEntry(value)
+        value = compact_value(value)
+        with self._lock_for(key):
+            self._replace_entry(key, value)
+
+    def _replace_entry(self, key, value):
+        """Store value under key, dropping any TTL it had. Caller holds the lock."""
+        data = self._data
+        expires = self._expires
+        old = data.get(key)
+        if old is None:
+            size = DICT_ENTRY_OVERHEAD + sys.getsizeof(key)
+        else:
+            size = -value_memory_usage(old)
+        if expires and expires.pop(key, None) is not None:
+            with self._expiry_lock:
+                self._stale_expiries += 1
+            size -= EXPIRY_ENTRY_SIZE
+
+        data[key] = value
+        self._add_memory(size + value_memory_usage(value))
+        if old is None and self._eviction_keys is not None:
+            self._add_eviction_key(key)
+        if self._access is not None:
+            self._touch(key)
+
+    def _set_expiry(self, key, expiry):
+        """Give key, just stored by _replace_entry, an absolute expiry in nanoseconds. Caller holds the lock."""
+        self._expires[key] = expiry
+        self._add_memory(EXPIRY_ENTRY_SIZE)
+        with self._expiry_lock:
+            heappush(self._expiry_heap, (expiry, key))
+
+    def _update_value(self, key, old, value):
+        """Replace the value old of key with value, keeping its TTL. Caller holds the lock."""
+        self._data[key] = value
+        self._add_memory(value_memory_usage(value) - value_memory_usage(old))
+
+    def _add_eviction_key(self, key):
+        with self._eviction_lock:
+            keys = self._eviction_keys
+            keys.append(key)
+            if len(keys) > 2 * len(self._data) + 1024:
+                # Mostly keys deleted since, or added again after that.
+                keys[:] = self._data
+
+    def exists(self, keys):
+        """Return how many of keys exist, a key given twice is counted twice."""
+        with self._locks_for(keys):
+            return sum(1 for key in keys if self._lookup(key) is not None)
+
+    def delete(self, keys):
+        """Delete keys and return how many of them existed."""
+        count = 0
+        with self._locks_for(keys):
+            for key in keys:
+                if self._get_value(key) is not None:
+                    self._delete_entry(key)
+                    count += 1
+        return count
+
+    def mget(self, keys):
+        """
+        Return the values of keys as __getitem__ does, None for keys that
+        don't exist or hold a list, hash, set or sorted set. The locks are
+        taken once for them all.
+        """
+        with self._locks_for(keys):
+            values = [self._lookup(key) for key in keys]
+
+        return [
+            b'%d' % value if type(value) is int else None if isinstance(value, _COLLECTIONS) else value
+            for value in values
+        ]
+
+    def mset(self, items):
+        """Store each (key, value) of items as __setitem__ does, taking the locks once for them all."""
+        items = [(key, compact_value(value)) for key, value in items]
+        with self._locks_for([key for key, _ in items]):
+            for key, value in items:
+                self._replace_entry(key, value)
+
+    def msetnx(self, items):
+        """
+        As mset, but only if none of the keys exist. Returns whether the
+        values were stored. Nothing can write to the keys between the check
+        and the stores.
+        """
+        items = [(key, compact_value(value)) for key, value in items]
+        keys = [key for key, _ in items]
+        with self._locks_for(keys):
+            if any(self._get_value(key) is not None for key in keys):
+                return False
+            for key, value in items:
+                self._replace_entry(key, value)
+        return True
 
     def incr(self, key):
-        with self._lock:
-            item = self._data.get(key, DataEntry(0))
-            value = int(item.value) + 1
-            item.value = str(value)
-            self._data[key] = item
+        """
+        Add 1 to the integer at key, starting from 0 if there is none, and
+        return the result. Raises TypeError if key holds a list, hash, set or
+        sorted set, ValueError if it doesn't hold a 64 bit integer and
+        OverflowError if the result would not fit in 64 bits.
+        """
+        with self._lock_for(key):
+            old = self._get_value(key)
+            if old is None:
+                self._replace_entry(key, 1)
+                return 1
+            value = _integer_value(old) + 1
+            if value >= 2 ** 63:
+                raise OverflowError
+            # The TTL, if any, is kept.
+            self._update_value(key, old, compact_value(value))
         return value
 
     def decr(self, key):
-        with self._lock:
-            value = int(self._data.get(key, DataEntry(0)).value) - 1
-            self._data[key].value = str(value)
+        """As incr, but subtracting 1 and raising KeyError if there is no key."""
+        with self._lock_for(key):
+            old = self._get_value(key)
+            if old is None:
+                raise KeyError(key)
+            value = _integer_value(old) - 1
+            if value < -2 ** 63:
+                raise OverflowError
+            self._update_value(key, old, compact_value(value))
+        return value
+
+    def memory_usage(self, key):
+        """
+        Estimate the bytes used by key and its value, as MEMORY USAGE does,
+        or return None if there is no such key.
+        """
+        with self._lock_for(key):
+            value = self._get_value(key)
+            if value is None:
+                return None
+
+            usage = self._entry_size(key, value)
+            if key in self._expires:
+                usage += EXPIRY_ENTRY_SIZE
+            return usage
+
+    def _get_typed(self, key, kind, create=False, read=False):
+        """
+        Return the value of type kind stored at key, or None if there is
+        none, creating an empty one if create is True. Raises TypeError if
+        key holds another type. read counts the lookup as a keyspace hit or
+        miss. Caller holds the lock.
+        """
+        value = self._lookup(key) if read else self._get_value(key)
+
+        if value is None:
+            if not create:
+                return None
+            value = kind()
+            self._replace_entry(key, value)
+        elif not isinstance(value, kind):
+            raise TypeError
+
         return value
 
-    def append(self, key, value):
-        with self._lock:
-            item = self._data.get(key, DataEntry(deque()))
-            if not isinstance(item.value, deque):
-                raise TypeError
-            item.value.append(value)
-            self._data[key] = item
-            return len(item.value)
+    def _get_list(self, key, create=False, read=False):
+        return self._get_typed(key, QuickList, create, read)
+
+    def _get_hash(self, key, create=False, read=False):
+        return self._get_typed(key, Hash, create, read)
+
+    def _get_set(self, key, create=False, read=False):
+        return self._get_typed(key, Set, create, read)
+
+    def _get_sorted_set(self, key, create=False, read=False):
+        return self._get_typed(key, SortedSet, create, read)
+
+    def _delete_entry(self, key):
+        """Remove key, which must exist. Caller holds the lock."""
+        size = self._entry_size(key, self._data.pop(key))
+        if self._expires and self._expires.pop(key, None) is not None:
+            with self._expiry_lock:
+                self._stale_expiries += 1
+            size += EXPIRY_ENTRY_SIZE
+        self._add_memory(-size)
+        if self._access is not None:
+            self._access.pop(key, None)
+
+    def append(self, key, *values):
+        with self._lock_for(key):
+            items = self._get_list(key, create=True)
+            before = items.memory_usage()
+            for value in values:
+                items.append(value)
+            self._add_memory(items.memory_usage() - before)
+            return len(items)
+
+    def prepend(self, key, *values):
+        with self._lock_for(key):
+            items = self._get_list(key, create=True)
+            before = items.memory_usage()
+            for value in values:
+                items.appendleft(value)
+            self._add_memory(items.memory_usage() - before)
+            return len(items)
+
+    def _pop(self, key, count, left):
+        with self._lock_for(key):
+            items = self._get_list(key)
+            if items is None:
+                return None
+
+            before = items.memory_usage()
+            pop = items.popleft if left else items.pop
+            if count is None:
+                result = pop()
+            else:
+                result = [pop() for _ in range(min(count, len(items)))]
+            self._add_memory(items.memory_usage() - before)
+
+            if not items:
+                self._delete_entry(key)
+            return result
+
+    def lpop(self, key, count=None):
+        """
+        Remove and return the first element, or a list of the first count
+        elements if count is given. Returns None if the key does not exist.
+        """
+        return self._pop(key, count, left=True)
+
+    def rpop(self, key, count=None):
+        """As lpop, but from the end of the list."""
+        return self._pop(key, count, left=False)
+
+    def llen(self, key):
+        with self._lock_for(key):
+            items = self._get_list(key, read=True)
+            return len(items) if items is not None else 0
+
+    def lindex(self, key, index):
+        with self._lock_for(key):
+            items = self._get_list(key, read=True)
+            if items is None:
+                return None
+            try:
+                return items[index]
+            except IndexError:
+                return None
+
+    def lset(self, key, index, value):
+        """Raises KeyError if there is no list at key and IndexError if index is out of range."""
+        with self._lock_for(key):
+            items = self._get_list(key)
+            if items is None:
+                raise KeyError(key)
+            before = items.memory_usage()
+            items[index] = value
+            self._add_memory(items.memory_usage() - before)
 
     def lrange(self, key, start, stop):
-        with self._lock:
-            item = self._data.get(key, DataEntry(deque()))
-            if not isinstance(item.value, deque):
-                raise TypeError
-
-            return list(islice(item.value, start, stop))
-
-    def prepend(self, key, value):
-        with self._lock:
-            item = self._data.get(key, DataEntry(deque()))
-            print("HERE")
-            if not isinstance(item.value, deque):
-                print(item.value)
-                raise TypeError
-            print("HERE 2")
-            item.value.insert(0, value)
-            self._data[key] = item
-            return len(item.value)
+        with self._lock_for(key):
+            items = self._get_list(key, read=True)
+            return items.range(start, stop) if items is not None else []
+
+    def ltrim(self, key, start, stop):
+        with self._lock_for(key):
+            items = self._get_list(key)
+            if items is not None:
+                before = items.memory_usage()
+                items.trim(start, stop)
+                self._add_memory(items.memory_usage() - before)
+                if not items:
+                    self._delete_entry(key)
+
+    def hset(self, key, items):
+        """Set each (field, value) of items in the hash at key, returning how many fields are new."""
+        with self._lock_for(key):
+            fields = self._get_hash(key, create=True)
+            before = fields.memory_usage()
+            added = 0
+            for field, value in items:
+                added += fields.set(field, value)
+            self._add_memory(fields.memory_usage() - before)
+            return added
+
+    def hget(self, key, field):
+        with self._lock_for(key):
+            fields = self._get_hash(key, read=True)
+            return fields.get(field) if fields is not None else None
+
+    def hmget(self, key, fields):
+        """Return the value of each of fields, None for those not in the hash."""
+        with self._lock_for(key):
+            hash_ = self._get_hash(key, read=True)
+            if hash_ is None:
+                return [None] * len(fields)
+            return [hash_.get(field) for field in fields]
+
+    def hgetall(self, key):
+        """Return a list of the (field, value) pairs of the hash at key."""
+        with self._lock_for(key):
+            fields = self._get_hash(key, read=True)
+            return fields.items() if fields is not None else []
+
+    def hdel(self, key, fields):
+        """Remove fields from the hash at key, returning how many were there. An emptied hash is deleted."""
+        with self._lock_for(key):
+            hash_ = self._get_hash(key)
+            if hash_ is None:
+                return 0
+            before = hash_.memory_usage()
+            removed = sum(hash_.delete(field) for field in fields)
+            self._add_memory(hash_.memory_usage() - before)
+            if not hash_:
+                self._delete_entry(key)
+            return removed
+
+    def hincrby(self, key, field, increment):
+        """
+        Add increment to the integer in field, a missing field counting as
+        0, and return the result. Raises ValueError if the field does not
+        hold an integer and OverflowError if the result would not fit in
+        64 bits.
+        """
+        with self._lock_for(key):
+            fields = self._get_hash(key, create=True)
+            old = fields.get(field)
+            if old is None:
+                value = increment
+            else:
+                value = int(old)
+                if b'%d' % value != old:
+                    raise ValueError(old)
+                value += increment
+            if not -2 ** 63 <= value < 2 ** 63:
+                raise OverflowError
+            before = fields.memory_usage()
+            fields.set(field, b'%d' % value)
+            self._add_memory(fields.memory_usage() - before)
+        return value
+
+    def hlen(self, key):
+        with self._lock_for(key):
+            fields = self._get_hash(key, read=True)
+            return len(fields) if fields is not None else 0
+
+    def hscan(self, key, cursor, count):
+        """Return the next cursor, 0 once done, and the next (field, value) pairs of the hash at key."""
+        with self._lock_for(key):
+            fields = self._get_hash(key, read=True)
+            if fields is None:
+                return 0, []
+            # The first scan of a large hash gives it a field order to walk.
+            before = fields.memory_usage()
+            result = fields.scan(cursor, count)
+            self._add_memory(fields.memory_usage() - before)
+            return result
+
+    def sadd(self, key, members):
+        """Add members to the set at key, returning how many were not already in it."""
+        with self._lock_for(key):
+            set_ = self._get_set(key, create=True)
+            before = set_.memory_usage()
+            added = sum(set_.add(member) for member in members)
+            self._add_memory(set_.memory_usage() - before)
+            return added
+
+    def srem(self, key, members):
+        """Remove members from the set at key, returning how many were in it. An emptied set is deleted."""
+        with self._lock_for(key):
+            set_ = self._get_set(key)
+            if set_ is None:
+                return 0
+            before = set_.memory_usage()
+            removed = sum(set_.remove(member) for member in members)
+            self._add_memory(set_.memory_usage() - before)
+            if not set_:
+                self._delete_entry(key)
+            return removed
+
+    def sismember(self, key, member):
+        with self._lock_for(key):
+            set_ = self._get_set(key, read=True)
+            return set_ is not None and member in set_
+
+    def smembers(self, key):
+        with self._lock_for(key):
+            set_ = self._get_set(key, read=True)
+            return list(set_) if set_ is not None else []
+
+    def scard(self, key):
+        with self._lock_for(key):
+            set_ = self._get_set(key, read=True)
+            return len(set_) if set_ is not None else 0
+
+    def sinter(self, keys):
+        """
+        Return the members of every one of the sets at keys, a missing key
+        being an empty set. Only the smallest set is walked, each of its
+        members looked up in the others.
+        """
+        with self._locks_for(keys):
+            sets = [self._get_set(key, read=True) for key in keys]
+            if None in sets:
+                return []
+            sets.sort(key=len)
+            smallest, others = sets[0], sets[1:]
+            return [member for member in smallest if all(member in other for other in others)]
+
+    def sunion(self, keys):
+        """Return the members of any of the sets at keys."""
+        with self._locks_for(keys):
+            union = set()
+            for key in keys:
+                set_ = self._get_set(key, read=True)
+                if set_ is not None:
+                    union.update(set_)
+            return list(union)
+
+    def zadd(self, key, items, nx=False, xx=False, gt=False, lt=False):
+        """
+        Add each (member, score) of items to the sorted set at key, or move
+        a member already there to score, with ZADD's options: nx only adds
+        new members, xx only updates existing ones, and gt and lt only
+        update a member if its score would increase or decrease. Returns
+        how many members were added and how many added or changed.
+        """
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, create=not xx)
+            if zset is None:
+                return 0, 0
+
+            before = zset.memory_usage()
+            added = changed = 0
+            for member, score in items:
+                old = zset.score(member)
+                if old is None:
+                    if xx:
+                        continue
+                    added += 1
+                elif nx or (gt and score <= old) or (lt and score >= old) or score == old:
+                    continue
+                zset.add(member, score)
+                changed += 1
+            self._add_memory(zset.memory_usage() - before)
+            return added, changed
+
+    def zincrby(self, key, member, increment, nx=False, xx=False, gt=False, lt=False):
+        """
+        Add increment to the score of member, a missing member counting as
+        0, and return the new score, or None if the options given, as for
+        zadd, left it unchanged. Raises ValueError if the score would not
+        be a number.
+        """
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, create=not xx)
+            if zset is None:
+                return None
+
+            old = zset.score(member)
+            if (old is None and xx) or (old is not None and nx):
+                return None
+            score = increment if old is None else old + increment
+            if score != score:
+                raise ValueError('resulting score is not a number (NaN)')
+            if old is not None and ((gt and score <= old) or (lt and score >= old)):
+                return None
+
+            before = zset.memory_usage()
+            zset.add(member, score)
+            self._add_memory(zset.memory_usage() - before)
+            return score
+
+    def zrem(self, key, members):
+        """Remove members from the sorted set at key, returning how many were in it. An emptied one is deleted."""
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key)
+            if zset is None:
+                return 0
+            before = zset.memory_usage()
+            removed = sum(zset.remove(member) for member in members)
+            self._add_memory(zset.memory_usage() - before)
+            if not zset:
+                self._delete_entry(key)
+            return removed
+
+    def zscore(self, key, member):
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, read=True)
+            return zset.score(member) if zset is not None else None
+
+    def zcard(self, key):
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, read=True)
+            return len(zset) if zset is not None else 0
+
+    def zrank(self, key, member, reverse=False):
+        """Return the rank of member, lowest score first or highest if reverse, None if it is not there."""
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, read=True)
+            rank = zset.rank(member) if zset is not None else None
+            if rank is None or not reverse:
+                return rank
+            return len(zset) - 1 - rank
+
+    def zrange(self, key, start, stop, reverse=False):
+        """
+        Return the (member, score) pairs from rank start to stop inclusive,
+        as ZRANGE does, counting from the highest score if reverse.
+        """
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, read=True)
+            if zset is None:
+                return []
+            if not reverse:
+                return zset.range(start, stop)
+            # Ranks counted from the end map to size - 1 - rank from the start.
+            size = len(zset)
+            start, stop = normalise_range(start, stop, size)
+            return zset.slice(size - stop, size - start)[::-1]
+
+    def zrangebyscore(
+        self, key, minimum, maximum, exclude_minimum=False, exclude_maximum=False, reverse=False, offset=0, count=-1,
+    ):
+        """
+        Return the (member, score) pairs with scores from minimum to
+        maximum, each bound exclusive if the matching flag is set, highest
+        score first if reverse. offset pairs are skipped and, if count is
+        not negative, at most count returned, as with LIMIT.
+        """
+        with self._lock_for(key):
+            zset = self._get_sorted_set(key, read=True)
+            if zset is None:
+                return []
+            first, stop = zset.score_range(minimum, maximum, exclude_minimum, exclude_maximum)
+            if not reverse:
+                first += offset
+                return zset.slice(first, stop if count < 0 else min(stop, first + count))
+            stop -= offset
+            return zset.slice(first if count < 0 else max(first, stop - count), stop)[::-1]
 
     def set_with_expiry(self, key, value, expiry: int):
-        with self._lock:
-            calculated_expiry = time_ns() + to_ns(expiry)
-            self._data[key] = DataEntry(value, calculated_expiry)
+        value = compact_value(value)
+        with self._lock_for(key):
+            self._replace_entry(key, value)
+            self._set_expiry(key, time_ns() + to_ns(expiry))
+
+    def set_with_expiry_at(self, key, value, expiry):
+        """Store value under key to expire at expiry, an absolute time in nanoseconds that may have passed."""
+        value = compact_value(value)
+        with self._lock_for(key):
+            self._replace_entry(key, value)
+            self._set_expiry(key, expiry)
+
+    def load_entry(self, key, value, expiry=0):
+        """
+        Store value under key with an absolute expiry in nanoseconds, 0 for
+        none, as when loading a snapshot. Returns False, storing nothing, if
+        the expiry has already passed.
+        """
+        if expiry and expiry < time_ns():
+            return False
+
+        value = compact_value(value)
+        with self._lock_for(key):
+            self._replace_entry(key, value)
+            if expiry:
+                self._set_expiry(key, expiry)
+        return True
+
+    def remove_expired_keys(self, time_budget=ACTIVE_EXPIRE_TIME_BUDGET):
+        """
+        Delete keys whose TTL has passed, working through the expiry index in
+        expiry order so only keys that are due are touched. Stops early once
+        time_budget seconds have been spent, the rest is picked up on the
+        next call. Returns the number of keys removed.
+        """
+        now = time_ns()
+        deadline = now + to_ns(time_budget)
+        heap = self._expiry_heap
+        expired = []
+        count_checked = 0
 
-    def remove_expired_keys(self):
         while True:
-            try:
-                keys = sample(list(self._data.keys()), 20)
-            except ValueError:
+            with self._expiry_lock:
+                if not heap or heap[0][0] >= now:
+                    break
+                expiry, key = heappop(heap)
+
+            with self._lock_for(key):
+                if self._expires.get(key) == expiry:
+                    self._delete_entry(key)
+                    expired.append(key)
+            # The entry just popped was counted as stale, when its key was
+            # overwritten or by _delete_entry above.
+            with self._expiry_lock:
+                self._stale_expiries -= 1
+
+            count_checked += 1
+            if count_checked % 64 == 0 and time_ns() > deadline:
+                break
+
+        self._compact_expiry_heap()
+        with self._counter_lock:
+            self.expired_keys += len(expired)
+        if expired and self.pending_expired is not None:
+            with self._expiry_lock:
+                self.pending_expired += expired
+        return len(expired)
+
+    def track_expired(self):
+        """From now on keep the keys removed because their TTL passed, for take_expired."""
+        with self._expiry_lock:
+            if self.pending_expired is None:
+                self.pending_expired = []
+
+    def take_expired(self):
+        """Return the keys removed because their TTL passed since the last call, once tracked."""
+        with self._expiry_lock:
+            expired = self.pending_expired
+            if not expired:
+                return []
+            self.pending_expired = []
+            return expired
+
+    def _compact_expiry_heap(self, force=False):
+        with self._expiry_lock:
+            heap = self._expiry_heap
+            if not force and self._stale_expiries <= max(1024, len(heap) // 2):
                 return
 
-            count_expired = 0
-            count_keys = len(keys)
+            expires = self._expires
+            live = []
+            for expiry, key in heap:
+                if expires.get(key) == expiry:
+                    live.append((expiry, key))
+            heap[:] = live
+            heapify(heap)
+            self._stale_expiries = 0
+
+    def evict(self):
+        """
+        Evict keys, chosen as maxmemory_policy says, until used_memory is
+        within maxmemory, and return them. The store may still be over the
+        limit afterwards, if the policy is noeviction or finds no key it may
+        evict.
+        """
+        evicted = []
+        while self.used_memory > self.maxmemory:
+            key = self._eviction_candidate()
+            if key is None:
+                break
+            with self._lock_for(key):
+                if key in self._data:
+                    self._delete_entry(key)
+                    evicted.append(key)
+
+        with self._counter_lock:
+            self.evicted_keys += len(evicted)
+        return evicted
+
+    def _eviction_candidate(self):
+        """Return the key to evict, None if the policy allows none."""
+        policy = self._maxmemory_policy
+        if policy == NOEVICTION:
+            return None
+        if policy == VOLATILE_TTL:
+            return self._nearest_expiring_key()
+
+        access = self._access
+        if self._lfu:
+            now = _lfu_minutes()
+
+            def score(key):
+                return lfu_counter(access.get(key, 0), now)
+        else:
+            def score(key):
+                return access.get(key, 0)
 
+        data = self._data
+        count = max(self.maxmemory_samples, 1)
+        with self._eviction_lock:
+            # The best candidates seen so far and their scores, as in Redis's
+            # eviction pool. Merging each sample into it makes the choice
+            # much closer to true LRU or LFU than a sample alone.
+            pool = self._eviction_pool
+            keys = self._sample_keys(count) if self._eviction_keys is not None else self._sample_expiring_keys(count)
             for key in keys:
-                try:
-                    with self._lock:
-                        item = self._data[key]
-                        if item.expiry and item.expiry < int(time_ns()):
-                            del self._data[key]
-                            count_expired += 1
-                except KeyError:
-                    pass
-
-            if count_expired / count_keys <= 0.25:
+                if key in pool:
+                    continue
+                key_score = score(key)
+                if len(pool) < EVICTION_POOL_SIZE:
+                    pool[key] = key_score
+                    continue
+                worst = max(pool, key=pool.__getitem__)
+                if key_score < pool[worst]:
+                    del pool[worst]
+                    pool[key] = key_score
+
+            while pool:
+                key = min(pool, key=pool.__getitem__)
+                pooled_score = pool.pop(key)
+                # Skip keys deleted or accessed since they were pooled.
+                if key in data and score(key) == pooled_score:
+                    return key
+        return None
+
+    def _sample_keys(self, count):
+        """
+        Return up to count keys picked at random, dropping deleted keys from
+        the list sampled as they are met. Caller holds the eviction lock.
+        """
+        data = self._data
+        keys = self._eviction_keys
+        sample = []
+        while keys and len(sample) < count:
+            # Quicker than randrange, which shows up in the cost of a write.
+            index = int(random() * len(keys))
+            key = keys[index]
+            if key in data:
+                sample.append(key)
+            else:
+                keys[index] = keys[-1]
+                keys.pop()
+        return sample
+
+    def _sample_expiring_keys(self, count):
+        """Return up to count keys with a TTL picked at random from the expiry heap."""
+        expires = self._expires
+        for attempt in range(2):
+            sample = []
+            with self._expiry_lock:
+                heap = self._expiry_heap
+                # Stale heap entries can't be dropped here, so give up
+                # after a few draws rather than loop on a heap of mostly
+                # stale ones, and compact it before trying again.
+                for _ in range(4 * count):
+                    if not heap or len(sample) == count:
+                        break
+                    expiry, key = heap[int(random() * len(heap))]
+                    if expires.get(key) == expiry:
+                        sample.append(key)
+            if sample or not expires:
                 break
+            self._compact_expiry_heap(force=True)
+        return sample
+
+    def _nearest_expiring_key(self):
+        """Return the key whose TTL is nearest, from the top of the expiry heap."""
+        expires = self._expires
+        with self._expiry_lock:
+            heap = self._expiry_heap
+            while heap:
+                expiry, key = heap[0]
+                if expires.get(key) == expiry:
+                    return key
+                heappop(heap)
+                self._stale_expiries -= 1
+        return None
@@ -0,0 +1,181 @@
+import sys
+
+# Hashes with at most this many fields, none of them or their values longer
+# than HASH_MAX_LISTPACK_VALUE bytes, are kept in the compact encoding, as
+# with Redis's hash-max-listpack-entries and hash-max-listpack-value.
+HASH_MAX_LISTPACK_ENTRIES = 128
+HASH_MAX_LISTPACK_VALUE = 64
+
+ENCODING_LISTPACK = 'listpack'
+ENCODING_HASHTABLE = 'hashtable'
+
+# A scan cursor is the position to continue from in the low bits and the
+# number of times the field order was compacted above them.
+_CURSOR_POSITION_BITS = 32
+_CURSOR_POSITION_MASK = (1 << _CURSOR_POSITION_BITS) - 1
+_CURSOR_EPOCH_MASK = (1 << (63 - _CURSOR_POSITION_BITS)) - 1
+
+
+def _find(items, field):
+    """Return the index of field in a flat list of fields and values, -1 if it is not there."""
+    index = 0
+    try:
+        while True:
+            # list.index runs in C, a match at an odd index is a value.
+            index = items.index(field, index)
+            if not index & 1:
+                return index
+            index += 1
+    except ValueError:
+        return -1
+
+
+class Hash:
+    """
+    The hash type. A small hash is a flat list of alternating fields and
+    values, like Redis's listpack: a lookup is a scan, which for so few
+    fields costs about as much as hashing, and each field takes two list
+    slots rather than a dict entry. Once it grows past
+    HASH_MAX_LISTPACK_ENTRIES fields or is given a field or value longer
+    than HASH_MAX_LISTPACK_VALUE it is converted to a dict for good, as
+    Redis never converts a hash back.
+
+    Once HSCAN is used on a converted hash it also keeps a list of its
+    fields in insertion order for the scan to walk. Deleted fields are left
+    in it, so the position of every other field stays put, until they
+    outnumber the live ones and the list is rebuilt from the dict.
+    """
+
+    __slots__ = ('_items', '_element_bytes', '_order', '_epoch')
+
+    def __init__(self, items=()):
+        # The flat list, or the dict once converted.
+        self._items = []
+        # The fields of a scanned hash in the order they were added, with
+        # ones deleted since, and how many times it has been rebuilt.
+        self._order = None
+        self._epoch = 0
+        # Total sys.getsizeof of the fields and values, kept up to date so
+        # the size of the hash is known without walking it.
+        self._element_bytes = 0
+        for field, value in items:
+            self.set(field, value)
+
+    @property
+    def encoding(self):
+        return ENCODING_HASHTABLE if type(self._items) is dict else ENCODING_LISTPACK
+
+    def __len__(self):
+        items = self._items
+        return len(items) if type(items) is dict else len(items) // 2
+
+    def __eq__(self, other):
+        if not isinstance(other, Hash):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return f'Hash({self.items()!r})'
+
+    def memory_usage(self):
+        """Estimate the bytes used by the hash, its list or dict and its fields and values."""
+        order = sys.getsizeof(self._order) if self._order is not None else 0
+        return sys.getsizeof(self) + sys.getsizeof(self._items) + order + self._element_bytes
+
+    def get(self, field):
+        """Return the value of field, None if there is no such field."""
+        items = self._items
+        if type(items) is dict:
+            return items.get(field)
+        index = _find(items, field)
+        return items[index + 1] if index >= 0 else None
+
+    def set(self, field, value):
+        """Set field to value, returning True if it is a new field."""
+        items = self._items
+        if type(items) is not dict:
+            index = _find(items, field)
+            if index >= 0:
+                old = items[index + 1]
+                if len(value) <= HASH_MAX_LISTPACK_VALUE:
+                    items[index + 1] = value
+                    self._element_bytes += sys.getsizeof(value) - sys.getsizeof(old)
+                    return False
+            elif (
+                len(items) < 2 * HASH_MAX_LISTPACK_ENTRIES
+                and len(field) <= HASH_MAX_LISTPACK_VALUE
+                and len(value) <= HASH_MAX_LISTPACK_VALUE
+            ):
+                items += (field, value)
+                self._element_bytes += sys.getsizeof(field) + sys.getsizeof(value)
+                return True
+            items = self._items = dict(zip(items[::2], items[1::2]))
+
+        old = items.get(field)
+        items[field] = value
+        if old is None:
+            if self._order is not None:
+                self._order.append(field)
+            self._element_bytes += sys.getsizeof(field) + sys.getsizeof(value)
+            return True
+        self._element_bytes += sys.getsizeof(value) - sys.getsizeof(old)
+        return False
+
+    def delete(self, field):
+        """Remove field, returning whether it was there."""
+        items = self._items
+        if type(items) is dict:
+            value = items.pop(field, None)
+            if value is None:
+                return False
+            if self._order is not None and len(self._order) > 2 * len(items) + HASH_MAX_LISTPACK_ENTRIES:
+                # Cursors from before this point restart, see scan.
+                self._order = list(items)
+                self._epoch = (self._epoch + 1) & _CURSOR_EPOCH_MASK
+        else:
+            index = _find(items, field)
+            if index < 0:
+                return False
+            value = items[index + 1]
+            del items[index:index + 2]
+        self._element_bytes -= sys.getsizeof(field) + sys.getsizeof(value)
+        return True
+
+    def items(self):
+        """Return a list of (field, value) pairs."""
+        items = self._items
+        if type(items) is dict:
+            return list(items.items())
+        return list(zip(items[::2], items[1::2]))
+
+    def scan(self, cursor, count):
+        """
+        Return the cursor to continue from, 0 once done, and the next
+        (field, value) pairs from cursor, as HSCAN does. A compact hash is
+        returned whole, like Redis does for a listpack. A converted one is
+        walked count fields at a time through its field order, skipping
+        deleted fields, so every field present for the whole scan is
+        returned. A cursor from before the order was last rebuilt starts
+        over, which may return some fields twice, as Redis may too.
+        """
+        items = self._items
+        if type(items) is not dict:
+            return 0, self.items()
+
+        order = self._order
+        if order is None:
+            order = self._order = list(items)
+        position = cursor & _CURSOR_POSITION_MASK
+        if cursor >> _CURSOR_POSITION_BITS != self._epoch:
+            position = 0
+        pairs = []
+        while position < len(order) and len(pairs) < count:
+            field = order[position]
+            position += 1
+            value = items.get(field)
+            if value is not None:
+                pairs.append((field, value))
+
+        if position >= len(order):
+            return 0, pairs
+        return (self._epoch << _CURSOR_POSITION_BITS) | position, pairs
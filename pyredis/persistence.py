@@ -1,41 +1,737 @@
-from pyredis.commands import handle_command
-from pyredis.protocol import extract_frame_from_buffer
+import asyncio
+import gc
+import mmap
+import os
+from functools import partial
+from threading import Event, Lock, Thread
+
+from pyredis.commands import execute_command
+from pyredis.datastore import Datastore, to_bytes
+from pyredis.hash import Hash
+from pyredis.quicklist import QuickList
+from pyredis.set import Set
+from pyredis.snapshot import (
+    MAGIC, CorruptSnapshotError, is_snapshot, load_snapshot, load_snapshot_data, read_snapshot_aux, snapshot_aux,
+    write_snapshot,
+)
+from pyredis.stats import LatencyTimer
 from pyredis.types import Error
+from pyredis.zset import SortedSet, format_score
+
+APPENDFSYNC_ALWAYS = 'always'
+APPENDFSYNC_EVERYSEC = 'everysec'
+APPENDFSYNC_NO = 'no'
+APPENDFSYNC_POLICIES = (APPENDFSYNC_ALWAYS, APPENDFSYNC_EVERYSEC, APPENDFSYNC_NO)
+
+REWRITE_WRITE_SIZE = 1024 * 1024
+# Elements per command when a rewrite rebuilds a list, hash, set or sorted
+# set, so a large one is not held as a single command, as with Redis's
+# AOF_REWRITE_ITEMS_PER_CMD.
+REWRITE_ITEMS_PER_COMMAND = 64
+# A rewrite starts by itself once the AOF is this many percent larger than
+# after the last rewrite, and at least the minimum size, as with Redis'
+# auto-aof-rewrite-percentage and auto-aof-rewrite-min-size.
+AUTO_REWRITE_PERCENTAGE = 100
+AUTO_REWRITE_MIN_SIZE = 64 * 1024 * 1024
+LOAD_PROGRESS_INTERVAL = 64 * 1024 * 1024
+LOAD_WINDOW_SIZE = 4 * 1024 * 1024
+
+_ARRAY = ord('*')
+_BULK_STRING = ord('$')
+
+
+def encode_command(args):
+    """Encode a command given as a sequence of bytes arguments in RESP."""
+    encoded = bytearray(b'*%d\r\n' % len(args))
+    for arg in args:
+        encoded += b'$%d\r\n%b\r\n' % (len(arg), arg)
+    return encoded
+
+
+def _batched_commands(name, key, items):
+    """Yield the encoded commands name key item ... for items, REWRITE_ITEMS_PER_COMMAND at a time."""
+    for i in range(0, len(items), REWRITE_ITEMS_PER_COMMAND):
+        yield encode_command([name, key, *(arg for item in items[i:i + REWRITE_ITEMS_PER_COMMAND] for arg in item)])
+
+
+def rewrite_commands(datastore):
+    """
+    Yield the encoded commands that rebuild the current contents of
+    datastore: a SET, with the time it expires at, for each string, and RPUSH,
+    HSET, SADD or ZADD commands of up to REWRITE_ITEMS_PER_COMMAND elements
+    each for lists, hashes, sets and sorted sets.
+    """
+    for key, value, expiry in datastore.entries():
+        key = to_bytes(key)
+        if isinstance(value, QuickList):
+            yield from _batched_commands(b'RPUSH', key, [(to_bytes(v),) for v in value])
+        elif isinstance(value, Hash):
+            yield from _batched_commands(b'HSET', key, value.items())
+        elif isinstance(value, Set):
+            yield from _batched_commands(b'SADD', key, [(member,) for member in value])
+        elif isinstance(value, SortedSet):
+            yield from _batched_commands(b'ZADD', key, [(format_score(score), member) for member, score in value])
+        elif expiry:
+            yield encode_command([b'SET', key, to_bytes(value), b'PXAT', b'%d' % (expiry // 10 ** 6)])
+        else:
+            yield encode_command([b'SET', key, to_bytes(value)])
+
+
+def write_rewrite(datastore, filename):
+    """Write the commands from rewrite_commands to filename and fsync it."""
+    with open(filename, 'wb') as f:
+        buffer = bytearray()
+        for command in rewrite_commands(datastore):
+            buffer += command
+            if len(buffer) >= REWRITE_WRITE_SIZE:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _new_aof_id():
+    """A random id for an AOF, so a snapshot can record which AOF it was taken alongside."""
+    return os.urandom(20).hex()
+
+
+def read_aof_id(filename):
+    """
+    Return the id in the snapshot preamble of the AOF at filename, or None
+    if it has none, as a plain AOF or one that is missing or corrupt doesn't.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            if not is_snapshot(f.read(len(MAGIC))):
+                return None
+        return read_snapshot_aux(filename).get(b'aof-id')
+    except (FileNotFoundError, CorruptSnapshotError):
+        return None
 
 
 class AppendOnlyPersister:
-    def __init__(self, filename):
+    """
+    Appends write commands to the AOF. Commands are encoded into an in
+    memory buffer which is written out with a single write per flush: once
+    per event loop iteration when called from a running loop, or straight
+    away otherwise. Callers that need the data on disk before replying can
+    call flush themselves.
+
+    appendfsync follows Redis: 'always' fsyncs as part of every flush,
+    'everysec' fsyncs at most once a second from a background thread and
+    'no' leaves it to the operating system.
+
+    rewrite compacts the file in the background, as BGREWRITEAOF does: a
+    forked child writes the minimal set of commands for its copy-on-write
+    view of the store while writes made in the meantime are kept in a
+    rewrite buffer. Once the child is done the buffer is appended to its
+    file, which then atomically replaces the AOF. With snapshot_preamble the
+    child writes a binary snapshot rather than commands, so the rewritten
+    file is a snapshot followed by an AOF tail of the writes made since.
+    rewrite_if_needed starts a rewrite once the file has grown by
+    auto_rewrite_percentage since the last one, 0 turns that off.
+
+    save and background_save write a binary snapshot to snapshot_filename,
+    the latter from a forked child as well. Only one child runs at a time.
+    Every AOF written with a snapshot preamble gets a new random id in its
+    aux fields, which snapshots record along with how much of the AOF they
+    cover, so load_data can tell whether a snapshot belongs to the AOF it
+    finds. A new AOF, when there is a snapshot file, starts with a preamble
+    of datastore, the data loaded at startup, for the same reason. Against
+    a plain AOF, which has no id, snapshots are never matched.
+    """
+
+    def __init__(
+        self,
+        filename,
+        appendfsync=APPENDFSYNC_EVERYSEC,
+        snapshot_filename=None,
+        snapshot_preamble=True,
+        auto_rewrite_percentage=AUTO_REWRITE_PERCENTAGE,
+        auto_rewrite_min_size=AUTO_REWRITE_MIN_SIZE,
+        datastore=None,
+    ):
+        if appendfsync not in APPENDFSYNC_POLICIES:
+            raise ValueError(f'appendfsync must be one of {", ".join(APPENDFSYNC_POLICIES)}')
+
+        try:
+            new = os.path.getsize(filename) == 0
+        except FileNotFoundError:
+            new = True
+        if new and snapshot_filename is not None and snapshot_preamble:
+            self._aof_id = _new_aof_id()
+            aux = snapshot_aux(aof_preamble=1, aof_id=self._aof_id)
+            write_snapshot(Datastore() if datastore is None else datastore, filename, aux)
+        else:
+            self._aof_id = read_aof_id(filename)
+
         self._filename = filename
-        self._file = open(filename, mode="ab", buffering=0)
+        self._appendfsync = appendfsync
+        self._fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._buffer = bytearray()
+        self._lock = Lock()
+        self._flush_scheduled = False
+        self._unsynced = False
+        self._closed = Event()
+        self._fsync_thread = None
+        self._fsync_lock = Lock()
+        self._rewrite_buffer = None
+        self._child_thread = None
+        self._snapshot_filename = snapshot_filename
+        self._snapshot_preamble = snapshot_preamble
+        self._auto_rewrite_percentage = auto_rewrite_percentage
+        self._auto_rewrite_min_size = auto_rewrite_min_size
+        # Current size of the file and its size after the last rewrite, or
+        # when it was opened, which growth is measured against.
+        self._size = self._base_size = os.fstat(self._fd).st_size
+        # Bytes appended to the AOF since it was opened, for INFO.
+        self.bytes_written = 0
 
-    def log_command(self, command):
-        self._file.write(f"*{len(command)}\r\n".encode())
+        if appendfsync == APPENDFSYNC_EVERYSEC:
+            self._fsync_thread = Thread(target=self._fsync_every_second, daemon=True)
+            self._fsync_thread.start()
 
+    def log_command(self, command):
+        encoded = bytearray(b'*%d\r\n' % len(command))
         for item in command:
-            self._file.write(item.file_encode())
+            encoded += item.file_encode()
 
+        with self._lock:
+            self._buffer += encoded
+            if self._flush_scheduled:
+                return
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            else:
+                self._flush_scheduled = True
 
-def restore_from_file(filename, datastore):
-    buffer = bytearray()
+        if loop is None:
+            self.flush()
+        else:
+            loop.call_soon(self.flush)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._flush_scheduled = False
+        if not self._buffer:
+            return
+
+        _write_all(self._fd, self._buffer)
+        self._size += len(self._buffer)
+        self.bytes_written += len(self._buffer)
+        if self._rewrite_buffer is not None:
+            self._rewrite_buffer += self._buffer
+        self._buffer.clear()
+
+        if self._appendfsync == APPENDFSYNC_ALWAYS:
+            with LatencyTimer('aof-fsync-always'):
+                os.fsync(self._fd)
+        else:
+            self._unsynced = True
+
+    def _fsync_every_second(self):
+        while not self._closed.wait(1):
+            if self._unsynced:
+                self._unsynced = False
+                with self._fsync_lock:
+                    os.fsync(self._fd)
+
+    @property
+    def rewrite_in_progress(self):
+        return self._rewrite_buffer is not None
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def base_size(self):
+        return self._base_size
+
+    @property
+    def snapshot_filename(self):
+        return self._snapshot_filename
+
+    def _start_child(self, work, finish, *args):
+        """
+        Fork a child that runs work against its copy-on-write view of memory,
+        and reap it from a thread that then calls finish(pid, *args). Caller
+        holds the lock and has checked no other child is running.
+        """
+        with LatencyTimer('fork'):
+            pid = os.fork()
+
+        if pid == 0:
+            status = 1
+            try:
+                work()
+                status = 0
+            finally:
+                os._exit(status)
+
+        self._child_thread = Thread(target=finish, args=(pid, *args), daemon=True)
+        self._child_thread.start()
+
+    def rewrite(self, datastore):
+        """
+        Start a background rewrite of the AOF from datastore. Returns False if
+        a rewrite or background save is already running.
+        """
+        with self._lock:
+            if self._child_thread is not None:
+                return False
+
+            # Anything logged so far is already reflected in the store the
+            # child will see, so only later writes go to the rewrite buffer.
+            self._flush_locked()
+            temp_filename = f'{self._filename}.rewrite'
+            if self._snapshot_preamble:
+                aof_id = _new_aof_id()
+                aux = snapshot_aux(aof_preamble=1, aof_id=aof_id)
+                work = partial(write_snapshot, datastore, temp_filename, aux)
+            else:
+                aof_id = None
+                work = partial(write_rewrite, datastore, temp_filename)
+            self._start_child(work, self._finish_rewrite, temp_filename, aof_id)
+            self._rewrite_buffer = bytearray()
+            return True
+
+    def _finish_rewrite(self, pid, temp_filename, aof_id):
+        _, status = os.waitpid(pid, 0)
+
+        with self._lock:
+            try:
+                if os.waitstatus_to_exitcode(status) != 0:
+                    print("Error rewriting AOF file")
+                    return
+
+                self._flush_locked()
+                fd = os.open(temp_filename, os.O_WRONLY | os.O_APPEND)
+                _write_all(fd, self._rewrite_buffer)
+                os.fsync(fd)
+                os.replace(temp_filename, self._filename)
+
+                with self._fsync_lock:
+                    os.close(self._fd)
+                    self._fd = fd
+                self._aof_id = aof_id
+                self._size = self._base_size = os.fstat(fd).st_size
+            finally:
+                self._rewrite_buffer = None
+                self._child_thread = None
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+
+    def rewrite_if_needed(self, datastore):
+        """
+        Start a rewrite if the AOF has grown enough since the last one.
+        Meant to be called periodically, returns whether a rewrite started.
+        """
+        if not self._auto_rewrite_percentage or self._child_thread is not None:
+            return False
+        if self._size < self._auto_rewrite_min_size:
+            return False
+
+        base = self._base_size or 1
+        if (self._size - base) * 100 < self._auto_rewrite_percentage * base:
+            return False
+        return self.rewrite(datastore)
+
+    def _snapshot_aux_locked(self):
+        """
+        Flush the AOF and return the aux fields for a snapshot of the store as
+        it is now: the id of the AOF it was taken alongside and how much of
+        it the snapshot covers, so loading can resume from there.
+        """
+        self._flush_locked()
+        if self._aof_id is None:
+            return snapshot_aux()
+        return snapshot_aux(aof_id=self._aof_id, aof_offset=os.fstat(self._fd).st_size)
+
+    def save(self, datastore):
+        """
+        Write a snapshot of datastore in the foreground, as SAVE does. Returns
+        False if a background save or rewrite is running.
+        """
+        if self._snapshot_filename is None:
+            raise ValueError('no snapshot file configured')
+
+        with self._lock:
+            if self._child_thread is not None:
+                return False
+            write_snapshot(datastore, self._snapshot_filename, self._snapshot_aux_locked())
+            return True
+
+    def background_save(self, datastore):
+        """
+        Write a snapshot of datastore from a forked child, as BGSAVE does, so
+        the caller carries on serving requests. Returns False if a background
+        save or rewrite is already running.
+        """
+        if self._snapshot_filename is None:
+            raise ValueError('no snapshot file configured')
+
+        with self._lock:
+            if self._child_thread is not None:
+                return False
+            aux = self._snapshot_aux_locked()
+            self._start_child(partial(write_snapshot, datastore, self._snapshot_filename, aux), self._finish_save)
+            return True
+
+    def _finish_save(self, pid):
+        _, status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            print("Error writing snapshot")
+        with self._lock:
+            self._child_thread = None
+
+    def wait_for_child(self):
+        thread = self._child_thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        self.wait_for_child()
+        self.flush()
+        self._closed.set()
+        if self._fsync_thread:
+            self._fsync_thread.join()
+        if self._appendfsync != APPENDFSYNC_NO:
+            os.fsync(self._fd)
+        os.close(self._fd)
+
+
+def _write_all(fd, data):
+    with memoryview(data) as view:
+        written = 0
+        while written < len(view):
+            written += os.write(fd, view[written:])
+
+
+class CorruptAOFError(Exception):
+    pass
+
+
+def _read_command(data, offset):
+    """
+    Parse the command at offset in data, returning it as a list of raw byte
+    arguments along with the offset just past it, or None and offset if it
+    is truncated.
+    """
+    size = len(data)
+    if data[offset] != _ARRAY:
+        raise CorruptAOFError(f'expected an array at offset {offset}')
+
+    separator = data.find(b'\r\n', offset)
+    if separator == -1:
+        return None, offset
+    count = int(data[offset + 1:separator])
+    position = separator + 2
+    args = []
+
+    for _ in range(count):
+        if position >= size:
+            return None, offset
+        if data[position] != _BULK_STRING:
+            raise CorruptAOFError(f'expected a bulk string at offset {position}')
 
-    with open(filename, "rb") as f:
-        while True:
-            data = f.read(4096)
-            if not data:
+        separator = data.find(b'\r\n', position)
+        if separator == -1:
+            return None, offset
+        start = separator + 2
+        end = start + int(data[position + 1:separator])
+        if end + 2 > size:
+            return None, offset
+
+        args.append(data[start:end])
+        position = end + 2
+
+    return args, position
+
+
+def _split_commands(parts):
+    """
+    Group the CRLF separated parts of a window into commands. Returns the
+    commands, as lists of arguments, and the number of parts they used, or
+    None if the bulk string headers don't match the values that follow
+    them, which happens when a value itself contains CRLF.
+    """
+    complete = len(parts) - 1
+    commands = []
+    headers = []
+    values = []
+    i = 0
+
+    append = commands.append
+
+    try:
+        while i < complete:
+            header = parts[i]
+            if header[0] != _ARRAY:
                 break
+            end = i + 1 + 2 * int(header[1:])
+            if end > complete or end <= i + 1:
+                break
+
+            args = parts[i + 2:end:2]
+            headers += parts[i + 1:end:2]
+            values += args
+            append(args)
+            i = end
+    except (IndexError, ValueError):
+        pass
 
-            buffer.extend(data)
+    if not commands:
+        return None, 0
 
-            while True:
-                frame, frame_size = extract_frame_from_buffer(buffer)
+    # Check every header against its value in a handful of C level calls,
+    # rather than one at a time.
+    lengths = b''.join(headers).split(b'$')
+    if lengths[0] or len(lengths) != len(values) + 1:
+        return None, 0
+    try:
+        if list(map(int, lengths[1:])) != list(map(len, values)):
+            return None, 0
+    except ValueError:
+        return None, 0
+
+    return commands, i
+
+
+def _read_commands(data, offset=0):
+    """
+    Yield batches of commands from data, an AOF mapped into memory, each
+    command as a list of raw byte arguments, along with the offset just past
+    the batch. A truncated final command is ignored.
+
+    The file is read a window at a time and split on CRLF, so that most of
+    the parsing happens in C. If a window can't be parsed that way, because
+    a value contains CRLF or a command is larger than a window, half a
+    window's worth of commands is parsed exactly with _read_command instead.
+    """
+    size = len(data)
+
+    while offset < size:
+        parts = data[offset:offset + LOAD_WINDOW_SIZE].split(b'\r\n')
+        commands, used = _split_commands(parts)
+
+        if commands:
+            offset += sum(map(len, parts[:used])) + 2 * used
+            yield commands, offset
+            continue
+
+        commands = []
+        target = min(offset + LOAD_WINDOW_SIZE // 2, size)
+        while offset < target:
+            args, end = _read_command(data, offset)
+            if args is None:
+                break
+            commands.append(args)
+            offset = end
 
-                if frame:
-                    buffer = buffer[frame_size:]
-                    result = handle_command(frame, datastore)
+        if commands:
+            yield commands, offset
+        if offset < target:
+            return
+
+
+def _load_set(datastore, args):
+    if len(args) != 3:
+        return False
+    datastore[args[1]] = args[2]
+    return True
+
+
+def _load_mset(datastore, args):
+    if len(args) < 3 or len(args) % 2 == 0:
+        return False
+    datastore.mset(zip(args[1::2], args[2::2]))
+    return True
+
+
+def _load_incr(datastore, args):
+    if len(args) != 2:
+        return False
+    datastore.incr(args[1])
+    return True
+
+
+def _load_rpush(datastore, args):
+    if len(args) < 3:
+        return False
+    datastore.append(args[1], *args[2:])
+    return True
+
+
+def _load_lpush(datastore, args):
+    if len(args) < 3:
+        return False
+    datastore.prepend(args[1], *args[2:])
+    return True
+
+
+def _load_hset(datastore, args):
+    if len(args) < 4 or len(args) % 2:
+        return False
+    datastore.hset(args[1], zip(args[2::2], args[3::2]))
+    return True
+
+
+def _load_sadd(datastore, args):
+    if len(args) < 3:
+        return False
+    datastore.sadd(args[1], args[2:])
+    return True
+
+
+def _load_zadd(datastore, args):
+    # Only the form without options, as written by a rewrite.
+    if len(args) < 4 or len(args) % 2:
+        return False
+    try:
+        items = [(member, float(score)) for score, member in zip(args[2::2], args[3::2])]
+    except ValueError:
+        return False
+    if any(score != score for _, score in items):
+        return False
+    datastore.zadd(args[1], items)
+    return True
+
+
+# Loaders that apply the most common logged commands straight to the store.
+# They return False for any form they don't handle, which then goes through
+# the command's handler as usual.
+_LOADERS = {
+    b'SET': _load_set,
+    b'set': _load_set,
+    b'MSET': _load_mset,
+    b'mset': _load_mset,
+    b'INCR': _load_incr,
+    b'incr': _load_incr,
+    b'RPUSH': _load_rpush,
+    b'rpush': _load_rpush,
+    b'LPUSH': _load_lpush,
+    b'lpush': _load_lpush,
+    b'HSET': _load_hset,
+    b'hset': _load_hset,
+    b'SADD': _load_sadd,
+    b'sadd': _load_sadd,
+    b'ZADD': _load_zadd,
+    b'zadd': _load_zadd,
+}
+
+
+def load_aof(filename, datastore, progress=None, offset=0):
+    """
+    Load the AOF at filename, from offset onwards, into datastore. An AOF
+    that starts with a snapshot preamble has the snapshot bulk loaded and
+    then just the commands after it replayed. The file is memory mapped and
+    parsed in place, the most common commands are applied straight to the
+    store and the rest by calling their handler, without the frame objects
+    and reply encoding of the request path. If given,
+    progress is called with the bytes loaded so far and the file size every
+    LOAD_PROGRESS_INTERVAL bytes and once at the end.
+
+    A command torn by a crash at the end of the file is dropped and the
+    file truncated after the last complete one, as with Redis's
+    aof-load-truncated, so writes appended once the server is back don't
+    follow a partial command.
+
+    Returns False, after printing an error, if the file is corrupt.
+    """
+    try:
+        size = os.path.getsize(filename)
+    except FileNotFoundError:
+        return True
+
+    if size <= offset:
+        return True
+
+    next_report = offset + LOAD_PROGRESS_INTERVAL
+    position = offset
+    # Loading allocates millions of objects that all survive, so cyclic
+    # garbage collection passes during the load are wasted work.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if offset == 0 and is_snapshot(data):
+                _, offset = load_snapshot_data(data, datastore)
+                position = offset
+                if progress:
+                    progress(position, size)
+
+            for commands, position in _read_commands(data, offset):
+                for args in commands:
+                    loader = _LOADERS.get(args[0])
+                    if loader is not None and loader(datastore, args):
+                        continue
+
+                    _, result = execute_command(args, datastore)
                     if isinstance(result, Error):
-                        print("Error corrupt AOF file")
+                        print(f"Error corrupt AOF file: {result.data}")
                         return False
-                else:
-                    break
 
+                if progress and position >= next_report:
+                    progress(position, size)
+                    next_report = position + LOAD_PROGRESS_INTERVAL
+    except (CorruptAOFError, CorruptSnapshotError, ValueError) as e:
+        print(f"Error corrupt AOF file: {e}")
+        return False
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if position < size:
+        print(f"Truncating AOF file at offset {position}, the last command is incomplete")
+        os.truncate(filename, position)
+
+    if progress:
+        progress(position, size)
     return True
+
+
+def restore_from_file(filename, datastore):
+    return load_aof(filename, datastore)
+
+
+def load_data(datastore, aof_filename, snapshot_filename, progress=None):
+    """
+    Restore datastore at startup. The snapshot is loaded when it was taken
+    alongside the current AOF, recorded as the id from the AOF's preamble,
+    followed by just the part of the AOF written after it, or on its own
+    when there is no AOF. Otherwise, including when
+    the snapshot is corrupt, the whole AOF is loaded as before, since it
+    records writes the snapshot doesn't have.
+
+    Returns False, after printing an error, if the data can't be loaded.
+    """
+    try:
+        aof_size = os.path.getsize(aof_filename)
+    except FileNotFoundError:
+        aof_size = 0
+    aof_id = read_aof_id(aof_filename)
+
+    try:
+        aux = read_snapshot_aux(snapshot_filename)
+        if aux is not None:
+            if not aof_size:
+                load_snapshot(snapshot_filename, datastore)
+                return True
+            offset = int(aux.get(b'aof-offset', -1))
+            if aof_id is not None and aux.get(b'aof-id') == aof_id and 0 <= offset <= aof_size:
+                load_snapshot(snapshot_filename, datastore)
+                return load_aof(aof_filename, datastore, progress, offset)
+    except (CorruptSnapshotError, ValueError) as e:
+        print(f"Error corrupt snapshot file: {e}")
+        if not aof_size:
+            return False
+
+    return load_aof(aof_filename, datastore, progress)
@@ -3,70 +3,243 @@ from pyredis.types import Array, BulkString, Error, Integer, SimpleString
 _MSG_SEPARATOR = b"\r\n"
 _MSG_SEPARATOR_SIZE = len(_MSG_SEPARATOR)
 
+_SIMPLE_STRING = ord("+")
+_ERROR = ord("-")
+_INTEGER = ord(":")
+_BULK_STRING = ord("$")
+_ARRAY = ord("*")
 
-def extract_frame_from_buffer(buffer):
-    # print(f"Bufer in Extract: {buffer}")
-    separator = buffer.find(_MSG_SEPARATOR)
+# The largest bulk string a client may send, as with Redis's
+# proto-max-bulk-len, so a header alone can't make the server hold an
+# arbitrarily large payload.
+PROTO_MAX_BULK_LEN = 512 * 1024 * 1024
+
+
+class ProtocolError(ValueError):
+    """
+    Raised by RespDecoder.feed for input that is not valid RESP. frames holds
+    the frames completed before the error, which a server still answers.
+    """
+
+    def __init__(self, message, frames):
+        super().__init__(message)
+        self.frames = frames
+
+
+def _parse(buffer, view, offset):
+    """
+    Parse the frame that starts at offset. Returns the frame and the offset
+    just past its end, or (None, offset) if the frame is not yet complete.
+    """
+    separator = buffer.find(_MSG_SEPARATOR, offset)
 
     if separator == -1:
-        return None, 0
-    else:
-        payload = buffer[1:separator].decode()
+        return None, offset
 
-        match chr(buffer[0]):
-            case "+":
-                return SimpleString(payload), separator + _MSG_SEPARATOR_SIZE
+    end_of_header = separator + _MSG_SEPARATOR_SIZE
+    frame_type = buffer[offset]
 
-            case "-":
-                return Error(payload), separator + _MSG_SEPARATOR_SIZE
+    if frame_type == _BULK_STRING:
+        length = int(view[offset + 1:separator])
 
-            case ":":
-                return Integer(int(payload)), separator + _MSG_SEPARATOR_SIZE
+        if length == -1:
+            return BulkString(None), end_of_header
 
-            case "$":
-                length = int(payload)
+        end_of_message = end_of_header + length
+        if len(buffer) < end_of_message + _MSG_SEPARATOR_SIZE:
+            return None, offset
 
-                if length == -1:
-                    return None, 5
-                else:
-                    if (
-                            len(buffer)
-                            < separator + _MSG_SEPARATOR_SIZE + length + _MSG_SEPARATOR_SIZE
-                    ):
-                        return None, 0
-                    else:
-                        end_of_message = separator + 2 + length
-                        return (
-                            BulkString(buffer[separator + 2: end_of_message]),
-                            end_of_message + _MSG_SEPARATOR_SIZE,
-                        )
+        return (
+            BulkString(bytes(view[end_of_header:end_of_message])),
+            end_of_message + _MSG_SEPARATOR_SIZE,
+        )
 
-            case "*":
-                length = int(payload)
+    if frame_type == _ARRAY:
+        length = int(view[offset + 1:separator])
 
-                if length == 0:
-                    return Array([]), separator + _MSG_SEPARATOR_SIZE
+        if length == -1:
+            return Array(None), end_of_header
 
-                if length == -1:
-                    return Array(None), separator + _MSG_SEPARATOR_SIZE
+        array = []
+        position = end_of_header
 
-                array = []
+        for _ in range(length):
+            next_item, next_position = _parse(buffer, view, position)
 
-                for _ in range(length):
-                    next_item, length = extract_frame_from_buffer(
-                        buffer[separator + _MSG_SEPARATOR_SIZE:]
-                    )
+            if next_item is None:
+                return None, offset
+
+            array.append(next_item)
+            position = next_position
+
+        return Array(array), position
+
+    if frame_type == _SIMPLE_STRING:
+        return SimpleString(bytes(view[offset + 1:separator]).decode()), end_of_header
+
+    if frame_type == _ERROR:
+        return Error(bytes(view[offset + 1:separator]).decode()), end_of_header
+
+    if frame_type == _INTEGER:
+        return Integer(int(view[offset + 1:separator])), end_of_header
+
+    return None, offset
 
-                    if next_item and length:
-                        array.append(next_item)
-                        separator += length
-                    else:
-                        return None, 0
 
-                return Array(array), separator + _MSG_SEPARATOR_SIZE
-    return None, 0
+def parse_frame(buffer, offset=0):
+    """
+    Parse a single frame from buffer starting at offset without copying the
+    rest of the buffer. Returns the frame and the offset of the first byte
+    after it, or (None, offset) if no complete frame is available yet.
+    """
+    if offset >= len(buffer):
+        return None, offset
+
+    with memoryview(buffer) as view:
+        return _parse(buffer, view, offset)
+
+
+def extract_frame_from_buffer(buffer):
+    frame, frame_size = parse_frame(buffer)
+
+    if isinstance(frame, BulkString) and frame.data is None:
+        return None, frame_size
+
+    return frame, frame_size
 
 
 def encode_message(message):
     return message.resp_encode()
 
+
+class RespDecoder:
+    """
+    Stateful RESP decoder for a single connection. Bytes are passed to feed
+    as they arrive and every frame they complete is returned. The decoder
+    remembers the arrays it is part way through and, once the header of a
+    bulk string has been read, appends each new chunk straight to the
+    payload, so a large value split across many reads is never parsed from
+    the start again. The payload grows as the data arrives rather than
+    being allocated up front at the length the header claims. Lengths over
+    PROTO_MAX_BULK_LEN, negative ones other than -1 and any other malformed
+    input raise ProtocolError, after which the decoder can't be fed again.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._arrays = []
+        self._bulk = None
+        # The size of the bulk string being read, with its CRLF.
+        self._bulk_size = 0
+
+    @property
+    def buffered(self):
+        """The number of bytes held for frames not yet complete."""
+        return len(self._buffer) + (len(self._bulk) if self._bulk is not None else 0)
+
+    def feed(self, data):
+        frames = []
+
+        try:
+            with memoryview(data) as view:
+                position = 0
+                if self._bulk is not None:
+                    position = self._fill_bulk(view, frames)
+                if position < len(view):
+                    self._buffer.extend(view[position:])
+
+            if self._bulk is None:
+                self._decode_buffer(frames)
+        except ValueError as e:
+            raise ProtocolError(str(e), frames) from e
+
+        return frames
+
+    def _fill_bulk(self, view, frames):
+        available = min(self._bulk_size - len(self._bulk), len(view))
+        self._bulk += view[:available]
+
+        if len(self._bulk) == self._bulk_size:
+            bulk = self._bulk
+            self._bulk = None
+            if bulk[-_MSG_SEPARATOR_SIZE:] != _MSG_SEPARATOR:
+                raise ValueError("Protocol error: bulk string not terminated")
+            del bulk[-_MSG_SEPARATOR_SIZE:]
+            self._complete(BulkString(bytes(bulk)), frames)
+
+        return available
+
+    def _decode_buffer(self, frames):
+        buffer = self._buffer
+        offset = 0
+
+        with memoryview(buffer) as view:
+            while True:
+                separator = buffer.find(_MSG_SEPARATOR, offset)
+
+                if separator == -1:
+                    break
+
+                end_of_header = separator + _MSG_SEPARATOR_SIZE
+                frame_type = buffer[offset]
+
+                if frame_type == _BULK_STRING:
+                    length = int(view[offset + 1:separator])
+
+                    if length == -1:
+                        self._complete(BulkString(None), frames)
+                        offset = end_of_header
+                        continue
+                    if length < 0 or length > PROTO_MAX_BULK_LEN:
+                        raise ValueError("Protocol error: invalid bulk length")
+
+                    end_of_message = end_of_header + length
+                    if len(buffer) >= end_of_message + _MSG_SEPARATOR_SIZE:
+                        self._complete(BulkString(bytes(view[end_of_header:end_of_message])), frames)
+                        offset = end_of_message + _MSG_SEPARATOR_SIZE
+                        continue
+
+                    # The payload is still in flight: keep what has arrived
+                    # and append the remaining chunks to it as they come.
+                    self._bulk = bytearray(view[end_of_header:])
+                    self._bulk_size = length + _MSG_SEPARATOR_SIZE
+                    offset = len(buffer)
+                    break
+
+                header = buffer[offset + 1:separator]
+                offset = end_of_header
+
+                if frame_type == _ARRAY:
+                    length = int(header)
+                    if length == -1:
+                        self._complete(Array(None), frames)
+                    elif length == 0:
+                        self._complete(Array([]), frames)
+                    elif length > 0:
+                        self._arrays.append((length, []))
+                    else:
+                        raise ValueError("Protocol error: invalid multibulk length")
+                elif frame_type == _SIMPLE_STRING:
+                    self._complete(SimpleString(header.decode()), frames)
+                elif frame_type == _ERROR:
+                    self._complete(Error(header.decode()), frames)
+                elif frame_type == _INTEGER:
+                    self._complete(Integer(int(header)), frames)
+                else:
+                    raise ValueError(f"Protocol error: unexpected type byte {chr(frame_type)!r}")
+
+        if offset:
+            del buffer[:offset]
+
+    def _complete(self, frame, frames):
+        while self._arrays:
+            length, items = self._arrays[-1]
+            items.append(frame)
+
+            if len(items) < length:
+                return
+
+            self._arrays.pop()
+            frame = Array(items)
+
+        frames.append(frame)
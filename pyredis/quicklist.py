@@ -0,0 +1,180 @@
+import sys
+
+from pyredis.utils import normalise_range
+
+CHUNK_SIZE = 256
+
+
+class QuickList:
+    """
+    The list type, stored as a sequence of fixed size chunks. Only the first
+    and last chunk are partially filled, so the position of any element is
+    computed directly from its index. That gives O(1) pushes and pops at
+    both ends, O(1) indexed access and range reads that copy whole chunk
+    slices rather than walking the list.
+    """
+
+    __slots__ = ('_chunks', '_head', '_size', '_element_bytes')
+
+    def __init__(self, items=()):
+        items = list(items)
+        # Built a chunk at a time, rather than by appending each item.
+        self._chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+        if self._chunks:
+            last = self._chunks[-1]
+            last.extend([None] * (CHUNK_SIZE - len(last)))
+        # Position of the first element within self._chunks[0].
+        self._head = 0
+        self._size = len(items)
+        # Total sys.getsizeof of the elements, kept up to date so the size
+        # of the list is known without walking it.
+        self._element_bytes = sum(map(sys.getsizeof, items))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.range(0, -1))
+
+    def __eq__(self, other):
+        if not isinstance(other, QuickList):
+            return NotImplemented
+        return self.range(0, -1) == other.range(0, -1)
+
+    def __repr__(self):
+        return f'QuickList({self.range(0, -1)!r})'
+
+    def memory_usage(self):
+        """Estimate the bytes used by the list, its chunks and elements."""
+        chunks = self._chunks
+        usage = sys.getsizeof(self) + sys.getsizeof(chunks) + self._element_bytes
+        if chunks:
+            usage += len(chunks) * sys.getsizeof(chunks[0])
+        return usage
+
+    def _clear(self):
+        self._chunks = []
+        self._head = 0
+        self._size = 0
+        self._element_bytes = 0
+
+    def _locate(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('list index out of range')
+        return divmod(self._head + index, CHUNK_SIZE)
+
+    def __getitem__(self, index):
+        chunk, position = self._locate(index)
+        return self._chunks[chunk][position]
+
+    def __setitem__(self, index, value):
+        chunk, position = self._locate(index)
+        chunk = self._chunks[chunk]
+        self._element_bytes += sys.getsizeof(value) - sys.getsizeof(chunk[position])
+        chunk[position] = value
+
+    def append(self, value):
+        chunk, position = divmod(self._head + self._size, CHUNK_SIZE)
+        if chunk == len(self._chunks):
+            self._chunks.append([None] * CHUNK_SIZE)
+        self._chunks[chunk][position] = value
+        self._size += 1
+        self._element_bytes += sys.getsizeof(value)
+
+    def appendleft(self, value):
+        if self._head == 0:
+            self._chunks.insert(0, [None] * CHUNK_SIZE)
+            self._head = CHUNK_SIZE
+        self._head -= 1
+        self._chunks[0][self._head] = value
+        self._size += 1
+        self._element_bytes += sys.getsizeof(value)
+
+    def pop(self):
+        if not self._size:
+            raise IndexError('pop from an empty list')
+
+        self._size -= 1
+        chunk, position = divmod(self._head + self._size, CHUNK_SIZE)
+        last = self._chunks[chunk]
+        value = last[position]
+        last[position] = None
+        self._element_bytes -= sys.getsizeof(value)
+
+        if not self._size:
+            self._clear()
+        elif chunk + 1 < len(self._chunks):
+            # Keep at most one empty chunk past the tail, so alternating
+            # pushes and pops at a chunk boundary don't reallocate it.
+            self._chunks.pop()
+        return value
+
+    def popleft(self):
+        if not self._size:
+            raise IndexError('pop from an empty list')
+
+        # An emptied first chunk is only dropped on the next pop from the
+        # left, for the same reason as in pop.
+        if self._head == CHUNK_SIZE:
+            del self._chunks[0]
+            self._head = 0
+
+        first = self._chunks[0]
+        value = first[self._head]
+        first[self._head] = None
+        self._element_bytes -= sys.getsizeof(value)
+        self._head += 1
+        self._size -= 1
+
+        if not self._size:
+            self._clear()
+        return value
+
+    def range(self, start, stop):
+        """Return the elements from start to stop inclusive, as LRANGE does."""
+        start, stop = normalise_range(start, stop, self._size)
+        if start >= stop:
+            return []
+
+        first, first_position = divmod(self._head + start, CHUNK_SIZE)
+        last, last_position = divmod(self._head + stop - 1, CHUNK_SIZE)
+
+        if first == last:
+            return self._chunks[first][first_position:last_position + 1]
+
+        result = self._chunks[first][first_position:]
+        for chunk in range(first + 1, last):
+            result.extend(self._chunks[chunk])
+        result.extend(self._chunks[last][:last_position + 1])
+        return result
+
+    def trim(self, start, stop):
+        """Keep only the elements from start to stop inclusive, as LTRIM does."""
+        start, stop = normalise_range(start, stop, self._size)
+        if start >= stop:
+            self._clear()
+            return
+
+        removed = 0
+        if start:
+            removed += sum(map(sys.getsizeof, self.range(0, start - 1)))
+        if stop < self._size:
+            removed += sum(map(sys.getsizeof, self.range(stop, self._size - 1)))
+        self._element_bytes -= removed
+
+        # Drop whole chunks from the right, then clear the rest of the tail.
+        size = stop - start
+        tail = self._head + stop
+        keep = -(-tail // CHUNK_SIZE)
+        del self._chunks[keep:]
+        position = tail - (keep - 1) * CHUNK_SIZE
+        self._chunks[-1][position:] = [None] * (CHUNK_SIZE - position)
+
+        # Likewise from the left.
+        drop, head = divmod(self._head + start, CHUNK_SIZE)
+        del self._chunks[:drop]
+        self._chunks[0][:head] = [None] * head
+        self._head = head
+        self._size = size
@@ -1,15 +1,38 @@
+import selectors
 import socket
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
 
-from pyredis.commands import handle_command
+from pyredis.commands import handle_command, internal_error
 from pyredis.datastore import Datastore
-from pyredis.protocol import extract_frame_from_buffer, encode_message
+from pyredis.protocol import RespDecoder, encode_message
+from pyredis.stats import STATS, LatencyTimer
+from pyredis.types import Error
 
-RECV_SIZE = 2048
+RECV_SIZE = 64 * 1024
+
+# Threads that run commands. With 0 commands run on the selector thread,
+# the default, as under the GIL handing batches to other threads costs more
+# than it gains; a pool pays off on free-threaded builds.
+WORKERS = 0
+
+# Clients beyond this many are sent an error and disconnected, as with
+# Redis's maxclients.
+MAX_CONNECTIONS = 10_000
+
+LISTEN_BACKLOG = 511
+
+# How often the selector thread expires keys when it is otherwise idle.
+EXPIRY_INTERVAL = 0.1
+
+_MAX_CLIENTS_ERROR = Error("ERR max number of clients reached").resp_encode()
+_PROTOCOL_ERROR = Error("ERR Protocol error").resp_encode()
 
 
 def handle_client_connection(client_socket, datastore):
-    buffer = bytearray()
+    decoder = RespDecoder()
 
     try:
         while True:
@@ -18,19 +41,24 @@ def handle_client_connection(client_socket, datastore):
             if not data:
                 break
 
-            buffer.extend(data)
-
-            frame, frame_size = extract_frame_from_buffer(buffer)
+            replies = bytearray()
 
-            if frame:
-                buffer = buffer[frame_size:]
+            for frame in decoder.feed(data):
                 result = handle_command(frame, datastore)
-                client_socket.send(encode_message(result))
+                replies.extend(encode_message(result))
+
+            if replies:
+                client_socket.sendall(replies)
     finally:
         client_socket.close()
 
 
-class Server:
+class ThreadedServer:
+    """
+    Serves each client from a thread of its own with blocking sockets. This
+    was the original engine, kept to compare Server against.
+    """
+
     def __init__(self, port):
         self.port = port
         self._running = False
@@ -55,3 +83,257 @@ class Server:
 
     def stop(self):
         self._running = False
+
+
+class _Connection:
+    __slots__ = ('sock', 'decoder', 'pending', 'outgoing', 'busy', 'closed')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = RespDecoder()
+        # Frames read but not yet handed to a worker.
+        self.pending = []
+        # Replies the socket has not taken yet.
+        self.outgoing = bytearray()
+        # Whether a worker is running a batch of this client's commands.
+        self.busy = False
+        self.closed = False
+
+
+class Server:
+    """
+    Serves every client from one thread that waits on a selector (epoll on
+    Linux) with non-blocking sockets, and runs commands either on that
+    thread or on a fixed pool of worker threads.
+
+    The commands completed by each read of a client go to a worker as one
+    batch, and a client has at most one batch running at a time, so its
+    commands run and are replied to in order however deeply it pipelines.
+    The replies to a batch are sent with a single send. When the socket
+    does not take all of them the rest is kept and the client is not read
+    from again until it has been sent.
+    """
+
+    def __init__(self, port, host='localhost', workers=WORKERS, max_connections=MAX_CONNECTIONS, datastore=None):
+        self.port = port
+        self.host = host
+        self.workers = workers
+        self.max_connections = max_connections
+        # The address the server is listening on, set once ready is.
+        self.address = None
+        self.ready = threading.Event()
+        self._running = False
+        self._datastore = Datastore() if datastore is None else datastore
+        self._connections = set()
+        self._selector = None
+        self._pool = None
+        # Batches finished by workers, as (connection, replies), for the
+        # selector thread to send.
+        self._completed = deque()
+        self._wakeup_recv = self._wakeup_send = None
+
+    @property
+    def connected_clients(self):
+        return len(self._connections)
+
+    def run(self):
+        self._running = True
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        if self.workers:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='pyredis-worker')
+
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                server_socket.bind((self.host, self.port))
+                server_socket.listen(LISTEN_BACKLOG)
+                server_socket.setblocking(False)
+
+                self._selector.register(server_socket, selectors.EVENT_READ)
+                self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+                self.address = server_socket.getsockname()
+                self.ready.set()
+                self._serve(server_socket)
+        finally:
+            for connection in list(self._connections):
+                self._close(connection)
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._selector.close()
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
+
+    def stop(self):
+        self._running = False
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except (AttributeError, BlockingIOError):
+            # Not started yet, or a wakeup is already pending.
+            pass
+
+    def _serve(self, server_socket):
+        selector = self._selector
+        next_expiry = monotonic() + EXPIRY_INTERVAL
+
+        while self._running:
+            for key, events in selector.select(EXPIRY_INTERVAL):
+                connection = key.data
+                if connection is None:
+                    if key.fileobj is server_socket:
+                        self._accept(server_socket)
+                    else:
+                        self._wakeup_recv.recv(RECV_SIZE)
+                elif events & selectors.EVENT_WRITE:
+                    self._write(connection)
+                else:
+                    self._read(connection)
+
+            self._send_completed()
+
+            now = monotonic()
+            if now >= next_expiry:
+                # How far behind the thread is, which is how long the last
+                # round of events held it up.
+                STATS.latency_event('event-loop', int((now - next_expiry) * 10 ** 9))
+                with LatencyTimer('expire-cycle'):
+                    self._datastore.remove_expired_keys()
+                STATS.track_ops()
+                next_expiry = monotonic() + EXPIRY_INTERVAL
+
+    def _accept(self, server_socket):
+        # Accept everything queued, as one readiness event can stand for
+        # many clients when they connect at once.
+        while True:
+            try:
+                sock, _ = server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+
+            if len(self._connections) >= self.max_connections:
+                try:
+                    sock.send(_MAX_CLIENTS_ERROR)
+                except OSError:
+                    pass
+                sock.close()
+                continue
+
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(sock)
+            self._connections.add(connection)
+            self._selector.register(sock, selectors.EVENT_READ, connection)
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(connection)
+            return
+
+        if not data:
+            self._close(connection)
+            return
+
+        try:
+            connection.pending += connection.decoder.feed(data)
+        except ValueError:
+            self._send(connection, _PROTOCOL_ERROR)
+            self._close(connection)
+            return
+
+        if not connection.busy:
+            self._dispatch(connection)
+
+    def _dispatch(self, connection):
+        frames = connection.pending
+        if not frames:
+            return
+        connection.pending = []
+
+        if self._pool is None:
+            self._send(connection, self._execute(frames))
+        else:
+            connection.busy = True
+            self._pool.submit(self._run_batch, connection, frames)
+
+    def _execute(self, frames):
+        replies = bytearray()
+        for frame in frames:
+            # A command that raises is answered with an error, rather than
+            # ending the selector thread or leaving its client waiting.
+            try:
+                reply = encode_message(handle_command(frame, self._datastore))
+            except Exception as e:
+                reply = internal_error(e).resp_encode()
+            replies += reply
+        return replies
+
+    def _run_batch(self, connection, frames):
+        replies = b''
+        try:
+            replies = self._execute(frames)
+        finally:
+            # Hand the connection back even if a command raised, or it would
+            # never be served again.
+            self._completed.append((connection, replies))
+            self._wake()
+
+    def _send_completed(self):
+        completed = self._completed
+        while completed:
+            connection, replies = completed.popleft()
+            connection.busy = False
+            if connection.closed:
+                continue
+            self._send(connection, replies)
+            if not connection.outgoing:
+                self._dispatch(connection)
+
+    def _send(self, connection, data):
+        if connection.outgoing:
+            connection.outgoing += data
+            return
+
+        try:
+            sent = connection.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._close(connection)
+            return
+
+        if sent < len(data):
+            connection.outgoing += memoryview(data)[sent:]
+            self._selector.modify(connection.sock, selectors.EVENT_WRITE, connection)
+
+    def _write(self, connection):
+        try:
+            sent = connection.sock.send(connection.outgoing)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(connection)
+            return
+
+        del connection.outgoing[:sent]
+        if not connection.outgoing:
+            self._selector.modify(connection.sock, selectors.EVENT_READ, connection)
+            # Commands read while the replies were going out run now.
+            if not connection.busy:
+                self._dispatch(connection)
+
+    def _close(self, connection):
+        if connection.closed:
+            return
+        connection.closed = True
+        self._connections.discard(connection)
+        self._selector.unregister(connection.sock)
+        connection.sock.close()
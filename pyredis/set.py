@@ -0,0 +1,123 @@
+import sys
+from array import array
+from bisect import bisect_left
+
+from pyredis.utils import as_integer
+
+# Sets of at most this many members, all of them integers, are kept in the
+# intset encoding, as with Redis's set-max-intset-entries.
+SET_MAX_INTSET_ENTRIES = 512
+
+ENCODING_INTSET = 'intset'
+ENCODING_HASHTABLE = 'hashtable'
+
+# Array type codes of the intset's item widths, 2, 4 and 8 bytes.
+_INTSET_TYPECODES = ('h', 'i', 'q')
+
+
+def _fits(number, typecode):
+    limit = 1 << (array(typecode).itemsize * 8 - 1)
+    return -limit <= number < limit
+
+
+class Set:
+    """
+    The set type. A small set of integers is an intset, as in Redis: a
+    sorted array of the integers, searched by bisection, whose items are
+    only as wide as its largest member needs, 2, 4 or 8 bytes. Once it
+    grows past SET_MAX_INTSET_ENTRIES members or is given one that is not an
+    integer it is converted to a set of bytes for good.
+    """
+
+    __slots__ = ('_members', '_element_bytes')
+
+    def __init__(self, members=()):
+        # The intset array, or the set once converted.
+        self._members = array(_INTSET_TYPECODES[0])
+        # Total sys.getsizeof of the members of a converted set, an intset
+        # holds its members in the array itself.
+        self._element_bytes = 0
+        for member in members:
+            self.add(member)
+
+    @property
+    def encoding(self):
+        return ENCODING_HASHTABLE if type(self._members) is set else ENCODING_INTSET
+
+    def __len__(self):
+        return len(self._members)
+
+    def __iter__(self):
+        members = self._members
+        if type(members) is set:
+            return iter(members)
+        return (b'%d' % number for number in members)
+
+    def __contains__(self, member):
+        members = self._members
+        if type(members) is set:
+            return member in members
+        number = as_integer(member)
+        if number is None:
+            return False
+        index = bisect_left(members, number)
+        return index < len(members) and members[index] == number
+
+    def __eq__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return set(self) == set(other)
+
+    def __repr__(self):
+        return f'Set({list(self)!r})'
+
+    def memory_usage(self):
+        """Estimate the bytes used by the set, its array or set and its members."""
+        return sys.getsizeof(self) + sys.getsizeof(self._members) + self._element_bytes
+
+    def _convert(self):
+        members = self._members = {b'%d' % number for number in self._members}
+        self._element_bytes = sum(map(sys.getsizeof, members))
+        return members
+
+    def add(self, member):
+        """Add member, returning True if it was not already in the set."""
+        members = self._members
+        if type(members) is not set:
+            number = as_integer(member)
+            if number is not None:
+                index = bisect_left(members, number)
+                if index < len(members) and members[index] == number:
+                    return False
+                if len(members) < SET_MAX_INTSET_ENTRIES:
+                    if not _fits(number, members.typecode):
+                        typecode = next(code for code in _INTSET_TYPECODES if _fits(number, code))
+                        members = self._members = array(typecode, members)
+                    members.insert(index, number)
+                    return True
+            members = self._convert()
+
+        if member in members:
+            return False
+        members.add(member)
+        self._element_bytes += sys.getsizeof(member)
+        return True
+
+    def remove(self, member):
+        """Remove member, returning whether it was there."""
+        members = self._members
+        if type(members) is set:
+            if member not in members:
+                return False
+            members.remove(member)
+            self._element_bytes -= sys.getsizeof(member)
+            return True
+
+        number = as_integer(member)
+        if number is None:
+            return False
+        index = bisect_left(members, number)
+        if index == len(members) or members[index] != number:
+            return False
+        del members[index]
+        return True
@@ -0,0 +1,334 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+from binascii import crc_hqx
+from collections import deque
+from dataclasses import replace
+from multiprocessing.connection import wait
+
+from pyredis.asyncserver import (
+    LOOP_AUTO, RedisServerProtocol, ServerOptions, check_aof_rewrite_task, check_expiry_task, create_server, run,
+)
+from pyredis.commands import COMMANDS, handle_command, internal_error
+from pyredis.datastore import NOEVICTION, Datastore
+from pyredis.persistence import AppendOnlyPersister, load_data
+from pyredis.protocol import RespDecoder, encode_message
+from pyredis.stats import STATS
+from pyredis.types import Error
+
+# Keys map to one of a fixed number of slots, as in Redis Cluster, and each
+# shard owns a contiguous range of slots.
+HASH_SLOTS = 16384
+
+# How long a worker keeps trying to reach a peer that is still starting.
+PEER_CONNECT_TIMEOUT = 5
+
+_PROTOCOL_ERROR = Error("ERR Protocol error").resp_encode()
+
+
+def key_slot(key):
+    """
+    Return the slot of key: CRC16 of the key modulo HASH_SLOTS. If the key
+    contains a non-empty {hash tag} only the tag is hashed, so related keys
+    can be kept on one shard.
+    """
+    start = key.find(b'{')
+    if start != -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    return crc_hqx(key, 0) % HASH_SLOTS
+
+
+def shard_for_key(key, shards):
+    return key_slot(key) * shards // HASH_SLOTS
+
+
+def shard_socket_path(directory, shard):
+    """The Unix socket a shard accepts forwarded commands on."""
+    return os.path.join(directory, f'shard-{shard}.sock')
+
+
+class PeerConnection:
+    """
+    A pipelined connection to another shard. Forwarded commands are written
+    in order and their replies, which come back in the same order, resolve
+    the futures returned by forward to the encoded reply. Writes made in one
+    event loop iteration go out together.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._writer = None
+        self._connecting = None
+        self._outgoing = bytearray()
+        self._flush_scheduled = False
+        self._waiters = deque()
+
+    def forward(self, frame):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append(future)
+        self._outgoing += frame.resp_encode()
+
+        if self._writer is None:
+            if self._connecting is None:
+                self._connecting = loop.create_task(self._connect())
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self._writer is not None and self._outgoing:
+            self._writer.write(bytes(self._outgoing))
+            self._outgoing.clear()
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PEER_CONNECT_TIMEOUT
+
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self._path)
+                break
+            except OSError:
+                # The peer may not be listening yet while workers start up.
+                if loop.time() > deadline:
+                    self._connecting = None
+                    self._fail('TRYAGAIN shard unavailable')
+                    return
+                await asyncio.sleep(0.05)
+
+        self._writer = writer
+        self._connecting = None
+        self._flush()
+        await self._read_replies(reader)
+
+    async def _read_replies(self, reader):
+        decoder = RespDecoder()
+        try:
+            while data := await reader.read(65536):
+                for frame in decoder.feed(data):
+                    self._waiters.popleft().set_result(encode_message(frame))
+        finally:
+            self._writer.close()
+            self._writer = None
+            self._fail('TRYAGAIN connection to shard lost')
+
+    def _fail(self, message):
+        reply = Error(message).resp_encode()
+        self._outgoing.clear()
+        while self._waiters:
+            self._waiters.popleft().set_result(reply)
+
+
+class ShardRouter:
+    """Decides which shard runs a command and forwards it to the others."""
+
+    def __init__(self, shard, shards, directory):
+        self.shard = shard
+        self.shards = shards
+        self._peers = {
+            peer: PeerConnection(shard_socket_path(directory, peer)) for peer in range(shards) if peer != shard
+        }
+
+    def shard_for(self, frame):
+        """
+        Return the shard that owns the keys of the command in frame, this
+        shard for commands without keys, or an Error if they span shards.
+        """
+        args = frame.data
+        if not args:
+            return self.shard
+        spec = COMMANDS.get(args[0].data) or COMMANDS.get(args[0].data.upper())
+        if spec is None or not spec.first_key or len(args) <= spec.first_key:
+            return self.shard
+
+        keys = spec.keys(args)
+        owner = shard_for_key(keys[0].data, self.shards)
+        for key in keys[1:]:
+            if shard_for_key(key.data, self.shards) != owner:
+                return Error("CROSSSLOT Keys in request don't hash to the same shard")
+        return owner
+
+    def forward(self, shard, frame):
+        return self._peers[shard].forward(frame)
+
+
+class ShardedServerProtocol(RedisServerProtocol):
+    """
+    Client connection to one worker of a sharded server. Commands for keys
+    this worker owns run locally, the rest are forwarded to their owner.
+    Replies are sent in the order the commands arrived, so a reply that is
+    ready waits for any forwarded ones before it, and after a protocol error
+    the connection is closed once every command before it is answered.
+    """
+
+    def __init__(self, datastore, persister, router):
+        super().__init__(datastore, persister)
+        self.router = router
+        self._replies = deque()
+        self._waiting = False
+
+    def data_received(self, data: bytes) -> None:
+        if not data:
+            self.transport.close()
+        # Still waiting on forwarded replies before closing.
+        if self.protocol_error:
+            return
+
+        shard = self.router.shard
+        replies = self._replies
+
+        for frame in self.decode(data):
+            owner = self.router.shard_for(frame)
+            if owner == shard:
+                try:
+                    reply = encode_message(handle_command(frame, self.datastore, self.persister, self))
+                except Exception as e:
+                    reply = internal_error(e).resp_encode()
+                replies.append(reply)
+            elif isinstance(owner, Error):
+                replies.append(encode_message(owner))
+            else:
+                replies.append(self.router.forward(owner, frame))
+        if self.protocol_error:
+            replies.append(_PROTOCOL_ERROR)
+
+        if self.persister is not None:
+            self.persister.flush()
+
+        # Otherwise a forwarded reply at the head is pending and its callback
+        # writes everything behind it.
+        if not self._waiting:
+            self._write_replies()
+
+    def _write_replies(self, _=None):
+        self._waiting = False
+        replies = self._replies
+        ready = bytearray()
+
+        while replies:
+            reply = replies[0]
+            if isinstance(reply, asyncio.Future):
+                if not reply.done():
+                    self._waiting = True
+                    reply.add_done_callback(self._write_replies)
+                    break
+                reply = reply.result()
+            ready += reply
+            replies.popleft()
+
+        if ready and not self.transport.is_closing():
+            self.write(bytes(ready))
+        if self.protocol_error and not replies:
+            self.transport.close()
+
+
+async def serve_shard(
+    shard, shards, port, appendfsync, directory, options=ServerOptions(), maxmemory=0, maxmemory_policy=NOEVICTION,
+):
+    """
+    Run one worker of a sharded server. Every worker listens on the client
+    port with SO_REUSEPORT, so the kernel spreads connections across them,
+    and on a Unix socket in directory for commands forwarded by the others.
+    Each keeps the keys it owns in its own store and AOF, limited to
+    maxmemory bytes and evicting from it as maxmemory_policy says.
+    """
+    aof_filename, snapshot_filename = f'ccdb-{shard}.aof', f'ccdb-{shard}.rdb'
+    datastore = Datastore(thread_safe=False)
+    if not load_data(datastore, aof_filename, snapshot_filename):
+        return -1
+    # Set once loaded, so nothing is evicted while loading.
+    datastore.maxmemory = maxmemory
+    datastore.maxmemory_policy = maxmemory_policy
+    # Keys that expire from now on are logged as DELs.
+    datastore.track_expired()
+
+    persister = AppendOnlyPersister(aof_filename, appendfsync, snapshot_filename=snapshot_filename, datastore=datastore)
+    router = ShardRouter(shard, shards, directory)
+
+    loop = asyncio.get_running_loop()
+    # Held until the server stops, as the loop only keeps weak references to tasks.
+    tasks = [
+        loop.create_task(check_expiry_task(datastore, persister)),
+        loop.create_task(check_aof_rewrite_task(datastore, persister)),
+    ]
+
+    server = await create_server(
+        lambda: ShardedServerProtocol(datastore, persister, router),
+        "127.0.0.1", port, replace(options, reuse_port=True),
+    )
+    peer_server = await loop.create_unix_server(
+        lambda: RedisServerProtocol(datastore, persister), shard_socket_path(directory, shard)
+    )
+
+    try:
+        async with server, peer_server:
+            await asyncio.gather(server.serve_forever(), peer_server.serve_forever())
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def run_shard(
+    shard, shards, port, appendfsync, directory, options=ServerOptions(), loop_backend=LOOP_AUTO, stats=True,
+    maxmemory=0, maxmemory_policy=NOEVICTION,
+):
+    STATS.enabled = stats
+    status = run(
+        serve_shard(shard, shards, port, appendfsync, directory, options, maxmemory, maxmemory_policy),
+        loop_backend,
+    )
+    if status == -1:
+        sys.exit(1)
+
+
+def run_workers(
+    port, appendfsync, workers, options=ServerOptions(), loop_backend=LOOP_AUTO, stats=True,
+    maxmemory=0, maxmemory_policy=NOEVICTION,
+):
+    """
+    Start a worker process per shard and wait for them to exit. maxmemory
+    is the limit for the server as a whole, so it is split evenly between
+    the shards, which hold about as many keys each. Every shard evicts by
+    maxmemory_policy, from its own keys only. If a worker fails, as when
+    its data can't be loaded, the others are stopped, since the keys it
+    owns can't be served, and -1 is returned.
+    """
+    # Workers are spawned rather than forked so none inherits the state of
+    # a running event loop.
+    context = multiprocessing.get_context('spawn')
+    # 0 stands for no limit, so a limit never rounds down to it.
+    shard_maxmemory = max(maxmemory // workers, 1) if maxmemory else 0
+
+    with tempfile.TemporaryDirectory(prefix='pyredis-') as directory:
+        processes = [
+            context.Process(
+                target=run_shard,
+                args=(
+                    shard, workers, port, appendfsync, directory, options, loop_backend, stats,
+                    shard_maxmemory, maxmemory_policy,
+                ),
+            )
+            for shard in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            running = {process.sentinel: process for process in processes}
+            while running:
+                for sentinel in wait(list(running)):
+                    process = running.pop(sentinel)
+                    process.join()
+                    if process.exitcode:
+                        shard = processes.index(process)
+                        print(f"Shard {shard} exited with status {process.exitcode}, stopping the others")
+                        return -1
+        finally:
+            for process in processes:
+                process.terminate()
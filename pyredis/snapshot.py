@@ -0,0 +1,356 @@
+import gc
+import mmap
+import os
+import zlib
+from struct import Struct
+from time import time_ns
+
+from pyredis.datastore import to_bytes
+from pyredis.hash import Hash
+from pyredis.quicklist import QuickList
+from pyredis.set import Set
+from pyredis.utils import as_integer
+from pyredis.zset import SortedSet
+
+# File layout, every length and count uses the length encoding below:
+#
+#   MAGIC VERSION
+#   { AUX key value }
+#   { [EXPIRETIME_MS ms] type key payload }
+#   EOF crc32
+#
+# where payload is a length prefixed value for a string, a signed 64 bit
+# integer for a string that holds one, a count followed by that many
+# length prefixed values for a list or set, a count of fields followed by
+# each field and its value, both length prefixed, for a hash, or a count of
+# members followed by each length prefixed member and its score, a little
+# endian double, in score order, for a sorted set. The checksum covers
+# everything before it.
+
+MAGIC = b'PYREDIS'
+VERSION = 1
+SNAPSHOT_WRITE_SIZE = 1024 * 1024
+
+TYPE_STRING = 0
+TYPE_INTEGER = 1
+TYPE_LIST = 2
+TYPE_HASH = 3
+TYPE_SET = 4
+TYPE_ZSET = 5
+
+OPCODE_AUX = 0xFA
+OPCODE_EXPIRETIME_MS = 0xFC
+OPCODE_EOF = 0xFF
+
+# Lengths below 254 take a single byte, longer ones a marker byte followed
+# by 4 or 8 bytes.
+_LENGTH_32 = 0xFE
+_LENGTH_64 = 0xFF
+
+_UINT32 = Struct('<I')
+_UINT64 = Struct('<Q')
+_INT64 = Struct('<q')
+_DOUBLE = Struct('<d')
+
+_HEADER = MAGIC + bytes([VERSION])
+_EXPIRETIME_MS = bytes([OPCODE_EXPIRETIME_MS])
+_STRING = bytes([TYPE_STRING])
+_INTEGER = bytes([TYPE_INTEGER])
+_LIST = bytes([TYPE_LIST])
+_HASH = bytes([TYPE_HASH])
+_SET = bytes([TYPE_SET])
+_ZSET = bytes([TYPE_ZSET])
+_AUX = bytes([OPCODE_AUX])
+
+
+class CorruptSnapshotError(Exception):
+    pass
+
+
+def _encode_length(length):
+    if length < _LENGTH_32:
+        return bytes((length,))
+    if length <= 0xFFFFFFFF:
+        return b'\xfe' + _UINT32.pack(length)
+    return b'\xff' + _UINT64.pack(length)
+
+
+def encode_entry(buffer, key, value, expiry=0):
+    """Append the record for a key to buffer. expiry is absolute, in nanoseconds."""
+    if expiry:
+        buffer += _EXPIRETIME_MS
+        buffer += _UINT64.pack(int(expiry // 10 ** 6))
+
+    key = to_bytes(key)
+
+    if isinstance(value, QuickList):
+        buffer += _LIST
+        buffer += _encode_length(len(key))
+        buffer += key
+        buffer += _encode_length(len(value))
+        for item in value:
+            item = to_bytes(item)
+            buffer += _encode_length(len(item))
+            buffer += item
+        return
+
+    if isinstance(value, Set):
+        buffer += _SET
+        buffer += _encode_length(len(key))
+        buffer += key
+        buffer += _encode_length(len(value))
+        for member in value:
+            buffer += _encode_length(len(member))
+            buffer += member
+        return
+
+    if isinstance(value, SortedSet):
+        buffer += _ZSET
+        buffer += _encode_length(len(key))
+        buffer += key
+        buffer += _encode_length(len(value))
+        for member, score in value:
+            buffer += _encode_length(len(member))
+            buffer += member
+            buffer += _DOUBLE.pack(score)
+        return
+
+    if isinstance(value, Hash):
+        buffer += _HASH
+        buffer += _encode_length(len(key))
+        buffer += key
+        buffer += _encode_length(len(value))
+        for pair in value.items():
+            for item in pair:
+                buffer += _encode_length(len(item))
+                buffer += item
+        return
+
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        number = value
+    else:
+        value = to_bytes(value)
+        number = as_integer(value)
+    if number is not None:
+        buffer += _INTEGER
+        buffer += _encode_length(len(key))
+        buffer += key
+        buffer += _INT64.pack(number)
+    else:
+        buffer += _STRING
+        buffer += _encode_length(len(key))
+        buffer += key
+        buffer += _encode_length(len(value))
+        buffer += value
+
+
+def write_snapshot(datastore, filename, aux=None):
+    """
+    Write a snapshot of datastore to filename, along with the bytes to bytes
+    mapping aux. The file is written under a temporary name, fsynced and
+    then renamed, so a crash never leaves a partial snapshot in its place.
+    Like entries, this takes no locks.
+    """
+    temp_filename = f'{filename}.tmp'
+    checksum = 0
+
+    try:
+        with open(temp_filename, 'wb') as f:
+            buffer = bytearray(_HEADER)
+            for name, value in (aux or {}).items():
+                buffer += _AUX
+                for item in (name, value):
+                    buffer += _encode_length(len(item))
+                    buffer += item
+
+            for key, value, expiry in datastore.entries():
+                encode_entry(buffer, key, value, expiry)
+                if len(buffer) >= SNAPSHOT_WRITE_SIZE:
+                    checksum = zlib.crc32(buffer, checksum)
+                    f.write(buffer)
+                    buffer.clear()
+
+            buffer.append(OPCODE_EOF)
+            buffer += _UINT32.pack(zlib.crc32(buffer, checksum))
+            f.write(buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+def _read_length(data, offset):
+    """Return the length encoded at offset and the offset just past it."""
+    length = data[offset]
+    if length < _LENGTH_32:
+        return length, offset + 1
+    if length == _LENGTH_32:
+        return _UINT32.unpack_from(data, offset + 1)[0], offset + 5
+    return _UINT64.unpack_from(data, offset + 1)[0], offset + 9
+
+
+def _read_string(data, offset):
+    """Return the length prefixed string at offset and the offset just past it."""
+    length = data[offset]
+    if length < _LENGTH_32:
+        offset += 1
+    else:
+        length, offset = _read_length(data, offset)
+    end = offset + length
+    if end > len(data):
+        raise IndexError('string runs past the end of the snapshot')
+    return data[offset:end], end
+
+
+def _read_header(data):
+    """Return the aux fields of a snapshot and the offset of its first record."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise CorruptSnapshotError('not a snapshot file')
+    version = data[len(MAGIC)]
+    if version != VERSION:
+        raise CorruptSnapshotError(f'unsupported snapshot version {version}')
+
+    aux = {}
+    offset = len(_HEADER)
+    while data[offset] == OPCODE_AUX:
+        name, offset = _read_string(data, offset + 1)
+        aux[name], offset = _read_string(data, offset)
+    return aux, offset
+
+
+def read_snapshot_aux(filename):
+    """
+    Return the aux fields of the snapshot at filename without loading it,
+    or None if there is no snapshot. The checksum is not verified.
+    """
+    try:
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _read_header(data)[0]
+    except FileNotFoundError:
+        return None
+    except (IndexError, ValueError) as e:
+        raise CorruptSnapshotError(str(e)) from e
+
+
+def is_snapshot(data):
+    """Return whether data, such as an AOF with a snapshot preamble, starts with a snapshot."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+def load_snapshot_data(data, datastore):
+    """
+    Load the snapshot at the start of data into datastore. Returns its aux
+    fields and the offset just past it, where anything appended to the
+    snapshot, such as an AOF tail, begins. The checksum is verified once
+    the snapshot has been read.
+    """
+    try:
+        aux, offset = _read_header(data)
+        load_entry = datastore.load_entry
+        expiry = 0
+
+        while (kind := data[offset]) != OPCODE_EOF:
+            if kind == OPCODE_EXPIRETIME_MS:
+                expiry = _UINT64.unpack_from(data, offset + 1)[0] * 10 ** 6
+                offset += 9
+                continue
+
+            key, offset = _read_string(data, offset + 1)
+            if kind == TYPE_STRING:
+                value, offset = _read_string(data, offset)
+            elif kind == TYPE_INTEGER:
+                value = _INT64.unpack_from(data, offset)[0]
+                offset += 8
+            elif kind == TYPE_LIST:
+                count, offset = _read_length(data, offset)
+                items = [None] * count
+                for i in range(count):
+                    items[i], offset = _read_string(data, offset)
+                value = QuickList(items)
+            elif kind == TYPE_HASH:
+                count, offset = _read_length(data, offset)
+                pairs = [None] * count
+                for i in range(count):
+                    field, offset = _read_string(data, offset)
+                    value, offset = _read_string(data, offset)
+                    pairs[i] = field, value
+                value = Hash(pairs)
+            elif kind == TYPE_SET:
+                count, offset = _read_length(data, offset)
+                members = [None] * count
+                for i in range(count):
+                    members[i], offset = _read_string(data, offset)
+                value = Set(members)
+            elif kind == TYPE_ZSET:
+                count, offset = _read_length(data, offset)
+                pairs = [None] * count
+                for i in range(count):
+                    member, offset = _read_string(data, offset)
+                    pairs[i] = member, _DOUBLE.unpack_from(data, offset)[0]
+                    offset += 8
+                value = SortedSet(pairs)
+            else:
+                raise CorruptSnapshotError(f'unknown record type {kind} at offset {offset}')
+
+            load_entry(key, value, expiry)
+            expiry = 0
+
+        end = offset + 5
+        if end > len(data):
+            raise CorruptSnapshotError('snapshot is truncated')
+        with memoryview(data) as view:
+            checksum = zlib.crc32(view[:offset + 1])
+        if checksum != _UINT32.unpack_from(data, offset + 1)[0]:
+            raise CorruptSnapshotError('snapshot checksum mismatch')
+        return aux, end
+    except (IndexError, ValueError) as e:
+        raise CorruptSnapshotError(str(e)) from e
+
+
+def load_snapshot(filename, datastore):
+    """
+    Load the snapshot at filename into datastore and return its aux fields,
+    or None if there is no snapshot. Keys that expired while the server was
+    down are skipped.
+
+    The checksum of the whole file is verified before anything is loaded,
+    so if CorruptSnapshotError is raised datastore is left untouched.
+    """
+    try:
+        f = open(filename, 'rb')
+    except FileNotFoundError:
+        return None
+
+    # As with the AOF, every object allocated during the load survives it.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            if size < len(_HEADER) + 5:
+                raise CorruptSnapshotError('snapshot is truncated')
+            with memoryview(data) as view:
+                checksum = zlib.crc32(view[:size - 4])
+            if checksum != _UINT32.unpack_from(data, size - 4)[0]:
+                raise CorruptSnapshotError('snapshot checksum mismatch')
+
+            aux, end = load_snapshot_data(data, datastore)
+            if end != size:
+                raise CorruptSnapshotError('unexpected data after the snapshot')
+            return aux
+    except ValueError as e:
+        raise CorruptSnapshotError(str(e)) from e
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def snapshot_aux(**fields):
+    """Build an aux mapping, with the creation time, from int or bytes fields."""
+    aux = {b'ctime': b'%d' % (time_ns() // 10 ** 6)}
+    for name, value in fields.items():
+        aux[name.replace('_', '-').encode()] = to_bytes(value)
+    return aux
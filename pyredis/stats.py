@@ -0,0 +1,193 @@
+from collections import deque
+from time import monotonic, perf_counter_ns, time
+
+# Each power of two of the latency range is split into 2 ** SUB_BUCKET_BITS
+# buckets, so a recorded latency is known to within 1 / 2 ** SUB_BUCKET_BITS
+# of its value, as in an HdrHistogram with one significant binary digit of
+# precision per bucket bit.
+SUB_BUCKET_BITS = 3
+
+# Latency events at least this long are recorded by the latency monitor, as
+# with Redis's latency-monitor-threshold. 0 turns the monitor off.
+LATENCY_MONITOR_THRESHOLD_MS = 10
+
+# Samples kept per latency event, and the number of command counts that the
+# instantaneous rate is taken over.
+LATENCY_HISTORY_SIZE = 160
+OPS_SAMPLES = 16
+
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_SUB_BUCKET_MASK = _SUB_BUCKETS - 1
+# Enough buckets for any 64 bit number of nanoseconds.
+_BUCKETS = (64 - SUB_BUCKET_BITS) << SUB_BUCKET_BITS
+
+
+def bucket_index(value):
+    """Return the histogram bucket a value belongs in."""
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) << SUB_BUCKET_BITS | (value >> shift) & _SUB_BUCKET_MASK
+
+
+def bucket_lowest(index):
+    """Return the smallest value that falls in bucket index."""
+    if index < _SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return (index & _SUB_BUCKET_MASK | _SUB_BUCKETS) << shift
+
+
+def percentile(counts, percent):
+    """
+    Return the upper bound of the bucket holding the given percentile of
+    the values counted by bucket in counts, 0 if there are none.
+    """
+    total = sum(counts)
+    if not total:
+        return 0
+    wanted = max(1, -(-total * percent // 100))
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if seen >= wanted:
+            return bucket_lowest(index + 1) - 1
+    return 0
+
+
+class CommandStats:
+    """
+    Calls, time spent and latencies of one command, as in INFO commandstats.
+    Latencies in nanoseconds are counted in log-linear buckets, as in an
+    HdrHistogram, so recording one is a few integer operations and
+    percentiles are accurate to the bucket width whatever the range.
+    """
+
+    __slots__ = ('calls', 'failed_calls', 'total_ns', 'counts')
+
+    def __init__(self):
+        self.calls = 0
+        self.failed_calls = 0
+        self.total_ns = 0
+        self.counts = [0] * _BUCKETS
+
+    def percentile(self, percent):
+        return percentile(self.counts, percent)
+
+
+class Stats:
+    """
+    Instrumentation of the server: counts and latency histograms of the
+    commands run, and the latency monitor, which keeps the recent history
+    of events, such as slow commands or long expiry cycles, that stall the
+    server for at least threshold_ms. Nothing is recorded while enabled is
+    False, so turning it off leaves a single check per command.
+    """
+
+    def __init__(self, enabled=True, threshold_ms=LATENCY_MONITOR_THRESHOLD_MS):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.started = monotonic()
+        self.reset()
+
+    @property
+    def threshold_ms(self):
+        return self._threshold_ms
+
+    @threshold_ms.setter
+    def threshold_ms(self, threshold_ms):
+        self._threshold_ms = threshold_ms
+        # Commands are compared against this on every call, without a
+        # threshold no command is slow enough.
+        self._command_threshold_ns = threshold_ms * 1_000_000 if threshold_ms else float('inf')
+
+    @property
+    def total_commands(self):
+        return sum(stats.calls for stats in self.commands.values())
+
+    def reset(self):
+        """Clear everything recorded so far, as CONFIG RESETSTAT does."""
+        self.commands = {}
+        self._ops_samples = deque(maxlen=OPS_SAMPLES)
+        self.latency_events = {}
+
+    def reset_latency(self, events=None):
+        """Clear the history of events, or of all of them. Returns how many were cleared."""
+        if events is None:
+            events = list(self.latency_events)
+        return sum(self.latency_events.pop(event, None) is not None for event in events)
+
+    def record_command(self, name, elapsed_ns, failed):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        stats.calls += 1
+        stats.total_ns += elapsed_ns
+        # bucket_index, inlined as this runs for every command.
+        if elapsed_ns < _SUB_BUCKETS:
+            stats.counts[elapsed_ns] += 1
+        else:
+            shift = elapsed_ns.bit_length() - SUB_BUCKET_BITS - 1
+            stats.counts[(shift + 1) << SUB_BUCKET_BITS | (elapsed_ns >> shift) & _SUB_BUCKET_MASK] += 1
+        if failed:
+            stats.failed_calls += 1
+        if elapsed_ns >= self._command_threshold_ns:
+            self.latency_event('command', elapsed_ns)
+
+    def latency_event(self, event, elapsed_ns):
+        """Note that event took elapsed_ns, if that is long enough to be of interest."""
+        if not self.enabled or not self.threshold_ms:
+            return
+        elapsed_ms = elapsed_ns // 1_000_000
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        history = self.latency_events.get(event)
+        if history is None:
+            history = self.latency_events[event] = deque(maxlen=LATENCY_HISTORY_SIZE)
+        history.append((int(time()), elapsed_ms))
+
+    def latency_latest(self):
+        """Return (event, time, latest ms, max ms) for every event with a history."""
+        return [
+            (event, history[-1][0], history[-1][1], max(ms for _, ms in history))
+            for event, history in self.latency_events.items()
+        ]
+
+    def track_ops(self):
+        """Sample the command count, meant to be called periodically."""
+        if self.enabled:
+            self._ops_samples.append((monotonic(), self.total_commands))
+
+    @property
+    def ops_per_sec(self):
+        """Commands per second over the recent samples taken by track_ops."""
+        samples = self._ops_samples
+        if len(samples) < 2:
+            return 0
+        (start, first), (end, last) = samples[0], samples[-1]
+        return round((last - first) / (end - start)) if end > start else 0
+
+
+STATS = Stats()
+
+
+class LatencyTimer:
+    """
+    Time a block of code as a latency event of STATS:
+
+        with LatencyTimer('expire-cycle'):
+            datastore.remove_expired_keys()
+    """
+
+    __slots__ = ('event', 'start')
+
+    def __init__(self, event):
+        self.event = event
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        STATS.latency_event(self.event, perf_counter_ns() - self.start)
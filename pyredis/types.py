@@ -2,12 +2,22 @@ from collections.abc import Sequence
 from dataclasses import dataclass
 from typing import Any
 
+# Replies that are sent on the hot path are encoded once up front and
+# written without any formatting.
+_SHARED_INTEGERS = 10000
+_ENCODED_INTEGERS = [b':%d\r\n' % i for i in range(_SHARED_INTEGERS)]
+_ENCODED_SIMPLE_STRINGS = {s: f'+{s}\r\n'.encode() for s in ('OK', 'PONG', 'QUEUED')}
+_ENCODED_NULL_BULK_STRING = b'$-1\r\n'
+
 
 @dataclass
 class SimpleString:
     data: str
 
     def resp_encode(self):
+        encoded = _ENCODED_SIMPLE_STRINGS.get(self.data)
+        if encoded is not None:
+            return encoded
         return f'+{self.data}\r\n'.encode()
 
     def as_str(self):
@@ -30,7 +40,9 @@ class Integer:
     value: int
 
     def resp_encode(self):
-        return f':{self.value}\r\n'.encode()
+        if 0 <= self.value < _SHARED_INTEGERS:
+            return _ENCODED_INTEGERS[self.value]
+        return b':%d\r\n' % self.value
 
     def as_str(self):
         return str(self.value)
@@ -41,20 +53,18 @@ class BulkString:
     data: bytes
 
     def resp_encode(self):
-        if self.data == '':
-            return f'${0}\r\n\r\n'.encode()
-        elif self.data is None:
-            return f'${-1}\r\n'.encode()
-        return f'${len(self.data)}\r\n{self.data}\r\n'.encode()
+        if self.data is None:
+            return _ENCODED_NULL_BULK_STRING
+        data = self.data.encode() if isinstance(self.data, str) else self.data
+        return b'$%d\r\n%b\r\n' % (len(data), data)
 
     def as_str(self):
+        if self.data is None:
+            return '(nil)'
         return str(self.data.decode())
 
     def file_encode(self):
-        if self.data is None:
-            return b"$-1\r\n"
-
-        return f"${len(self.data)}\r\n{self.data.decode()}\r\n".encode()
+        return self.resp_encode()
 
 
 @dataclass
@@ -76,8 +86,16 @@ class Array(Sequence):
     def __getitem__(self, index: int) -> Any:
         return self.data[index]
 
+    def __iter__(self):
+        return iter(self.data)
+
     def __len__(self) -> int:
         return len(self.data)
 
     def as_str(self):
         return '[' + ','.join([str(s) for s in self.data]) + ']'
+
+
+OK = SimpleString('OK')
+PONG = SimpleString('PONG')
+NULL_BULK_STRING = BulkString(None)
@@ -0,0 +1,22 @@
+def as_integer(value):
+    """Return value as an int if it is the canonical form of a 64 bit integer, else None."""
+    if len(value) > 20 or not value[-1:].isdigit():
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    if b'%d' % number != value or not -2 ** 63 <= number < 2 ** 63:
+        return None
+    return number
+
+
+def normalise_range(start, stop, size):
+    """Convert Redis style inclusive, possibly negative, indexes to a slice."""
+    if start < 0:
+        start += size
+    if stop < 0:
+        stop += size
+    start = max(start, 0)
+    stop = min(stop, size - 1)
+    return start, stop + 1
@@ -0,0 +1,252 @@
+import sys
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+from pyredis.utils import normalise_range
+
+# Members per chunk of the ordered index. A chunk is split in two once it
+# reaches twice this.
+CHUNK_SIZE = 1024
+
+_score = itemgetter(0)
+_LIST_SIZE = sys.getsizeof([])
+_MAX_SIZE = sys.getsizeof((0.0, b''))
+
+
+def format_score(score):
+    """Return a score as Redis replies with it, the shortest form that reads back as the same float."""
+    if score.is_integer() and -2 ** 53 <= score <= 2 ** 53:
+        return b'%d' % score
+    return repr(score).encode()
+
+
+class SortedSet:
+    """
+    The sorted set type. As in Redis, a dict maps each member to its score
+    and an ordered index holds the members sorted by score, then member.
+    The index is a list of chunks, each a sorted list of up to twice
+    CHUNK_SIZE scores alongside the list of their members, so there is no
+    node or tuple per member. The last score and member of every chunk are
+    kept for bisection to the chunk a member belongs in, and a Fenwick tree
+    of the chunk lengths gives the rank of a chunk's first member, and the
+    chunk holding a given rank, in O(log n). So inserts, deletes, ranks and
+    the start of a range are O(log n), plus a memmove within one chunk, and
+    a range of k members costs O(log n + k) rather than a sort.
+    """
+
+    __slots__ = ('_scores', '_score_chunks', '_member_chunks', '_maxes', '_index', '_element_bytes')
+
+    def __init__(self, items=()):
+        # Member to score, the last score given for a member wins.
+        self._scores = dict(items)
+        ordered = sorted(self._scores.items(), key=lambda item: (item[1], item[0]))
+        self._member_chunks = [
+            [member for member, _ in ordered[i:i + CHUNK_SIZE]] for i in range(0, len(ordered), CHUNK_SIZE)
+        ]
+        self._score_chunks = [
+            [score for _, score in ordered[i:i + CHUNK_SIZE]] for i in range(0, len(ordered), CHUNK_SIZE)
+        ]
+        self._maxes = [(scores[-1], members[-1]) for scores, members in zip(self._score_chunks, self._member_chunks)]
+        self._index = []
+        self._rebuild_index()
+        # Total sys.getsizeof of the members and scores, kept up to date so
+        # the size of the set is known without walking it.
+        self._element_bytes = sum(sys.getsizeof(member) + sys.getsizeof(score) for member, score in ordered)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, member):
+        return member in self._scores
+
+    def __eq__(self, other):
+        if not isinstance(other, SortedSet):
+            return NotImplemented
+        return self._scores == other._scores
+
+    def __repr__(self):
+        return f'SortedSet({self.items()!r})'
+
+    def memory_usage(self):
+        """Estimate the bytes used by the sorted set, its dict, index, members and scores."""
+        chunks = len(self._maxes)
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self._scores) + self._element_bytes
+            # Both lists of each chunk, with a slot per member, and its max.
+            + chunks * (2 * _LIST_SIZE + _MAX_SIZE) + 2 * 8 * len(self._scores)
+            + sys.getsizeof(self._member_chunks) + sys.getsizeof(self._score_chunks)
+            + sys.getsizeof(self._maxes) + sys.getsizeof(self._index)
+        )
+
+    def _rebuild_index(self):
+        """Rebuild the Fenwick tree of chunk lengths, after chunks are split or removed."""
+        index = [0] + [len(chunk) for chunk in self._score_chunks]
+        size = len(index)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                index[parent] += index[i]
+        self._index = index
+
+    def _index_add(self, chunk, delta):
+        index = self._index
+        size = len(index)
+        i = chunk + 1
+        while i < size:
+            index[i] += delta
+            i += i & -i
+
+    def _rank_of_chunk(self, chunk):
+        """The number of members in the chunks before chunk."""
+        index = self._index
+        rank = 0
+        while chunk:
+            rank += index[chunk]
+            chunk -= chunk & -chunk
+        return rank
+
+    def _locate(self, rank):
+        """Return the chunk holding rank, which must be in range, and its position in it."""
+        index = self._index
+        chunk = 0
+        step = 1 << (len(index).bit_length() - 1)
+        while step:
+            i = chunk + step
+            if i < len(index) and index[i] <= rank:
+                chunk = i
+                rank -= index[i]
+            step >>= 1
+        return chunk, rank
+
+    def _find(self, member, score):
+        """Return the chunk and position at which member, with score, is or would be."""
+        chunk = bisect_left(self._maxes, (score, member))
+        if chunk == len(self._maxes):
+            chunk -= 1
+        scores = self._score_chunks[chunk]
+        start = bisect_left(scores, score)
+        end = bisect_right(scores, score, start)
+        return chunk, bisect_left(self._member_chunks[chunk], member, start, end)
+
+    def score(self, member):
+        """Return the score of member, None if it is not in the set."""
+        return self._scores.get(member)
+
+    def add(self, member, score):
+        """Add member with score, or move it to score. Returns its previous score, None if it is new."""
+        old = self._scores.get(member)
+        if old is not None:
+            if old == score:
+                return old
+            self._remove_from_index(member, old)
+            self._element_bytes -= sys.getsizeof(old)
+        else:
+            self._element_bytes += sys.getsizeof(member)
+        self._scores[member] = score
+        self._element_bytes += sys.getsizeof(score)
+
+        if not self._maxes:
+            self._score_chunks.append([score])
+            self._member_chunks.append([member])
+            self._maxes.append((score, member))
+            self._rebuild_index()
+            return old
+
+        chunk, position = self._find(member, score)
+        scores = self._score_chunks[chunk]
+        members = self._member_chunks[chunk]
+        scores.insert(position, score)
+        members.insert(position, member)
+        if position == len(scores) - 1:
+            self._maxes[chunk] = (score, member)
+
+        if len(scores) >= 2 * CHUNK_SIZE:
+            self._score_chunks.insert(chunk + 1, scores[CHUNK_SIZE:])
+            self._member_chunks.insert(chunk + 1, members[CHUNK_SIZE:])
+            del scores[CHUNK_SIZE:]
+            del members[CHUNK_SIZE:]
+            self._maxes.insert(chunk, (scores[-1], members[-1]))
+            self._rebuild_index()
+        else:
+            self._index_add(chunk, 1)
+        return old
+
+    def remove(self, member):
+        """Remove member, returning whether it was there."""
+        score = self._scores.pop(member, None)
+        if score is None:
+            return False
+        self._remove_from_index(member, score)
+        self._element_bytes -= sys.getsizeof(member) + sys.getsizeof(score)
+        return True
+
+    def _remove_from_index(self, member, score):
+        chunk, position = self._find(member, score)
+        scores = self._score_chunks[chunk]
+        members = self._member_chunks[chunk]
+        del scores[position]
+        del members[position]
+
+        if not scores:
+            del self._score_chunks[chunk]
+            del self._member_chunks[chunk]
+            del self._maxes[chunk]
+            self._rebuild_index()
+            return
+        if position == len(scores):
+            self._maxes[chunk] = (scores[-1], members[-1])
+        self._index_add(chunk, -1)
+
+    def rank(self, member):
+        """Return the 0 based rank of member, lowest score first, or None if it is not in the set."""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        chunk, position = self._find(member, score)
+        return self._rank_of_chunk(chunk) + position
+
+    def score_range(self, minimum, maximum, exclude_minimum=False, exclude_maximum=False):
+        """
+        Return the ranks first and stop such that the members from first up
+        to but not including stop are those with scores from minimum to
+        maximum, each bound exclusive if the matching flag is set.
+        """
+        return self._bisect_score(minimum, exclude_minimum), self._bisect_score(maximum, not exclude_maximum)
+
+    def _bisect_score(self, score, after):
+        """The rank of the first member with a score at least score, or past it if after is True."""
+        bisect = bisect_right if after else bisect_left
+        chunk = bisect(self._maxes, score, key=_score)
+        if chunk == len(self._maxes):
+            return len(self._scores)
+        return self._rank_of_chunk(chunk) + bisect(self._score_chunks[chunk], score)
+
+    def slice(self, first, stop):
+        """Return the (member, score) pairs of ranks first up to but not including stop."""
+        count = min(stop, len(self._scores)) - first
+        if first < 0 or count <= 0:
+            return []
+
+        chunk, position = self._locate(first)
+        members = []
+        scores = []
+        while len(members) < count:
+            end = position + count - len(members)
+            members += self._member_chunks[chunk][position:end]
+            scores += self._score_chunks[chunk][position:end]
+            chunk += 1
+            position = 0
+        return list(zip(members, scores))
+
+    def range(self, start, stop):
+        """Return the (member, score) pairs from rank start to stop inclusive, as ZRANGE does."""
+        return self.slice(*normalise_range(start, stop, len(self._scores)))
+
+    def items(self):
+        """Return every (member, score) pair, in order."""
+        return self.slice(0, len(self._scores))
+
+    def __iter__(self):
+        """Iterate over every (member, score) pair, in order, without building a list."""
+        for members, scores in zip(self._member_chunks, self._score_chunks):
+            yield from zip(members, scores)
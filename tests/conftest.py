@@ -0,0 +1,47 @@
+from pyredis.types import Array, BulkString
+
+
+def command(*args):
+    """The frame a client sends for a command with the given arguments."""
+    return Array([BulkString(arg) for arg in args])
+
+
+def encoded_command(*args):
+    """The bytes a client sends for a command with the given arguments."""
+    return command(*args).resp_encode()
+
+
+def redis_range(items, start, stop):
+    """The items from start to stop inclusive, as LRANGE and ZRANGE pick them."""
+    size = len(items)
+    start = max(start + size if start < 0 else start, 0)
+    stop = stop + size if stop < 0 else stop
+    return items[start:stop + 1] if start <= stop else []
+
+
+class FakeTransport:
+    def __init__(self):
+        self.writes = []
+        self.closed = False
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+class RecordingPersister:
+    def __init__(self):
+        self.logged = []
+        self.flushed = []
+
+    def log_command(self, command):
+        self.logged.append(command)
+
+    def flush(self):
+        self.flushed.extend(self.logged)
+        self.logged = []
@@ -0,0 +1,342 @@
+import asyncio
+import socket
+import sys
+import types
+
+import pytest
+
+from pyredis.asyncserver import (
+    OutputBufferLimit, RedisServerProtocol, ServerOptions, create_server, loop_factory, run,
+)
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.protocol import PROTO_MAX_BULK_LEN
+from pyredis.types import Array, BulkString, Error
+
+from conftest import FakeTransport, RecordingPersister, encoded_command
+
+
+@pytest.fixture
+def protocol():
+    protocol = RedisServerProtocol(Datastore())
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def test_single_command(protocol):
+    protocol.data_received(b"*1\r\n$4\r\nPING\r\n")
+    assert protocol.transport.writes == [b"+PONG\r\n"]
+
+
+def test_pipelined_commands_single_write(protocol):
+    protocol.data_received(b"*1\r\n$4\r\nPING\r\n" * 100)
+    assert protocol.transport.writes == [b"+PONG\r\n" * 100]
+
+
+def test_pipelined_commands_partial_frame(protocol):
+    protocol.data_received(b"*1\r\n$4\r\nPING\r\n*1\r\n$4\r\nPI")
+    assert protocol.transport.writes == [b"+PONG\r\n"]
+    protocol.data_received(b"NG\r\n")
+    assert protocol.transport.writes == [b"+PONG\r\n", b"+PONG\r\n"]
+
+
+def test_incomplete_frame_no_write(protocol):
+    protocol.data_received(b"*1\r\n$4\r\nPI")
+    assert protocol.transport.writes == []
+
+
+def test_large_value_split_across_reads(protocol):
+    value = b"x" * 100_000
+    message = b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$%d\r\n%b\r\n" % (len(value), value)
+    for i in range(0, len(message), 2048):
+        protocol.data_received(message[i:i + 2048])
+    assert protocol.transport.writes == [b"+OK\r\n"]
+
+
+def test_empty_command_gets_an_error(protocol):
+    protocol.data_received(b"*0\r\n*1\r\n$4\r\nPING\r\n")
+    assert protocol.transport.writes == [b"-ERR empty command\r\n+PONG\r\n"]
+
+
+@pytest.mark.parametrize("bad", [b"*x\r\n", b"$%d\r\n" % (PROTO_MAX_BULK_LEN + 1), b"PING\r\n"])
+def test_protocol_error_answers_earlier_commands_and_closes(protocol, bad):
+    protocol.data_received(b"*1\r\n$4\r\nPING\r\n" + bad + b"*1\r\n$4\r\nPING\r\n")
+    assert protocol.transport.writes == [b"+PONG\r\n-ERR Protocol error\r\n"]
+    assert protocol.transport.closed
+
+
+def test_writes_are_logged_before_replying():
+    persister = RecordingPersister()
+    protocol = RedisServerProtocol(Datastore(), persister)
+    transport = FakeTransport()
+    protocol.connection_made(transport)
+
+    def write(data):
+        assert not persister.logged
+        transport.writes.append(data)
+
+    transport.write = write
+    protocol.data_received(
+        b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\nv\r\n"
+        b"*2\r\n$3\r\nGET\r\n$1\r\nk\r\n"
+        b"*2\r\n$4\r\nINCR\r\n$1\r\nc\r\n"
+    )
+
+    assert transport.writes == [b"+OK\r\n$1\r\nv\r\n:1\r\n"]
+    assert [[item.data for item in command] for command in persister.flushed] == [
+        [b"SET", b"k", b"v"],
+        [b"INCR", b"c"],
+    ]
+
+
+def test_loop_factory_falls_back_to_asyncio(monkeypatch):
+    monkeypatch.setitem(sys.modules, "uvloop", None)
+    assert loop_factory("auto") is asyncio.new_event_loop
+    assert loop_factory("asyncio") is asyncio.new_event_loop
+    with pytest.raises(ImportError):
+        loop_factory("uvloop")
+
+
+def test_loop_factory_prefers_uvloop(monkeypatch):
+    uvloop = types.ModuleType("uvloop")
+    uvloop.new_event_loop = asyncio.new_event_loop
+    monkeypatch.setitem(sys.modules, "uvloop", uvloop)
+    assert loop_factory("auto") is uvloop.new_event_loop
+    assert loop_factory("asyncio") is asyncio.new_event_loop
+
+
+def test_loop_factory_unknown_backend():
+    with pytest.raises(ValueError):
+        loop_factory("twisted")
+
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+@pytest.mark.parametrize("backend", [
+    "asyncio",
+    pytest.param("uvloop", marks=pytest.mark.skipif(uvloop is None, reason="uvloop is not installed")),
+])
+@pytest.mark.parametrize("tcp_nodelay", [True, False])
+def test_create_server_options(backend, tcp_nodelay):
+    options = ServerOptions(tcp_nodelay=tcp_nodelay, backlog=16, recv_buffer_size=65536, read_size=16)
+    protocols = []
+
+    def factory():
+        protocols.append(RedisServerProtocol(Datastore(thread_safe=False)))
+        return protocols[-1]
+
+    async def session():
+        server = await create_server(factory, "127.0.0.1", 0, options)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+        # Far larger than a single read.
+        value = b"x" * 1000
+        writer.write(b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$1000\r\n%b\r\n*2\r\n$3\r\nGET\r\n$1\r\nk\r\n" % value)
+        reply = await reader.readexactly(len(b"+OK\r\n$1000\r\n\r\n") + 1000)
+
+        accepted = protocols[0].transport.get_extra_info("socket")
+        nodelay = accepted.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        recv_buffer = accepted.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return reply, nodelay, recv_buffer
+
+    reply, nodelay, recv_buffer = run(session(), backend)
+    assert reply == b"+OK\r\n$1000\r\n" + b"x" * 1000 + b"\r\n"
+    assert bool(nodelay) == tcp_nodelay
+    assert recv_buffer >= 65536
+    assert len(protocols[0].read_buffer) == 16
+
+
+async def _connect(port, recv_buffer_size=0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if recv_buffer_size:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buffer_size)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    return sock
+
+
+async def _recv_exactly(sock, size):
+    loop = asyncio.get_running_loop()
+    data = bytearray()
+    while len(data) < size:
+        chunk = await loop.sock_recv(sock, size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+async def _client_list(sock):
+    """Return the fields of each line of CLIENT LIST, by client id."""
+    loop = asyncio.get_running_loop()
+    await loop.sock_sendall(sock, encoded_command(b"CLIENT", b"LIST"))
+    header = await loop.sock_recv(sock, 65536)
+    size, _, body = header.partition(b"\r\n")
+    body += await _recv_exactly(sock, int(size[1:]) + 2 - len(body))
+    clients = {}
+    for line in body[:-2].decode().splitlines():
+        fields = dict(field.split("=", 1) for field in line.split())
+        clients[int(fields["id"])] = fields
+    return clients
+
+
+def _serve_slow_client(limit, check):
+    """
+    Start a server with limit, have a client with a small receive buffer
+    ask for far more than the buffers hold without reading it, and pass
+    check the client's socket, its server-side protocol and another client.
+    """
+    protocols = []
+    value = b"x" * 2 ** 20
+
+    def factory():
+        protocols.append(RedisServerProtocol(datastore))
+        return protocols[-1]
+
+    datastore = Datastore(thread_safe=False)
+    datastore[b"big"] = value
+    reply = b"$%d\r\n%b\r\n" % (len(value), value)
+
+    async def session():
+        server = await create_server(factory, "127.0.0.1", 0, ServerOptions(output_buffer_limit=limit))
+        port = server.sockets[0].getsockname()[1]
+        slow = await _connect(port, recv_buffer_size=4096)
+        other = await _connect(port)
+        loop = asyncio.get_running_loop()
+
+        await loop.sock_sendall(slow, encoded_command(b"GET", b"big") * 8)
+        await asyncio.sleep(0.05)
+        # Sent while the server is not reading from the client.
+        await loop.sock_sendall(slow, encoded_command(b"PING"))
+        await check(slow, protocols[0], other, reply)
+
+        slow.close()
+        other.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(session())
+
+
+def test_client_list_and_id():
+    protocols = []
+
+    def factory():
+        protocols.append(RedisServerProtocol(Datastore(thread_safe=False)))
+        return protocols[-1]
+
+    async def session():
+        server = await create_server(factory, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        first, second = await _connect(port), await _connect(port)
+        loop = asyncio.get_running_loop()
+
+        await loop.sock_sendall(first, encoded_command(b"SET", b"k", b"v"))
+        assert await _recv_exactly(first, 5) == b"+OK\r\n"
+        await loop.sock_sendall(second, encoded_command(b"CLIENT", b"ID"))
+        second_id = await loop.sock_recv(second, 100)
+        clients = await _client_list(second)
+
+        first.close()
+        await asyncio.sleep(0.05)
+        remaining = await _client_list(second)
+
+        second.close()
+        server.close()
+        await server.wait_closed()
+        return second_id, clients, remaining
+
+    second_id, clients, remaining = asyncio.run(session())
+    first, second = protocols
+    assert second_id == b":%d\r\n" % second.id
+    assert set(clients) == {first.id, second.id}
+    assert clients[first.id]["cmd"] == "set"
+    assert clients[first.id]["addr"].startswith("127.0.0.1:")
+    assert clients[first.id]["events"] == "r"
+    assert clients[first.id]["omem"] == "0"
+    assert clients[second.id]["cmd"] == "client"
+    assert set(remaining) == {second.id}
+
+
+@pytest.mark.parametrize("frame", [b"*0\r\n", b"*-1\r\n", b"+PING\r\n", b"*1\r\n:1\r\n"])
+def test_client_list_after_a_frame_that_is_not_a_command(frame):
+    protocols = []
+
+    def factory():
+        protocols.append(RedisServerProtocol(Datastore(thread_safe=False)))
+        return protocols[-1]
+
+    async def session():
+        server = await create_server(factory, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        first, second = await _connect(port), await _connect(port)
+        loop = asyncio.get_running_loop()
+
+        await loop.sock_sendall(first, frame + encoded_command(b"PING"))
+        assert (await loop.sock_recv(first, 1000)).endswith(b"+PONG\r\n")
+        # Only the frame, with no command after it.
+        await loop.sock_sendall(first, frame)
+        await loop.sock_recv(first, 1000)
+        clients = await _client_list(second)
+
+        first.close()
+        second.close()
+        server.close()
+        await server.wait_closed()
+        return clients
+
+    clients = asyncio.run(session())
+    assert clients[protocols[0].id]["cmd"] == "NULL"
+    assert clients[protocols[1].id]["cmd"] == "client"
+
+
+def test_slow_client_is_not_read_while_paused():
+    async def check(slow, protocol, other, reply):
+        clients = await _client_list(other)
+        # Paused: replies are waiting and the client's commands are not read.
+        assert clients[protocol.id]["events"] == "w"
+        assert int(clients[protocol.id]["omem"]) > 0
+
+        assert await _recv_exactly(slow, 8 * len(reply) + 7) == reply * 8 + b"+PONG\r\n"
+        clients = await _client_list(other)
+        assert clients[protocol.id]["events"] == "r"
+        assert clients[protocol.id]["omem"] == "0"
+
+    _serve_slow_client(OutputBufferLimit(hard_limit=0, soft_limit=0), check)
+
+
+def test_slow_client_over_hard_limit_is_disconnected():
+    async def check(slow, protocol, other, reply):
+        assert protocol.id not in await _client_list(other)
+        # The replies still buffered are dropped.
+        try:
+            received = await _recv_exactly(slow, 8 * len(reply) + 7)
+        except ConnectionResetError:
+            received = b""
+        assert len(received) < 4 * len(reply)
+
+    _serve_slow_client(OutputBufferLimit(hard_limit=4 * 2 ** 20, soft_limit=0), check)
+
+
+def test_slow_client_over_soft_limit_is_disconnected():
+    async def check(slow, protocol, other, reply):
+        # Over the soft limit, but not yet for long enough.
+        assert protocol.id in await _client_list(other)
+        await asyncio.sleep(0.3)
+        assert protocol.id not in await _client_list(other)
+
+    _serve_slow_client(OutputBufferLimit(hard_limit=0, soft_limit=2 ** 20, soft_seconds=0.2), check)
+
+
+def test_client_needs_a_connection():
+    reply = handle_command(Array([BulkString(b"CLIENT"), BulkString(b"LIST")]), Datastore())
+    assert reply == Error("ERR CLIENT is not supported on this connection")
@@ -3,10 +3,13 @@ from time import sleep, time_ns, time
 import pytest
 
 from pyredis.commands import handle_command
-from pyredis.datastore import Datastore
+from pyredis.datastore import ALLKEYS_LRU, Datastore
+from pyredis.persistence import AppendOnlyPersister, load_aof
 from pyredis.types import Array, BulkString, Error, SimpleString, Integer
 from contextlib import nullcontext as does_not_raise
 
+from conftest import RecordingPersister
+
 
 @pytest.mark.parametrize(
     "command, expected",
@@ -54,8 +57,8 @@ def test_handle_command(command, expected):
                 Error("ERR wrong number of arguments for 'exists' command"),
                 does_not_raise()
         ),
-        (Array([BulkString(b"exists"), SimpleString(b"invalid key")]), Integer(0), pytest.raises(KeyError)),
-        (Array([BulkString(b"exists"), SimpleString(b"key")]), Integer(1), pytest.raises(KeyError)),
+        (Array([BulkString(b"exists"), SimpleString(b"invalid key")]), Integer(0), does_not_raise()),
+        (Array([BulkString(b"exists"), SimpleString(b"key")]), Integer(1), does_not_raise()),
         (
                 Array(
                     [
@@ -65,13 +68,13 @@ def test_handle_command(command, expected):
                     ]
                 ),
                 Integer(1),
-                pytest.raises(KeyError)
+                does_not_raise()
         ),
     ],
 )
 def test_handle_command(command, expected, expectation):
     with expectation:
-        datastore = Datastore()
+        datastore = Datastore({b"key": b"value"})
         result = handle_command(command, datastore)
         assert result == expected
 
@@ -79,7 +82,7 @@ def test_handle_command(command, expected, expectation):
 def test_set_and_get_item():
     ds = Datastore()
     ds['key'] = 1
-    assert ds['key'] == 1
+    assert ds['key'] == b'1'
 
 
 def test_expire_on_reads():
@@ -113,8 +116,8 @@ def test_get_with_expiry():
 
 def test_set_with_expiry():
     datastore = Datastore()
-    key = 'key'
-    value = 'value'
+    key = b'key'
+    value = b'value'
     ex = 1
     px = 100
 
@@ -126,9 +129,8 @@ def test_set_with_expiry():
     expected_expiry = time_ns() + (ex * 10 ** 9)
     result = handle_command(command, datastore)
     assert result == SimpleString('OK')
-    stored = datastore._data[key]
-    assert stored.value == value
-    diff = - expected_expiry - stored.expiry
+    assert datastore._data[key] == value
+    diff = - expected_expiry - datastore._expires[key]
     assert diff < 10000
 
     # milliseconds
@@ -137,12 +139,24 @@ def test_set_with_expiry():
     expected_expiry = time_ns() + (px * 10 ** 6)
     result = handle_command(command, datastore)
     assert result == SimpleString('OK')
-    stored = datastore._data[key]
-    assert stored.value == value
-    diff = - expected_expiry - stored.expiry
+    assert datastore._data[key] == value
+    diff = - expected_expiry - datastore._expires[key]
     assert diff < 10000
 
 
+def test_set_with_absolute_expiry():
+    datastore = Datastore()
+    seconds = time() + 100
+    assert _run(datastore, b"set", b"k", b"v", b"EXAT", b"%d" % seconds) == SimpleString("OK")
+    assert datastore._expires[b"k"] == int(seconds) * 10 ** 9
+    assert _run(datastore, b"set", b"k", b"v", b"pxat", b"%d" % (seconds * 1000)) == SimpleString("OK")
+    assert datastore._expires[b"k"] == int(seconds * 1000) * 10 ** 6
+
+    # A time that has passed leaves the key expired.
+    assert _run(datastore, b"set", b"k", b"v", b"PXAT", b"1") == SimpleString("OK")
+    assert _run(datastore, b"get", b"k") == BulkString(None)
+
+
 # Incr Tests
 def test_handle_incr_command_valid_key():
     datastore = Datastore()
@@ -180,7 +194,7 @@ def test_handle_lpush_lrange():
     assert result == Integer(2)
     result = handle_command(Array([BulkString(b"lrange"), SimpleString(b"klp"), BulkString(b"0"), BulkString(b"2")]),
                             datastore)
-    assert result == Array(data=[BulkString("first"), BulkString("second")])
+    assert result == Array(data=[BulkString(b"first"), BulkString(b"second")])
 
 
 # Rpush Tests
@@ -192,4 +206,405 @@ def test_handle_rpush_lrange():
     assert result == Integer(2)
     result = handle_command(Array([BulkString(b"lrange"), SimpleString(b"krp"), BulkString(b"0"), BulkString(b"2")]),
                             datastore)
-    assert result == Array(data=[BulkString("first"), BulkString("second")])
+    assert result == Array(data=[BulkString(b"first"), BulkString(b"second")])
+
+
+# Dispatch Tests
+def test_command_names_case_insensitive():
+    datastore = Datastore()
+    for name in (b"PING", b"ping", b"PiNg"):
+        assert handle_command(Array([BulkString(name)]), datastore) == SimpleString("PONG")
+
+
+def test_unknown_command():
+    result = handle_command(Array([BulkString(b"foo"), BulkString(b"bar")]), Datastore())
+    assert result == Error("ERR unknown command 'foo', with args beginning with: 'bar'")
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        [b"get"],
+        [b"get", b"k1", b"k2"],
+        [b"set", b"k1"],
+        [b"del"],
+        [b"lrange", b"k1", b"0"],
+    ],
+)
+def test_wrong_number_of_arguments(command):
+    result = handle_command(Array([BulkString(c) for c in command]), Datastore())
+    name = command[0].decode()
+    assert result == Error(f"ERR wrong number of arguments for '{name}' command")
+
+
+def test_only_successful_writes_are_logged():
+    datastore = Datastore()
+    persister = RecordingPersister()
+    set_command = Array([BulkString(b"set"), BulkString(b"k"), BulkString(b"v")])
+    handle_command(set_command, datastore, persister)
+    handle_command(Array([BulkString(b"get"), BulkString(b"k")]), datastore, persister)
+    handle_command(Array([BulkString(b"incr"), BulkString(b"k")]), datastore, persister)
+    assert persister.logged == [set_command]
+
+
+def test_command_info():
+    datastore = Datastore()
+    result = handle_command(
+        Array([BulkString(b"command"), BulkString(b"info"), BulkString(b"get"), BulkString(b"nosuch")]),
+        datastore
+    )
+    assert result == Array([
+        Array([
+            BulkString(b"get"),
+            Integer(2),
+            Array([SimpleString("readonly")]),
+            Integer(1),
+            Integer(1),
+            Integer(1),
+        ]),
+        Array(None),
+    ])
+
+
+def test_command_count():
+    datastore = Datastore()
+    count = handle_command(Array([BulkString(b"command"), BulkString(b"count")]), datastore)
+    listing = handle_command(Array([BulkString(b"command")]), datastore)
+    assert count == Integer(len(listing))
+    set_flags = [info[2] for info in listing if info[0] == BulkString(b"set")]
+    assert Array([SimpleString("write"), SimpleString("denyoom")]) in set_flags
+
+
+def test_values_are_binary_safe():
+    datastore = Datastore()
+    value = "héllo wörld".encode() + bytes(range(256))
+    handle_command(Array([BulkString(b"set"), BulkString(b"k"), BulkString(value)]), datastore)
+    result = handle_command(Array([BulkString(b"get"), BulkString(b"k")]), datastore)
+    assert result == BulkString(value)
+    assert result.resp_encode() == b"$%d\r\n%b\r\n" % (len(value), value)
+
+
+def test_incr_stores_bytes():
+    datastore = Datastore()
+    handle_command(Array([BulkString(b"set"), BulkString(b"k"), BulkString(b"9")]), datastore)
+    handle_command(Array([BulkString(b"incr"), BulkString(b"k")]), datastore)
+    assert handle_command(Array([BulkString(b"get"), BulkString(b"k")]), datastore) == BulkString(b"10")
+
+
+@pytest.mark.parametrize(
+    "value, command, expected",
+    [
+        (b"9223372036854775806", b"incr", Integer(2 ** 63 - 1)),
+        (b"9223372036854775807", b"incr", Error("ERR increment or decrement would overflow")),
+        (b"-9223372036854775807", b"decr", Integer(-2 ** 63)),
+        (b"-9223372036854775808", b"decr", Error("ERR increment or decrement would overflow")),
+        (b"9223372036854775808", b"incr", Error("ERR value is not an integer or out of range")),
+        (b"-9223372036854775809", b"decr", Error("ERR value is not an integer or out of range")),
+    ],
+)
+def test_incr_decr_overflow(value, command, expected):
+    datastore = Datastore()
+    _run(datastore, b"set", b"k", value)
+    assert _run(datastore, command, b"k") == expected
+    if isinstance(expected, Error):
+        assert _run(datastore, b"get", b"k") == BulkString(value)
+
+
+def test_del_and_exists_multiple_keys():
+    datastore = Datastore({b"k1": b"1", b"k2": b"2"})
+    exists = Array([BulkString(b"exists"), BulkString(b"k1"), BulkString(b"k1"), BulkString(b"k3")])
+    assert handle_command(exists, datastore) == Integer(2)
+    delete = Array([BulkString(b"del"), BulkString(b"k1"), BulkString(b"k2"), BulkString(b"k3")])
+    assert handle_command(delete, datastore) == Integer(2)
+    assert handle_command(exists, datastore) == Integer(0)
+
+
+def _run(datastore, *args):
+    return handle_command(Array([BulkString(a) for a in args]), datastore)
+
+
+def test_list_commands():
+    datastore = Datastore()
+    assert _run(datastore, b"rpush", b"l", b"a", b"b", b"c", b"d") == Integer(4)
+    assert _run(datastore, b"lrange", b"l", b"-2", b"-1") == Array([BulkString(b"c"), BulkString(b"d")])
+    assert _run(datastore, b"lrange", b"l", b"1", b"1") == Array([BulkString(b"b")])
+    assert _run(datastore, b"llen", b"l") == Integer(4)
+    assert _run(datastore, b"lindex", b"l", b"-1") == BulkString(b"d")
+    assert _run(datastore, b"lindex", b"l", b"10") == BulkString(None)
+    assert _run(datastore, b"lset", b"l", b"0", b"z") == SimpleString("OK")
+    assert _run(datastore, b"lset", b"l", b"10", b"z") == Error("ERR index out of range")
+    assert _run(datastore, b"lset", b"missing", b"0", b"z") == Error("ERR no such key")
+    assert _run(datastore, b"lpop", b"l") == BulkString(b"z")
+    assert _run(datastore, b"rpop", b"l", b"2") == Array([BulkString(b"d"), BulkString(b"c")])
+    assert _run(datastore, b"ltrim", b"l", b"1", b"0") == SimpleString("OK")
+    assert _run(datastore, b"llen", b"l") == Integer(0)
+    assert _run(datastore, b"lpop", b"l") == BulkString(None)
+    assert _run(datastore, b"rpop", b"l", b"1") == Array(None)
+
+
+@pytest.mark.parametrize(
+    "command, expected",
+    [
+        ((b"lindex", b"l", b"x"), Error("ERR value is not an integer or out of range")),
+        ((b"lrange", b"l", b"0", b"x"), Error("ERR value is not an integer or out of range")),
+        ((b"lpop", b"l", b"-1"), Error("ERR value is out of range, must be positive")),
+        ((b"llen", b"s"), Error("WRONGTYPE Operation against a key holding the wrong kind of value")),
+        ((b"lpush", b"s", b"a"), Error("WRONGTYPE Operation against a key holding the wrong kind of value")),
+    ],
+)
+def test_list_command_errors(command, expected):
+    datastore = Datastore({b"s": b"value"})
+    assert _run(datastore, *command) == expected
+
+
+def test_hash_commands():
+    datastore = Datastore()
+    assert _run(datastore, b"hset", b"h", b"a", b"1", b"b", b"2") == Integer(2)
+    assert _run(datastore, b"HSET", b"h", b"a", b"3", b"c", b"4") == Integer(1)
+    assert _run(datastore, b"hget", b"h", b"a") == BulkString(b"3")
+    assert _run(datastore, b"hget", b"h", b"missing") == BulkString(None)
+    assert _run(datastore, b"hmget", b"h", b"b", b"missing") == Array([BulkString(b"2"), BulkString(None)])
+    assert _run(datastore, b"hgetall", b"h") == Array([BulkString(i) for i in (b"a", b"3", b"b", b"2", b"c", b"4")])
+    assert _run(datastore, b"hgetall", b"missing") == Array([])
+    assert _run(datastore, b"hlen", b"h") == Integer(3)
+    assert _run(datastore, b"hincrby", b"h", b"a", b"-5") == Integer(-2)
+    assert _run(datastore, b"hincrby", b"h", b"n", b"10") == Integer(10)
+    assert _run(datastore, b"hdel", b"h", b"a", b"b", b"missing") == Integer(2)
+    assert _run(datastore, b"hscan", b"h", b"0") == Array([
+        BulkString(b"0"), Array([BulkString(i) for i in (b"c", b"4", b"n", b"10")]),
+    ])
+    assert _run(datastore, b"hscan", b"h", b"0", b"MATCH", b"n*", b"COUNT", b"1") == Array([
+        BulkString(b"0"), Array([BulkString(b"n"), BulkString(b"10")]),
+    ])
+    assert _run(datastore, b"hdel", b"h", b"c", b"n") == Integer(2)
+    assert _run(datastore, b"exists", b"h") == Integer(0)
+
+
+def test_hscan_walks_large_hashes():
+    datastore = Datastore()
+    fields = {b"f%d" % i: b"v%d" % i for i in range(1000)}
+    _run(datastore, b"hset", b"h", *(item for pair in fields.items() for item in pair))
+
+    seen = {}
+    cursor = b"0"
+    while True:
+        reply = _run(datastore, b"hscan", b"h", cursor, b"COUNT", b"100")
+        cursor = reply.data[0].data
+        items = [item.data for item in reply.data[1].data]
+        seen.update(zip(items[::2], items[1::2]))
+        if cursor == b"0":
+            break
+    assert seen == fields
+
+
+@pytest.mark.parametrize(
+    "command, expected",
+    [
+        ((b"hset", b"h", b"f"), Error("ERR wrong number of arguments for 'hset' command")),
+        ((b"hset", b"h", b"f", b"v", b"g"), Error("ERR wrong number of arguments for 'hset' command")),
+        ((b"hincrby", b"h", b"f", b"x"), Error("ERR value is not an integer or out of range")),
+        ((b"hincrby", b"h", b"s", b"1"), Error("ERR hash value is not an integer")),
+        ((b"hincrby", b"h", b"max", b"1"), Error("ERR increment or decrement would overflow")),
+        ((b"hscan", b"h", b"x"), Error("ERR invalid cursor")),
+        ((b"hscan", b"h", b"0", b"COUNT", b"0"), Error("ERR syntax error")),
+        ((b"hscan", b"h", b"0", b"MATCH"), Error("ERR syntax error")),
+        ((b"hget", b"s", b"f"), Error("WRONGTYPE Operation against a key holding the wrong kind of value")),
+        ((b"hset", b"s", b"f", b"v"), Error("WRONGTYPE Operation against a key holding the wrong kind of value")),
+        ((b"hgetall", b"s"), Error("WRONGTYPE Operation against a key holding the wrong kind of value")),
+        ((b"lpush", b"h", b"a"), Error("WRONGTYPE Operation against a key holding the wrong kind of value")),
+    ],
+)
+def test_hash_command_errors(command, expected):
+    datastore = Datastore({b"s": b"value"})
+    datastore.hset(b"h", [(b"s", b"abc"), (b"max", b"%d" % (2 ** 63 - 1))])
+    assert _run(datastore, *command) == expected
+
+
+def test_set_commands():
+    datastore = Datastore()
+    assert _run(datastore, b"sadd", b"a", b"3", b"1", b"2", b"1") == Integer(3)
+    assert _run(datastore, b"SADD", b"b", b"2", b"3", b"4") == Integer(3)
+    assert _run(datastore, b"scard", b"a") == Integer(3)
+    assert _run(datastore, b"sismember", b"a", b"1") == Integer(1)
+    assert _run(datastore, b"sismember", b"a", b"4") == Integer(0)
+    assert _run(datastore, b"smembers", b"a") == Array([BulkString(b"1"), BulkString(b"2"), BulkString(b"3")])
+    assert _run(datastore, b"sinter", b"a", b"b") == Array([BulkString(b"2"), BulkString(b"3")])
+    assert _run(datastore, b"sinter", b"a", b"missing") == Array([])
+    assert sorted(item.data for item in _run(datastore, b"sunion", b"a", b"b").data) == [b"1", b"2", b"3", b"4"]
+    assert _run(datastore, b"srem", b"a", b"1", b"5") == Integer(1)
+    assert _run(datastore, b"srem", b"a", b"2", b"3") == Integer(2)
+    assert _run(datastore, b"exists", b"a") == Integer(0)
+
+
+def test_sorted_set_commands():
+    datastore = Datastore()
+    assert _run(datastore, b"zadd", b"z", b"1", b"a", b"2", b"b", b"2.5", b"c") == Integer(3)
+    assert _run(datastore, b"ZADD", b"z", b"CH", b"5", b"a", b"0", b"d") == Integer(2)
+    assert _run(datastore, b"zadd", b"z", b"INCR", b"1.5", b"b") == BulkString(b"3.5")
+    assert _run(datastore, b"zadd", b"z", b"NX", b"INCR", b"1", b"b") == BulkString(None)
+    assert _run(datastore, b"zcard", b"z") == Integer(4)
+    assert _run(datastore, b"zscore", b"z", b"c") == BulkString(b"2.5")
+    assert _run(datastore, b"zscore", b"z", b"missing") == BulkString(None)
+    assert _run(datastore, b"zrange", b"z", b"0", b"-1") == Array(
+        [BulkString(m) for m in (b"d", b"c", b"b", b"a")]
+    )
+    assert _run(datastore, b"zrange", b"z", b"0", b"1", b"REV", b"WITHSCORES") == Array(
+        [BulkString(i) for i in (b"a", b"5", b"b", b"3.5")]
+    )
+    assert _run(datastore, b"zrange", b"z", b"(2.5", b"+inf", b"BYSCORE", b"LIMIT", b"1", b"5") == Array(
+        [BulkString(b"a")]
+    )
+    assert _run(datastore, b"zrange", b"z", b"+inf", b"2.5", b"BYSCORE", b"REV") == Array(
+        [BulkString(m) for m in (b"a", b"b", b"c")]
+    )
+    assert _run(datastore, b"zrangebyscore", b"z", b"-inf", b"(3.5", b"WITHSCORES") == Array(
+        [BulkString(i) for i in (b"d", b"0", b"c", b"2.5")]
+    )
+    assert _run(datastore, b"zrangebyscore", b"z", b"0", b"10", b"LIMIT", b"-1", b"2") == Array([])
+    assert _run(datastore, b"zrank", b"z", b"b") == Integer(2)
+    assert _run(datastore, b"zrank", b"z", b"missing") == BulkString(None)
+    assert _run(datastore, b"zincrby", b"z", b"-10", b"a") == BulkString(b"-5")
+    assert _run(datastore, b"zrank", b"z", b"a") == Integer(0)
+    assert _run(datastore, b"zrem", b"z", b"a", b"missing") == Integer(1)
+    assert _run(datastore, b"zrem", b"z", b"b", b"c", b"d") == Integer(3)
+    assert _run(datastore, b"exists", b"z") == Integer(0)
+
+
+_WRONGTYPE = Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+@pytest.mark.parametrize(
+    "command, expected",
+    [
+        ((b"sadd", b"str", b"a"), _WRONGTYPE),
+        ((b"sinter", b"s", b"str"), _WRONGTYPE),
+        ((b"sismember", b"z", b"a"), _WRONGTYPE),
+        ((b"zadd", b"s", b"1", b"a"), _WRONGTYPE),
+        ((b"zrange", b"str", b"0", b"-1"), _WRONGTYPE),
+        ((b"zadd", b"z", b"NX", b"1"), Error("ERR syntax error")),
+        ((b"zadd", b"z", b"1", b"a", b"2"), Error("ERR syntax error")),
+        ((b"zadd", b"z", b"x", b"a"), Error("ERR value is not a valid float")),
+        ((b"zadd", b"z", b"nan", b"a"), Error("ERR value is not a valid float")),
+        ((b"zadd", b"z", b"NX", b"XX", b"1", b"a"), Error("ERR XX and NX options at the same time are not compatible")),
+        ((b"zadd", b"z", b"GT", b"LT", b"1", b"a"),
+         Error("ERR GT, LT, and/or NX options at the same time are not compatible")),
+        ((b"zadd", b"z", b"INCR", b"1", b"a", b"2", b"b"),
+         Error("ERR INCR option supports a single increment-element pair")),
+        ((b"zincrby", b"z", b"x", b"a"), Error("ERR value is not a valid float")),
+        ((b"zincrby", b"z", b"-inf", b"inf"), Error("ERR resulting score is not a number (NaN)")),
+        ((b"zrange", b"z", b"0", b"x"), Error("ERR value is not an integer or out of range")),
+        ((b"zrange", b"z", b"0", b"-1", b"LIMIT", b"0", b"1"),
+         Error("ERR syntax error, LIMIT is only supported in combination with either BYSCORE or BYLEX")),
+        ((b"zrange", b"z", b"0", b"-1", b"BYLEX"), Error("ERR syntax error")),
+        ((b"zrangebyscore", b"z", b"(x", b"1"), Error("ERR min or max is not a float")),
+        ((b"zrangebyscore", b"z", b"0", b"1", b"REV"), Error("ERR syntax error")),
+    ],
+)
+def test_set_command_errors(command, expected):
+    datastore = Datastore({b"str": b"value"})
+    datastore.sadd(b"s", [b"a"])
+    datastore.zadd(b"z", [(b"a", 1.0), (b"inf", float("inf"))])
+    assert _run(datastore, *command) == expected
+
+
+@pytest.mark.parametrize("command", [b"get", b"incr", b"decr"])
+@pytest.mark.parametrize("key", [b"l", b"h", b"s", b"z"])
+def test_string_commands_on_other_types(command, key):
+    datastore = Datastore()
+    datastore.append(b"l", b"a")
+    datastore.hset(b"h", [(b"f", b"1")])
+    datastore.sadd(b"s", [b"1"])
+    datastore.zadd(b"z", [(b"a", 1.0)])
+    assert _run(datastore, command, key) == _WRONGTYPE
+
+
+def test_memory_usage():
+    datastore = Datastore()
+    handle_command(Array([BulkString(b"SET"), BulkString(b"k"), BulkString(b"x" * 100)]), datastore)
+
+    usage = handle_command(Array([BulkString(b"MEMORY"), BulkString(b"USAGE"), BulkString(b"k")]), datastore)
+    assert 100 < usage.value < 300
+    sampled = handle_command(
+        Array([
+            BulkString(b"MEMORY"), BulkString(b"usage"), BulkString(b"k"), BulkString(b"SAMPLES"), BulkString(b"0"),
+        ]),
+        datastore,
+    )
+    assert sampled == usage
+    assert handle_command(
+        Array([BulkString(b"MEMORY"), BulkString(b"USAGE"), BulkString(b"missing")]), datastore
+    ) == BulkString(None)
+    assert handle_command(
+        Array([BulkString(b"MEMORY"), BulkString(b"USAGE"), BulkString(b"k"), BulkString(b"x"), BulkString(b"1")]),
+        datastore,
+    ) == Error("ERR syntax error")
+
+
+OOM_ERROR = Error("OOM command not allowed when used memory > 'maxmemory'.")
+
+
+def test_noeviction_refuses_writes_that_add_data():
+    datastore = Datastore({b"k": b"v", b"l": b"x"})
+    datastore.maxmemory = 1
+
+    assert _run(datastore, b"SET", b"k2", b"v") == OOM_ERROR
+    assert _run(datastore, b"RPUSH", b"l2", b"v") == OOM_ERROR
+    assert _run(datastore, b"GET", b"k") == BulkString(b"v")
+    assert _run(datastore, b"DEL", b"k") == Integer(1)
+
+
+def test_eviction_before_writes(tmp_path):
+    datastore = Datastore(maxmemory_policy=ALLKEYS_LRU)
+    persister = AppendOnlyPersister(tmp_path / "evict.aof", "no")
+    for i in range(100):
+        handle_command(
+            Array([BulkString(b"SET"), BulkString(b"key%d" % i), BulkString(b"x" * 100)]), datastore, persister
+        )
+    datastore.maxmemory = datastore.used_memory // 2
+
+    reply = handle_command(
+        Array([BulkString(b"SET"), BulkString(b"new"), BulkString(b"x" * 100)]), datastore, persister
+    )
+    persister.close()
+
+    assert reply == SimpleString("OK")
+    assert datastore.evicted_keys == 100 - (len(datastore) - 1)
+    # The evicted keys are deleted in the AOF as well.
+    restored = Datastore()
+    load_aof(tmp_path / "evict.aof", restored)
+    assert sorted(restored._data) == sorted(datastore._data)
+
+
+def test_config_get_and_set():
+    datastore = Datastore()
+    reply = _run(datastore, b"CONFIG", b"SET", b"maxmemory", b"100mb", b"maxmemory-policy", b"allkeys-lfu")
+    assert reply == SimpleString("OK")
+    assert _run(datastore, b"CONFIG", b"GET", b"maxmemory*") == Array([
+        BulkString(b"maxmemory"), BulkString(b"104857600"),
+        BulkString(b"maxmemory-policy"), BulkString(b"allkeys-lfu"),
+        BulkString(b"maxmemory-samples"), BulkString(b"5"),
+    ])
+    assert datastore.maxmemory == 100 * 1024 * 1024
+    assert _run(datastore, b"CONFIG", b"SET", b"maxmemory-samples", b"10") == SimpleString("OK")
+    assert datastore.maxmemory_samples == 10
+
+    assert isinstance(_run(datastore, b"CONFIG", b"SET", b"maxmemory", b"lots"), Error)
+    assert isinstance(_run(datastore, b"CONFIG", b"SET", b"maxmemory-policy", b"allkeys-random"), Error)
+    assert isinstance(_run(datastore, b"CONFIG", b"SET", b"port", b"1"), Error)
+    assert _run(datastore, b"CONFIG", b"GET", b"port") == Array([])
+
+
+def test_mget_mset_msetnx():
+    datastore = Datastore()
+    assert _run(datastore, b"MSET", b"a", b"1", b"b", b"2") == SimpleString("OK")
+    datastore.append(b"l", b"x")
+    assert _run(datastore, b"MGET", b"a", b"missing", b"b", b"l") == Array(
+        [BulkString(b"1"), BulkString(None), BulkString(b"2"), BulkString(None)]
+    )
+    assert _run(datastore, b"MSETNX", b"a", b"x", b"c", b"3") == Integer(0)
+    assert _run(datastore, b"MSETNX", b"c", b"3", b"d", b"4") == Integer(1)
+    assert _run(datastore, b"MGET", b"a", b"c", b"d") == Array([BulkString(b"1"), BulkString(b"3"), BulkString(b"4")])
+
+    assert _run(datastore, b"MSET", b"a", b"1", b"b") == Error("ERR wrong number of arguments for 'mset' command")
+    assert _run(datastore, b"MSETNX", b"a") == Error("ERR wrong number of arguments for 'msetnx' command")
+    assert _run(datastore, b"MGET") == Error("ERR wrong number of arguments for 'mget' command")
@@ -0,0 +1,170 @@
+"""
+Crash recovery: a writer process serves a stream of commands through the
+asyncio protocol with AOF logging and is killed at a random point. Whatever
+restore_from_file recovers must be the state after some prefix of the
+commands, at least as long as the prefix the writer acknowledged, and a
+server restarted on the file must be able to keep appending to it.
+"""
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.persistence import AppendOnlyPersister, restore_from_file
+from pyredis.snapshot import load_snapshot_data
+from pyredis.types import Array, BulkString
+
+COMMANDS = 20_000
+BATCH = 50
+
+# Command i pushes i onto a list when i is even and increments a counter
+# when it is odd, so any prefix of the stream can be recognised from the
+# restored list and counter. Every reply is a single integer line, so the
+# writer reports how many commands it has acknowledged as it goes. It runs
+# on an event loop, as the server does, so logged commands are buffered
+# until the protocol flushes them. The AOF
+# is rewritten whenever it doubles, so the recovered file usually has a
+# snapshot preamble.
+WRITER = r"""
+import asyncio
+import sys
+
+from pyredis.asyncserver import RedisServerProtocol
+from pyredis.datastore import Datastore
+from pyredis.persistence import AppendOnlyPersister, encode_command
+
+
+def command(i):
+    if i % 2 == 0:
+        return encode_command([b"RPUSH", b"log", b"%d" % i])
+    return encode_command([b"INCR", b"counter"])
+
+
+class Transport:
+    def write(self, data):
+        sys.stdout.write(f"{data.count(b':')}\n")
+        sys.stdout.flush()
+
+
+async def main(filename, appendfsync, commands, batch):
+    datastore = Datastore(thread_safe=False)
+    persister = AppendOnlyPersister(filename, appendfsync, auto_rewrite_min_size=4096)
+    protocol = RedisServerProtocol(datastore, persister)
+    protocol.connection_made(Transport())
+
+    for start in range(0, commands, batch):
+        protocol.data_received(b"".join(command(i) for i in range(start, min(start + batch, commands))))
+        persister.rewrite_if_needed(datastore)
+        await asyncio.sleep(0)
+
+
+asyncio.run(main(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])))
+"""
+
+
+def _write_commands(persister, datastore, start, stop):
+    for i in range(start, stop):
+        args = [b"RPUSH", b"log", b"%d" % i] if i % 2 == 0 else [b"INCR", b"counter"]
+        handle_command(Array([BulkString(a) for a in args]), datastore, persister)
+
+
+def _recovered_prefix(aof):
+    """Restore aof and return the length of the prefix of commands it holds."""
+    restored = Datastore()
+    assert restore_from_file(aof, restored)
+
+    log = [int(i) for i in restored.lrange(b"log", 0, -1)]
+    try:
+        counter = int(restored[b"counter"])
+    except KeyError:
+        counter = 0
+
+    assert log == list(range(0, 2 * len(log), 2))
+    assert len(log) - counter in (0, 1)
+    return len(log) + counter
+
+
+def _restart_and_write(aof, appendfsync, count):
+    """
+    Restore aof as a restarted server does, log count more commands through
+    a new persister and check that a second restart recovers all of them.
+    """
+    recovered = _recovered_prefix(aof)
+    datastore = Datastore()
+    assert restore_from_file(aof, datastore)
+    persister = AppendOnlyPersister(aof, appendfsync)
+    _write_commands(persister, datastore, recovered, recovered + count)
+    persister.close()
+    assert _recovered_prefix(aof) == recovered + count
+
+
+def _run_and_kill(aof, appendfsync, kill_after):
+    process = subprocess.Popen(
+        [sys.executable, "-c", WRITER, str(aof), appendfsync, str(COMMANDS), str(BATCH)],
+        stdout=subprocess.PIPE,
+        cwd=Path(__file__).parent.parent,
+        text=True,
+    )
+    acknowledged = 0
+    for line in process.stdout:
+        acknowledged += int(line)
+        if acknowledged >= kill_after:
+            process.kill()
+            break
+
+    # Replies already written to the pipe before the kill count as well.
+    acknowledged += sum(int(line) for line in process.stdout)
+    process.wait()
+    return acknowledged
+
+
+@pytest.mark.parametrize("appendfsync", ["always", "everysec", "no"])
+@pytest.mark.parametrize("seed", range(3))
+def test_kill_writer(tmp_path, appendfsync, seed):
+    aof = tmp_path / "crash.aof"
+    kill_after = random.Random(seed).randrange(COMMANDS)
+
+    acknowledged = _run_and_kill(aof, appendfsync, kill_after)
+
+    recovered = _recovered_prefix(aof)
+    assert acknowledged <= recovered <= COMMANDS
+
+
+@pytest.mark.parametrize("appendfsync", ["always", "everysec", "no"])
+@pytest.mark.parametrize("seed", range(3))
+def test_write_after_restart(tmp_path, appendfsync, seed):
+    aof = tmp_path / "crash.aof"
+    _run_and_kill(aof, appendfsync, random.Random(seed).randrange(COMMANDS))
+    _restart_and_write(aof, appendfsync, 100)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_torn_tail(tmp_path, seed):
+    aof = tmp_path / "torn.aof"
+    persister = AppendOnlyPersister(aof, "no")
+    datastore = Datastore()
+    _write_commands(persister, datastore, 0, 500)
+    persister.rewrite(datastore)
+    persister.wait_for_child()
+    _write_commands(persister, datastore, 500, 1000)
+    persister.close()
+
+    # The preamble is only ever put in place whole, by a rename, so a crash
+    # can only tear the tail.
+    contents = aof.read_bytes()
+    _, preamble_end = load_snapshot_data(contents, Datastore())
+    rng = random.Random(seed)
+    previous = 500
+
+    for end in sorted(rng.randrange(preamble_end, len(contents)) for _ in range(20)):
+        aof.write_bytes(contents[:end])
+        recovered = _recovered_prefix(aof)
+        assert previous <= recovered < 1000
+        previous = recovered
+
+        aof.write_bytes(contents[:end])
+        _restart_and_write(aof, "no", 10)
@@ -1,9 +1,14 @@
-from collections import deque
+import random
+import sys
+from threading import Thread
 from time import time_ns, sleep
 
 import pytest
 
-from pyredis.datastore import Datastore, to_ns
+from pyredis.datastore import (
+    ALLKEYS_LFU, ALLKEYS_LRU, LFU_INIT_VAL, NOEVICTION, VOLATILE_LRU, VOLATILE_TTL, Datastore, lfu_counter, to_ns,
+)
+from pyredis.quicklist import QuickList
 
 
 @pytest.fixture
@@ -18,7 +23,7 @@ def test_intial_data_invalid_type():
 
 def test_initial_data():
     ds = Datastore({"k1": 1, "k2": "v2"})
-    assert ds["k1"] == 1
+    assert ds["k1"] == b"1"
     assert ds["k2"] == "v2"
 
 
@@ -31,13 +36,13 @@ def test_in(ds):
 
 def test_get_item(ds):
     ds["key"] = 1
-    assert ds["key"] == 1
+    assert ds["key"] == b"1"
 
 
 def test_set_item(ds):
     l = ds.append("key", 1)
     assert l == 1
-    assert ds["key"] == deque([1])
+    assert ds["key"] == QuickList([1])
 
 
 def test_incr(ds):
@@ -63,13 +68,13 @@ def test_decr(ds):
 def test_append(ds):
     num_entries = ds.append("key", 1)
     assert num_entries == 1
-    assert ds["key"] == deque([1])
+    assert ds["key"] == QuickList([1])
 
 
 def test_prepend(ds):
     ds.append("key", 1)
     ds.prepend("key", 2)
-    assert ds["key"] == deque([2, 1])
+    assert ds["key"] == QuickList([2, 1])
 
 
 def test_set_with_expiry(ds):
@@ -78,7 +83,7 @@ def test_set_with_expiry(ds):
     expected = time_ns() + to_ns(expiry)
 
     assert ds["key"] == "value"
-    diff = expected - ds._data["key"].expiry
+    diff = expected - ds._expires["key"]
     assert diff < 10000
 
 
@@ -118,3 +123,533 @@ def test_remove_expired_keys(size, percent_expired):
 
     ds.remove_expired_keys()
     assert len(ds._data) == expected_len_after_expiry
+
+
+@pytest.mark.parametrize("lock_stripes", [1, 4, 16])
+def test_exists_and_delete(lock_stripes):
+    ds = Datastore(lock_stripes=lock_stripes)
+    for i in range(10):
+        ds[f"k{i}"] = i
+    assert ds.exists([f"k{i}" for i in range(20)]) == 10
+    assert ds.delete([f"k{i}" for i in range(0, 20, 2)]) == 5
+    assert ds.exists([f"k{i}" for i in range(20)]) == 5
+
+
+def test_exists_ignores_expired(ds):
+    ds.set_with_expiry("key", "value", -1)
+    assert ds.exists(["key"]) == 0
+    assert ds.delete(["key"]) == 0
+
+
+def test_concurrent_incr():
+    ds = Datastore(lock_stripes=4)
+
+    def worker():
+        for _ in range(1000):
+            ds.incr("counter")
+
+    threads = [Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ds["counter"] == b"8000"
+
+
+def test_concurrent_counters():
+    ds = Datastore(lock_stripes=16)
+
+    def worker(n):
+        for i in range(2000):
+            key = b"k%d:%d" % (n, i % 50)
+            ds[key] = b"x" * i
+            ds.mget([key, b"missing%d" % n])
+            ds.delete([key])
+
+    # Switching threads as often as possible, so that updates made under
+    # different stripes would be lost if the counters were not guarded.
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert ds.used_memory == 0
+    assert ds.keyspace_hits == ds.keyspace_misses == 16000
+
+
+def test_not_thread_safe():
+    ds = Datastore({"k1": b"1"}, thread_safe=False)
+    assert ds.incr("k1") == 2
+    ds.set_with_expiry("k2", b"v", 10)
+    assert ds.exists(["k1", "k2", "k3"]) == 2
+    assert ds.delete(["k1"]) == 1
+    assert ds["k2"] == b"v"
+
+
+def test_remove_expired_keys_skips_overwritten(ds):
+    ds.set_with_expiry("k1", "value", -1)
+    ds["k1"] = "persistent"
+    ds.set_with_expiry("k2", "value", -1)
+    ds.set_with_expiry("k2", "value", 100)
+    ds.set_with_expiry("k3", "value", -1)
+
+    assert ds.remove_expired_keys() == 1
+    assert ds["k1"] == "persistent"
+    assert ds["k2"] == "value"
+    assert "k3" not in ds._data
+    assert ds._expiry_heap == [(ds._expires["k2"], "k2")]
+
+
+def test_remove_expired_keys_time_budget(ds):
+    for i in range(1000):
+        ds.set_with_expiry(f"k{i}", i, -1)
+
+    removed = ds.remove_expired_keys(time_budget=0)
+    assert 0 < removed < 1000
+    assert ds.remove_expired_keys() == 1000 - removed
+    assert len(ds._data) == 0
+
+
+def test_expiry_index_compaction(ds):
+    for i in range(3000):
+        ds.set_with_expiry(f"k{i}", i, 100)
+    for i in range(3000):
+        ds[f"k{i}"] = i
+    ds.remove_expired_keys()
+    assert ds._expiry_heap == []
+
+
+def test_list_pops(ds):
+    ds.append("key", 1, 2, 3, 4)
+    assert ds.lpop("key") == 1
+    assert ds.rpop("key") == 4
+    assert ds.lpop("key", 5) == [2, 3]
+    assert "key" not in ds._data
+    assert ds.lpop("key") is None
+    assert ds.rpop("key", 1) is None
+
+
+def test_list_index_and_set(ds):
+    ds.append("key", 1, 2, 3)
+    assert ds.llen("key") == 3
+    assert ds.llen("missing") == 0
+    assert ds.lindex("key", -1) == 3
+    assert ds.lindex("key", 3) is None
+    ds.lset("key", 1, 5)
+    assert ds.lrange("key", 0, -1) == [1, 5, 3]
+    with pytest.raises(IndexError):
+        ds.lset("key", 3, 5)
+    with pytest.raises(KeyError):
+        ds.lset("missing", 0, 5)
+
+
+def test_list_trim(ds):
+    ds.append("key", *range(10))
+    ds.ltrim("key", 2, -3)
+    assert ds.lrange("key", 0, -1) == list(range(2, 8))
+    ds.ltrim("key", 5, 1)
+    assert "key" not in ds._data
+
+
+def test_list_wrong_type(ds):
+    ds["key"] = "value"
+    with pytest.raises(TypeError):
+        ds.append("key", 1)
+    with pytest.raises(TypeError):
+        ds.lpop("key")
+    with pytest.raises(TypeError):
+        ds.llen("key")
+
+
+def test_hash(ds):
+    assert ds.hset(b"h", [(b"a", b"1"), (b"b", b"2"), (b"a", b"3")]) == 2
+    assert ds.hget(b"h", b"a") == b"3"
+    assert ds.hget(b"h", b"missing") is None
+    assert ds.hget(b"missing", b"a") is None
+    assert ds.hmget(b"h", [b"b", b"missing"]) == [b"2", None]
+    assert ds.hmget(b"missing", [b"a"]) == [None]
+    assert ds.hgetall(b"h") == [(b"a", b"3"), (b"b", b"2")]
+    assert ds.hlen(b"h") == 2
+    assert ds.hscan(b"h", 0, 10) == (0, [(b"a", b"3"), (b"b", b"2")])
+    assert ds.hscan(b"missing", 0, 10) == (0, [])
+    assert ds.hdel(b"h", [b"a", b"missing"]) == 1
+    assert ds.hdel(b"h", [b"b"]) == 1
+    assert b"h" not in ds._data
+    assert ds.hdel(b"h", [b"b"]) == 0
+    assert ds.hlen(b"h") == 0
+
+
+def test_hincrby(ds):
+    assert ds.hincrby(b"h", b"n", 5) == 5
+    assert ds.hincrby(b"h", b"n", -7) == -2
+    assert ds.hget(b"h", b"n") == b"-2"
+    ds.hset(b"h", [(b"s", b"abc"), (b"padded", b"07"), (b"max", b"%d" % (2 ** 63 - 1))])
+    with pytest.raises(ValueError):
+        ds.hincrby(b"h", b"s", 1)
+    with pytest.raises(ValueError):
+        ds.hincrby(b"h", b"padded", 1)
+    with pytest.raises(OverflowError):
+        ds.hincrby(b"h", b"max", 1)
+    assert ds.hget(b"h", b"max") == b"%d" % (2 ** 63 - 1)
+
+
+def test_set(ds):
+    assert ds.sadd(b"s", [b"1", b"2", b"2", b"3"]) == 3
+    assert ds.sadd(b"s", [b"3", b"x"]) == 1
+    assert ds.scard(b"s") == 4
+    assert ds.sismember(b"s", b"x")
+    assert not ds.sismember(b"s", b"y")
+    assert not ds.sismember(b"missing", b"x")
+    assert sorted(ds.smembers(b"s")) == [b"1", b"2", b"3", b"x"]
+    assert ds.smembers(b"missing") == []
+    assert ds.srem(b"s", [b"1", b"2", b"y"]) == 2
+    assert ds.srem(b"s", [b"3", b"x"]) == 2
+    assert b"s" not in ds._data
+    assert ds.srem(b"s", [b"3"]) == 0
+    assert ds.scard(b"s") == 0
+
+
+def test_sinter_and_sunion(ds):
+    ds.sadd(b"a", [b"1", b"2", b"3", b"x"])
+    ds.sadd(b"b", [b"2", b"3", b"4"])
+    ds.sadd(b"c", [b"3", b"2", b"x"])
+    assert sorted(ds.sinter([b"a", b"b", b"c"])) == [b"2", b"3"]
+    assert ds.sinter([b"a", b"missing"]) == []
+    assert sorted(ds.sinter([b"a"])) == [b"1", b"2", b"3", b"x"]
+    assert sorted(ds.sunion([b"a", b"b", b"missing"])) == [b"1", b"2", b"3", b"4", b"x"]
+    ds[b"string"] = b"v"
+    with pytest.raises(TypeError):
+        ds.sinter([b"a", b"string"])
+    with pytest.raises(TypeError):
+        ds.sunion([b"string"])
+
+
+def test_sorted_set(ds):
+    assert ds.zadd(b"z", [(b"a", 1.0), (b"b", 2.0), (b"c", 3.0)]) == (3, 3)
+    assert ds.zadd(b"z", [(b"a", 5.0), (b"d", 0.0), (b"b", 2.0)]) == (1, 2)
+    assert ds.zcard(b"z") == 4
+    assert ds.zscore(b"z", b"a") == 5.0
+    assert ds.zscore(b"z", b"missing") is None
+    assert ds.zrange(b"z", 0, -1) == [(b"d", 0.0), (b"b", 2.0), (b"c", 3.0), (b"a", 5.0)]
+    assert ds.zrange(b"z", 0, 1, reverse=True) == [(b"a", 5.0), (b"c", 3.0)]
+    assert ds.zrange(b"z", -2, 10, reverse=True) == [(b"b", 2.0), (b"d", 0.0)]
+    assert ds.zrange(b"z", 3, 1, reverse=True) == []
+    assert ds.zrange(b"missing", 0, -1) == []
+    assert ds.zrank(b"z", b"c") == 2
+    assert ds.zrank(b"z", b"c", reverse=True) == 1
+    assert ds.zrank(b"z", b"missing") is None
+    assert ds.zincrby(b"z", b"d", 10.0) == 10.0
+    assert ds.zincrby(b"z", b"e", -1.5) == -1.5
+    assert ds.zrem(b"z", [b"a", b"missing"]) == 1
+    assert ds.zrem(b"z", [b"b", b"c", b"d", b"e"]) == 4
+    assert b"z" not in ds._data
+
+
+def test_zadd_options(ds):
+    ds.zadd(b"z", [(b"a", 1.0), (b"b", 2.0)])
+    assert ds.zadd(b"z", [(b"a", 5.0), (b"c", 3.0)], nx=True) == (1, 1)
+    assert ds.zadd(b"z", [(b"a", 5.0), (b"d", 3.0)], xx=True) == (0, 1)
+    assert ds.zadd(b"z", [(b"a", 0.0), (b"b", 4.0)], gt=True) == (0, 1)
+    assert ds.zadd(b"z", [(b"a", 6.0), (b"b", 3.0), (b"e", 9.0)], lt=True) == (1, 2)
+    assert dict(ds.zrange(b"z", 0, -1)) == {b"a": 5.0, b"b": 3.0, b"c": 3.0, b"e": 9.0}
+    assert ds.zadd(b"missing", [(b"a", 1.0)], xx=True) == (0, 0)
+    assert b"missing" not in ds._data
+
+    assert ds.zincrby(b"z", b"a", 1.0, nx=True) is None
+    assert ds.zincrby(b"z", b"new", 1.0, xx=True) is None
+    assert ds.zincrby(b"z", b"a", -1.0, gt=True) is None
+    assert ds.zincrby(b"z", b"a", -1.0, lt=True) == 4.0
+    ds.zadd(b"z", [(b"inf", float("inf"))])
+    with pytest.raises(ValueError):
+        ds.zincrby(b"z", b"inf", float("-inf"))
+
+
+def test_zrangebyscore(ds):
+    ds.zadd(b"z", [(b"m%d" % i, float(i)) for i in range(10)])
+
+    def members(*args, **kwargs):
+        return [member for member, _ in ds.zrangebyscore(b"z", *args, **kwargs)]
+
+    assert members(2, 4) == [b"m2", b"m3", b"m4"]
+    assert members(2, 4, exclude_minimum=True, exclude_maximum=True) == [b"m3"]
+    assert members(float("-inf"), float("inf"), offset=8) == [b"m8", b"m9"]
+    assert members(1, 8, offset=2, count=3) == [b"m3", b"m4", b"m5"]
+    assert members(1, 8, reverse=True, offset=2, count=3) == [b"m6", b"m5", b"m4"]
+    assert members(1, 8, reverse=True, offset=6, count=5) == [b"m2", b"m1"]
+    assert members(5, 4) == []
+    assert members(1, 8, offset=20) == []
+    assert ds.zrangebyscore(b"missing", 0, 1) == []
+
+
+def test_hash_wrong_type(ds):
+    ds[b"s"] = b"value"
+    ds.append(b"l", b"x")
+    for key in (b"s", b"l"):
+        with pytest.raises(TypeError):
+            ds.hset(key, [(b"f", b"v")])
+        with pytest.raises(TypeError):
+            ds.hget(key, b"f")
+        with pytest.raises(TypeError):
+            ds.hincrby(key, b"f", 1)
+    ds.hset(b"h", [(b"f", b"v")])
+    with pytest.raises(TypeError):
+        ds.append(b"h", b"x")
+
+
+@pytest.mark.parametrize("value, stored", [
+    (b"0", 0),
+    (b"9999", 9999),
+    (b"-42", -42),
+    (b"9223372036854775807", 2 ** 63 - 1),
+    (b"9223372036854775808", b"9223372036854775808"),
+    (b"007", b"007"),
+    (b"+7", b"+7"),
+    (b" 7", b" 7"),
+    (b"1_000", b"1_000"),
+    (b"", b""),
+    (b"value", b"value"),
+])
+def test_integer_strings_are_stored_as_ints(ds, value, stored):
+    ds[b"key"] = value
+    assert ds._data[b"key"] == stored
+    assert type(ds._data[b"key"]) is type(stored)
+    assert ds[b"key"] == value
+
+
+def test_small_values_are_shared(ds):
+    ds[b"a"] = b"%d" % 1234
+    ds[b"b"] = b"%d" % 1234
+    ds[b"c"] = b"".join([b"act", b"ive"])
+    ds[b"d"] = b"".join([b"acti", b"ve"])
+    assert ds._data[b"a"] is ds._data[b"b"]
+    assert ds._data[b"c"] is ds._data[b"d"]
+
+
+def test_incr_keeps_ttl_and_int_encoding(ds):
+    ds.set_with_expiry(b"counter", b"41", 100)
+    assert ds.incr(b"counter") == 42
+    assert ds._data[b"counter"] == 42
+    assert b"counter" in ds._expires
+    assert ds[b"counter"] == b"42"
+
+
+def test_set_drops_ttl(ds):
+    ds.set_with_expiry(b"key", b"value", 100)
+    ds[b"key"] = b"other"
+    assert ds._expires == {}
+    assert ds.expiring_keys == 0
+
+
+def test_memory_usage(ds):
+    ds[b"shared"] = b"5"
+    ds[b"string"] = b"x" * 1000
+    ds.set_with_expiry(b"ttl", b"x" * 1000, 100)
+    ds.append(b"list", *(b"x" * 100 for _ in range(1000)))
+
+    assert ds.memory_usage(b"missing") is None
+    assert ds.memory_usage(b"shared") < 100
+    assert 1000 < ds.memory_usage(b"string") < ds.memory_usage(b"ttl") < 1500
+    assert 100_000 < ds.memory_usage(b"list") < 200_000
+
+
+def test_used_memory_is_kept_up_to_date(ds):
+    ds[b"a"] = b"x" * 100
+    ds[b"a"] = b"y" * 10
+    ds.set_with_expiry(b"b", b"x" * 50, 100)
+    ds.incr(b"c")
+    ds.incr(b"c")
+    ds[b"d"] = b"12345678901"
+    ds.decr(b"d")
+    ds.append(b"l", *(b"v" * n for n in range(100)))
+    ds.prepend(b"l", b"head")
+    ds.lpop(b"l", 3)
+    ds.lset(b"l", 5, b"z" * 500)
+    ds.ltrim(b"l", 2, 50)
+    ds.hset(b"small", [(b"f%d" % i, b"v" * i) for i in range(20)])
+    ds.hset(b"small", [(b"f1", b"updated")])
+    ds.hincrby(b"small", b"n", 1000)
+    ds.hdel(b"small", [b"f2", b"f3"])
+    ds.hset(b"big", [(b"f%d" % i, b"v" * i) for i in range(300)])
+    ds.hdel(b"big", [b"f%d" % i for i in range(100)])
+    ds.hscan(b"big", 0, 10)
+    ds.hset(b"big", [(b"new", b"v")])
+    ds.hset(b"emptied", [(b"f", b"v")])
+    ds.hdel(b"emptied", [b"f"])
+    ds.sadd(b"intset", [b"%d" % i for i in range(100)])
+    ds.srem(b"intset", [b"5", b"6"])
+    ds.sadd(b"set", [b"member:%d" % i for i in range(100)])
+    ds.srem(b"set", [b"member:%d" % i for i in range(50)])
+    ds.zadd(b"zset", [(b"m%d" % i, float(i % 17)) for i in range(3000)])
+    ds.zadd(b"zset", [(b"m1", 0.5)], gt=True)
+    ds.zincrby(b"zset", b"m2", 1.5)
+    ds.zrem(b"zset", [b"m%d" % i for i in range(0, 3000, 3)])
+    ds.set_with_expiry(b"gone", b"x", -1)
+    ds.remove_expired_keys()
+
+    assert ds.used_memory == sum(ds.memory_usage(key) for key in ds._data)
+    ds.set_with_expiry(b"e", b"x" * 20, -1)
+    assert ds.exists([b"e"]) == 0
+    ds.delete(list(ds._data))
+    assert ds.used_memory == 0
+
+
+def test_initial_data_counts_towards_used_memory():
+    ds = Datastore({b"k": b"value"})
+    assert ds.used_memory == ds.memory_usage(b"k") > 0
+
+
+def test_maxmemory_policy_validation(ds):
+    assert ds.maxmemory_policy == NOEVICTION
+    with pytest.raises(ValueError):
+        ds.maxmemory_policy = "allkeys-random"
+
+
+def test_noeviction_evicts_nothing(ds):
+    ds[b"k"] = b"v"
+    ds.maxmemory = 1
+    assert ds.evict() == []
+    assert ds.evicted_keys == 0
+
+
+def _fill(ds, count, prefix=b"key"):
+    for i in range(count):
+        ds[prefix + b"%d" % i] = b"x" * 100
+
+
+def test_allkeys_lru_evicts_idle_keys(ds, monkeypatch):
+    random.seed(1)
+    clock = [0]
+    monkeypatch.setattr("pyredis.datastore.lru_clock", lambda: clock[0])
+    ds.maxmemory_policy = ALLKEYS_LRU
+    _fill(ds, 1000)
+    clock[0] = 1000
+    for i in range(500, 1000):
+        ds[b"key%d" % i]
+
+    ds.maxmemory = ds.used_memory * 7 // 10
+    evicted = ds.evict()
+    assert ds.used_memory <= ds.maxmemory
+    assert ds.evicted_keys == len(evicted) == 1000 - len(ds)
+    recently_used = [key for key in evicted if int(key[3:]) >= 500]
+    assert len(recently_used) < len(evicted) // 20
+
+
+def test_allkeys_lfu_evicts_rarely_used_keys(ds):
+    random.seed(1)
+    ds.maxmemory_policy = ALLKEYS_LFU
+    _fill(ds, 1000)
+    for _ in range(50):
+        for i in range(0, 1000, 2):
+            ds[b"key%d" % i]
+
+    assert lfu_counter(ds._access[b"key0"]) > LFU_INIT_VAL == lfu_counter(ds._access[b"key1"])
+    ds.maxmemory = ds.used_memory * 7 // 10
+    evicted = ds.evict()
+    assert ds.used_memory <= ds.maxmemory
+    assert len([key for key in evicted if int(key[3:]) % 2 == 0]) < len(evicted) // 20
+
+
+def test_volatile_ttl_evicts_the_nearest_expiry(ds):
+    random.seed(1)
+    ds.maxmemory_policy = VOLATILE_TTL
+    _fill(ds, 100, b"persistent")
+    for i in range(100):
+        ds.set_with_expiry(b"volatile%d" % i, b"x" * 100, 1000 + i)
+
+    ds.maxmemory = ds.used_memory - 1
+    assert ds.evict() == [b"volatile0"]
+
+    # Once no key has a TTL, nothing else may go.
+    ds.maxmemory = 1
+    ds.evict()
+    assert ds.expiring_keys == 0
+    assert len(ds) == 100
+
+
+def test_volatile_lru_only_evicts_keys_with_a_ttl(ds):
+    ds.maxmemory_policy = VOLATILE_LRU
+    _fill(ds, 100)
+    for i in range(100):
+        ds.set_with_expiry(b"volatile%d" % i, b"x", 100)
+    ds.maxmemory = 1
+    assert len(ds.evict()) == 100
+    assert len(ds) == 100
+    assert ds.expiring_keys == 0
+
+
+def test_eviction_sample_skips_deleted_keys(ds):
+    ds.maxmemory_policy = ALLKEYS_LRU
+    _fill(ds, 100)
+    ds.delete([b"key%d" % i for i in range(99)])
+    assert ds._sample_keys(3) == [b"key99"] * 3
+    ds.delete([b"key99"])
+    assert ds._sample_keys(3) == []
+    assert ds._eviction_keys == []
+
+
+def test_eviction_keys_are_rebuilt(ds):
+    ds.maxmemory_policy = ALLKEYS_LRU
+    for _ in range(3):
+        _fill(ds, 1000)
+        ds.delete(list(ds._data))
+    assert len(ds._eviction_keys) <= 2 * 1024
+
+
+def test_keyspace_hits_and_misses(ds):
+    ds[b"k"] = b"v"
+    ds.append(b"l", b"a")
+    ds[b"k"]
+    with pytest.raises(KeyError):
+        ds[b"missing"]
+    ds.exists([b"k", b"missing"])
+    ds.lrange(b"l", 0, -1)
+    ds.llen(b"missing")
+    assert (ds.keyspace_hits, ds.keyspace_misses) == (3, 3)
+
+    ds.reset_stats()
+    assert (ds.keyspace_hits, ds.keyspace_misses) == (0, 0)
+
+
+def test_mget_and_mset(ds):
+    ds.mset([(b"a", b"1"), (b"b", b"two"), (b"a", b"3")])
+    ds.append(b"l", b"x")
+    ds.hset(b"h", [(b"f", b"v")])
+    ds.sadd(b"s", [b"x"])
+    ds.zadd(b"z", [(b"x", 1.0)])
+    assert ds.mget([b"a", b"b", b"missing", b"l", b"h", b"s", b"z"]) == [b"3", b"two", None, None, None, None, None]
+    assert (ds.keyspace_hits, ds.keyspace_misses) == (6, 1)
+
+
+def test_msetnx(ds):
+    ds.set_with_expiry(b"b", b"old", 100)
+    assert not ds.msetnx([(b"a", b"1"), (b"b", b"2")])
+    assert ds.mget([b"a", b"b"]) == [None, b"old"]
+    assert ds.msetnx([(b"a", b"1"), (b"c", b"2")])
+    assert ds.mget([b"a", b"c"]) == [b"1", b"2"]
+
+
+def test_msetnx_is_atomic():
+    ds = Datastore()
+    keys = [b"key%d" % i for i in range(50)]
+    winners = []
+
+    def claim(name):
+        # Every thread wants the same keys, in its own order.
+        order = keys[:]
+        random.Random(name).shuffle(order)
+        if ds.msetnx([(key, name) for key in order]):
+            winners.append(name)
+
+    threads = [Thread(target=claim, args=(b"thread%d" % i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(winners) == 1
+    assert set(ds.mget(keys)) == set(winners)
@@ -0,0 +1,143 @@
+import random
+import sys
+
+import pytest
+
+from pyredis.hash import ENCODING_HASHTABLE, ENCODING_LISTPACK, HASH_MAX_LISTPACK_ENTRIES, HASH_MAX_LISTPACK_VALUE, Hash
+
+
+def _check(hash_, expected):
+    assert len(hash_) == len(expected)
+    assert dict(hash_.items()) == expected
+    for field, value in expected.items():
+        assert hash_.get(field) == value
+
+
+def test_empty():
+    hash_ = Hash()
+    _check(hash_, {})
+    assert hash_.get(b"missing") is None
+    assert not hash_.delete(b"missing")
+    assert hash_.encoding == ENCODING_LISTPACK
+
+
+def test_set_get_delete():
+    hash_ = Hash([(b"a", b"1"), (b"b", b"2")])
+    assert not hash_.set(b"a", b"3")
+    assert hash_.set(b"c", b"4")
+    _check(hash_, {b"a": b"3", b"b": b"2", b"c": b"4"})
+    assert hash_.delete(b"b")
+    assert not hash_.delete(b"b")
+    _check(hash_, {b"a": b"3", b"c": b"4"})
+
+
+def test_field_equal_to_a_value():
+    # A lookup in the flat list must not match a value that equals the field.
+    hash_ = Hash([(b"a", b"b"), (b"b", b"a")])
+    assert hash_.get(b"a") == b"b"
+    assert hash_.get(b"b") == b"a"
+    assert hash_.delete(b"b")
+    assert hash_.get(b"b") is None
+    _check(hash_, {b"a": b"b"})
+
+
+def test_converted_past_entries():
+    hash_ = Hash((b"f%d" % i, b"v") for i in range(HASH_MAX_LISTPACK_ENTRIES))
+    assert hash_.encoding == ENCODING_LISTPACK
+    hash_.set(b"f0", b"updated")
+    assert hash_.encoding == ENCODING_LISTPACK
+    hash_.set(b"one more", b"v")
+    assert hash_.encoding == ENCODING_HASHTABLE
+    # Never converted back.
+    for i in range(HASH_MAX_LISTPACK_ENTRIES):
+        hash_.delete(b"f%d" % i)
+    assert hash_.encoding == ENCODING_HASHTABLE
+    _check(hash_, {b"one more": b"v"})
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [(b"f" * (HASH_MAX_LISTPACK_VALUE + 1), b"v"), (b"f", b"v" * (HASH_MAX_LISTPACK_VALUE + 1))],
+)
+def test_converted_for_long_fields_and_values(field, value):
+    hash_ = Hash([(b"a", b"1")])
+    hash_.set(field, value)
+    assert hash_.encoding == ENCODING_HASHTABLE
+    _check(hash_, {b"a": b"1", field: value})
+
+    hash_ = Hash([(b"f", b"1")])
+    hash_.set(b"f", b"v" * (HASH_MAX_LISTPACK_VALUE + 1))
+    assert hash_.encoding == ENCODING_HASHTABLE
+    _check(hash_, {b"f": b"v" * (HASH_MAX_LISTPACK_VALUE + 1)})
+
+
+@pytest.mark.parametrize("size", [5, HASH_MAX_LISTPACK_ENTRIES * 3])
+def test_random_operations_match_dict(size):
+    rng = random.Random(size)
+    hash_ = Hash()
+    expected = {}
+    for _ in range(size * 10):
+        field = b"f%d" % rng.randrange(size)
+        if rng.random() < 0.3:
+            assert hash_.delete(field) == (expected.pop(field, None) is not None)
+        else:
+            value = b"v%d" % rng.randrange(1000)
+            assert hash_.set(field, value) == (field not in expected)
+            expected[field] = value
+    _check(hash_, expected)
+
+
+@pytest.mark.parametrize("size", [10, HASH_MAX_LISTPACK_ENTRIES * 3])
+def test_scan_returns_every_field(size):
+    hash_ = Hash((b"f%d" % i, b"v%d" % i) for i in range(size))
+    seen = []
+    cursor, pairs = hash_.scan(0, 10)
+    seen += pairs
+    while cursor:
+        cursor, pairs = hash_.scan(cursor, 10)
+        seen += pairs
+    assert sorted(seen) == sorted(hash_.items())
+
+
+@pytest.mark.parametrize("deleted", [range(1, 1000, 2), range(100, 1000)])
+def test_scan_with_deletes(deleted):
+    size = 1000
+    hash_ = Hash((b"f%d" % i, b"v%d" % i) for i in range(size))
+    deleted = {b"f%d" % i for i in deleted}
+    kept = {(b"f%d" % i, b"v%d" % i) for i in range(size)} - {(field, field.replace(b"f", b"v")) for field in deleted}
+
+    seen = []
+    cursor, pairs = hash_.scan(0, 10)
+    seen += pairs
+    pending = sorted(deleted)
+    while cursor:
+        # Delete some fields between every call, both ones already
+        # returned and ones still to come.
+        for field in pending[:20]:
+            assert hash_.delete(field)
+        del pending[:20]
+        cursor, pairs = hash_.scan(cursor, 10)
+        seen += pairs
+    assert kept <= set(seen)
+    assert {field for field, _ in seen} <= {b"f%d" % i for i in range(size)}
+
+
+def test_memory_usage_follows_changes():
+    hash_ = Hash()
+    for i in range(HASH_MAX_LISTPACK_ENTRIES * 2):
+        hash_.set(b"f%d" % i, b"v" * (i % 100))
+        hash_.set(b"f%d" % (i // 2), b"updated")
+        if i % 3 == 0:
+            hash_.delete(b"f%d" % (i // 3))
+        walked = sum(sys.getsizeof(item) for pair in hash_.items() for item in pair)
+        order = sys.getsizeof(hash_._order) if hash_._order is not None else 0
+        assert hash_.memory_usage() == sys.getsizeof(hash_) + sys.getsizeof(hash_._items) + order + walked
+
+
+def test_compact_encoding_is_smaller():
+    fields = [(b"field:%d" % i, b"value:%d" % i) for i in range(HASH_MAX_LISTPACK_ENTRIES)]
+    compact = Hash(fields)
+    converted = Hash(fields)
+    converted.set(b"f" * (HASH_MAX_LISTPACK_VALUE + 1), b"v")
+    converted.delete(b"f" * (HASH_MAX_LISTPACK_VALUE + 1))
+    assert compact.memory_usage() < converted.memory_usage()
@@ -0,0 +1,83 @@
+import pytest
+
+typer = pytest.importorskip("typer")
+from typer.testing import CliRunner  # noqa: E402
+
+from pyredis import __main__ as entry_point  # noqa: E402
+from pyredis.asyncserver import ServerOptions  # noqa: E402
+from pyredis.datastore import ALLKEYS_LRU  # noqa: E402
+
+
+@pytest.fixture
+def invoke(monkeypatch):
+    calls = []
+
+    def fake_run(main_args, backend):
+        calls.append(("run", (backend, *main_args)))
+
+    # main's arguments stand in for the coroutine that run is given.
+    monkeypatch.setattr(entry_point, "main", lambda *args: args)
+    monkeypatch.setattr(entry_point, "run", fake_run)
+    monkeypatch.setattr(entry_point, "run_workers", lambda *args: calls.append(("run_workers", args)))
+    app = typer.Typer()
+    app.command()(entry_point.serve)
+
+    def invoke(*args):
+        result = CliRunner().invoke(app, list(args))
+        return result, calls
+
+    return invoke
+
+
+def test_single_process_uses_loop_backend(invoke):
+    result, calls = invoke("--loop-backend", "asyncio")
+    assert result.exit_code == 0
+    [(name, args)] = calls
+    assert name == "run"
+    assert args[0] == "asyncio"
+
+
+def test_workers_get_every_option(invoke):
+    result, calls = invoke(
+        "--port", "7000", "--workers", "4", "--appendfsync", "always", "--loop-backend", "asyncio",
+        "--maxmemory", "1000", "--maxmemory-policy", ALLKEYS_LRU,
+    )
+    assert result.exit_code == 0
+    [(name, args)] = calls
+    assert name == "run_workers"
+    assert args[:3] == (7000, "always", 4)
+    assert args[4:] == ("asyncio", True, 1000, ALLKEYS_LRU)
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_socket_options_reach_the_server(invoke, workers):
+    result, calls = invoke(
+        "--workers", workers, "--no-tcp-nodelay", "--backlog", "128", "--recv-buffer-size", "65536",
+        "--send-buffer-size", "131072", "--read-size", "4096",
+    )
+    assert result.exit_code == 0
+    # After the backend, port and appendfsync, or the port, appendfsync and workers.
+    [(_, args)] = calls
+    assert args[3] == ServerOptions(
+        tcp_nodelay=False, backlog=128, recv_buffer_size=65536, send_buffer_size=131072, read_size=4096,
+    )
+
+
+def test_socket_option_defaults(invoke):
+    result, calls = invoke()
+    assert result.exit_code == 0
+    [(_, args)] = calls
+    assert args[3] == ServerOptions()
+
+
+@pytest.mark.parametrize("option", ["--appendfsync", "--loop-backend", "--maxmemory-policy"])
+def test_unknown_choices_are_rejected(invoke, option):
+    result, calls = invoke(option, "bogus")
+    assert result.exit_code != 0
+    assert calls == []
+
+
+def test_read_size_must_be_positive(invoke):
+    result, calls = invoke("--read-size", "0")
+    assert result.exit_code != 0
+    assert calls == []
@@ -0,0 +1,314 @@
+import asyncio
+import os
+from time import sleep, time_ns
+
+import pytest
+
+from pyredis.commands import handle_command, log_expired_keys
+from pyredis.datastore import Datastore
+from pyredis.persistence import AppendOnlyPersister, load_aof, restore_from_file
+from pyredis.types import Error, Integer, SimpleString
+
+from conftest import command, encoded_command
+
+
+@pytest.fixture
+def aof(tmp_path):
+    return tmp_path / "test.aof"
+
+
+@pytest.mark.parametrize("appendfsync", ["always", "everysec", "no"])
+def test_log_and_restore(aof, appendfsync):
+    persister = AppendOnlyPersister(aof, appendfsync)
+    datastore = Datastore()
+    handle_command(command(b"set", b"k", "vålue".encode()), datastore, persister)
+    handle_command(command(b"rpush", b"l", b"a", b"b"), datastore, persister)
+    handle_command(command(b"incr", b"c"), datastore, persister)
+    handle_command(command(b"get", b"k"), datastore, persister)
+    persister.close()
+
+    assert aof.read_bytes() == (
+        b"*3\r\n$3\r\nset\r\n$1\r\nk\r\n$6\r\nv\xc3\xa5lue\r\n"
+        b"*4\r\n$5\r\nrpush\r\n$1\r\nl\r\n$1\r\na\r\n$1\r\nb\r\n"
+        b"*2\r\n$4\r\nincr\r\n$1\r\nc\r\n"
+    )
+
+    restored = Datastore()
+    assert restore_from_file(aof, restored)
+    assert restored[b"k"] == "vålue".encode()
+    assert restored.lrange(b"l", 0, -1) == [b"a", b"b"]
+    assert restored[b"c"] == b"1"
+
+
+def test_mset_is_one_record(aof):
+    persister = AppendOnlyPersister(aof, "no")
+    datastore = Datastore()
+    handle_command(command(b"MSET", b"a", b"1", b"b", b"2"), datastore, persister)
+    handle_command(command(b"MSETNX", b"a", b"3", b"c", b"4"), datastore, persister)
+    persister.close()
+
+    assert aof.read_bytes() == (
+        b"*5\r\n$4\r\nMSET\r\n$1\r\na\r\n$1\r\n1\r\n$1\r\nb\r\n$1\r\n2\r\n"
+        b"*5\r\n$6\r\nMSETNX\r\n$1\r\na\r\n$1\r\n3\r\n$1\r\nc\r\n$1\r\n4\r\n"
+    )
+    restored = Datastore()
+    assert load_aof(aof, restored)
+    assert restored.mget([b"a", b"b", b"c"]) == [b"1", b"2", None]
+
+
+def test_writes_through_without_event_loop(aof):
+    persister = AppendOnlyPersister(aof, "no")
+    persister.log_command(command(b"incr", b"c"))
+    assert aof.read_bytes() == b"*2\r\n$4\r\nincr\r\n$1\r\nc\r\n"
+    persister.close()
+
+
+def test_flushes_once_per_loop_iteration(aof):
+    persister = AppendOnlyPersister(aof, "no")
+
+    async def log_batch():
+        for _ in range(100):
+            persister.log_command(command(b"incr", b"c"))
+        assert aof.read_bytes() == b""
+        await asyncio.sleep(0)
+        assert aof.read_bytes() == b"*2\r\n$4\r\nincr\r\n$1\r\nc\r\n" * 100
+
+    asyncio.run(log_batch())
+    persister.close()
+
+
+def test_invalid_appendfsync(aof):
+    with pytest.raises(ValueError):
+        AppendOnlyPersister(aof, "sometimes")
+
+
+def test_expiry_is_logged_as_absolute_time(aof):
+    persister = AppendOnlyPersister(aof, "always")
+    datastore = Datastore()
+    handle_command(command(b"SET", b"a", b"v", b"EX", b"100"), datastore, persister)
+    handle_command(command(b"SET", b"b", b"v", b"px", b"100000"), datastore, persister)
+    persister.close()
+
+    # Logged with the time they expire at, so a later replay doesn't extend their TTL.
+    records = aof.read_bytes().split(b"*5\r\n")[1:]
+    for key, record in zip((b"a", b"b"), records):
+        args = record.split(b"\r\n")[1::2]
+        assert args[:4] == [b"SET", key, b"v", b"PXAT"]
+        assert abs(int(args[4]) * 10 ** 6 - datastore._expires[key]) < 10 ** 7
+
+    restored = Datastore()
+    assert load_aof(aof, restored)
+    assert abs(restored._expires[b"a"] - datastore._expires[b"a"]) < 10 ** 7
+
+
+def test_expired_keys_are_logged_as_deleted(aof):
+    persister = AppendOnlyPersister(aof, "always")
+    datastore = Datastore()
+    datastore.track_expired()
+    handle_command(command(b"SET", b"k", b"v", b"PX", b"10"), datastore, persister)
+    handle_command(command(b"SET", b"active", b"v", b"PX", b"10"), datastore, persister)
+    sleep(0.02)
+    # Expired on access by the INCR, and by the expiry cycle.
+    assert handle_command(command(b"INCR", b"k"), datastore, persister) == Integer(1)
+    assert datastore.remove_expired_keys() == 1
+    log_expired_keys(datastore, persister)
+    persister.close()
+
+    contents = aof.read_bytes()
+    assert encoded_command(b"DEL", b"k") + encoded_command(b"INCR", b"k") in contents
+    assert contents.endswith(encoded_command(b"DEL", b"active"))
+    restored = Datastore()
+    assert load_aof(aof, restored)
+    assert restored[b"k"] == b"1"
+    assert restored.mget([b"active"]) == [None]
+
+
+def test_expired_keys_are_only_kept_once_tracked():
+    datastore = Datastore()
+    datastore.set_with_expiry(b"k", b"v", -1)
+    datastore.remove_expired_keys()
+    assert datastore.take_expired() == []
+
+    datastore.track_expired()
+    datastore.set_with_expiry(b"k", b"v", -1)
+    datastore.remove_expired_keys()
+    assert datastore.take_expired() == [b"k"]
+    assert datastore.take_expired() == []
+
+
+def test_rewrite_compacts_and_keeps_later_writes(aof):
+    persister = AppendOnlyPersister(aof, "no", snapshot_preamble=False)
+    datastore = Datastore()
+    for _ in range(100):
+        handle_command(command(b"incr", b"counter"), datastore, persister)
+    handle_command(command(b"rpush", b"l", b"a", b"b"), datastore, persister)
+    handle_command(command(b"rpush", b"l", b"c"), datastore, persister)
+    handle_command(command(b"hset", b"h", b"a", b"1"), datastore, persister)
+    handle_command(command(b"hincrby", b"h", b"a", b"2"), datastore, persister)
+    handle_command(command(b"sadd", b"s", *(b"%d" % i for i in range(100))), datastore, persister)
+    handle_command(command(b"zadd", b"z", b"1.5", b"a", b"-2", b"b"), datastore, persister)
+    handle_command(command(b"zincrby", b"z", b"0.1", b"a"), datastore, persister)
+    handle_command(command(b"set", b"ttl", b"v", b"ex", b"100"), datastore, persister)
+    handle_command(command(b"set", b"gone", b"v"), datastore, persister)
+    handle_command(command(b"del", b"gone"), datastore, persister)
+
+    result = handle_command(command(b"bgrewriteaof"), datastore, persister)
+    assert result == SimpleString("Background append only file rewriting started")
+    handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.wait_for_child()
+    handle_command(command(b"rpush", b"l", b"d"), datastore, persister)
+    persister.close()
+
+    contents = aof.read_bytes()
+    assert contents.count(b"incr") == 1
+    assert b"gone" not in contents
+    assert b"*5\r\n$5\r\nRPUSH\r\n$1\r\nl\r\n$1\r\na\r\n$1\r\nb\r\n$1\r\nc\r\n" in contents
+    assert b"*4\r\n$4\r\nHSET\r\n$1\r\nh\r\n$1\r\na\r\n$1\r\n3\r\n" in contents
+    # 100 members take two SADDs, of 64 and 36.
+    assert contents.count(b"SADD") == 2
+    assert b"*66\r\n$4\r\nSADD\r\n" in contents
+    assert b"*38\r\n$4\r\nSADD\r\n" in contents
+
+    restored = Datastore()
+    assert restore_from_file(aof, restored)
+    assert restored[b"counter"] == b"101"
+    assert restored.lrange(b"l", 0, -1) == [b"a", b"b", b"c", b"d"]
+    assert restored.hgetall(b"h") == [(b"a", b"3")]
+    assert restored.smembers(b"s") == [b"%d" % i for i in range(100)]
+    assert restored.zrange(b"z", 0, -1) == [(b"b", -2.0), (b"a", 1.5 + 0.1)]
+    assert restored[b"ttl"] == b"v"
+    assert 99 * 10 ** 9 < restored._expires[b"ttl"] - time_ns() <= 100 * 10 ** 9
+    assert not os.path.exists(f"{aof}.rewrite")
+
+
+def test_rewrite_with_snapshot_preamble(aof):
+    persister = AppendOnlyPersister(aof, "no")
+    datastore = Datastore()
+    for i in range(100):
+        handle_command(command(b"set", b"k%d" % i, b"v%d" % i), datastore, persister)
+    handle_command(command(b"rpush", b"l", b"a", b"b"), datastore, persister)
+    handle_command(command(b"set", b"ttl", b"v", b"ex", b"100"), datastore, persister)
+
+    handle_command(command(b"bgrewriteaof"), datastore, persister)
+    handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.wait_for_child()
+    handle_command(command(b"rpush", b"l", b"c"), datastore, persister)
+    persister.close()
+
+    contents = aof.read_bytes()
+    assert contents.startswith(b"PYREDIS")
+    assert contents.endswith(b"*2\r\n$4\r\nincr\r\n$7\r\ncounter\r\n*3\r\n$5\r\nrpush\r\n$1\r\nl\r\n$1\r\nc\r\n")
+
+    restored = Datastore()
+    assert restore_from_file(aof, restored)
+    assert all(restored[b"k%d" % i] == b"v%d" % i for i in range(100))
+    assert restored.lrange(b"l", 0, -1) == [b"a", b"b", b"c"]
+    assert restored[b"counter"] == b"1"
+    assert 99 * 10 ** 9 < restored._expires[b"ttl"] - time_ns() <= 100 * 10 ** 9
+
+
+def test_load_corrupt_snapshot_preamble(aof):
+    persister = AppendOnlyPersister(aof, "no")
+    datastore = Datastore({b"k": b"v"})
+    persister.rewrite(datastore)
+    persister.wait_for_child()
+    handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.close()
+
+    contents = bytearray(aof.read_bytes())
+    contents[12] ^= 1
+    aof.write_bytes(contents)
+    assert not load_aof(aof, Datastore())
+
+
+def test_rewrite_if_needed(aof):
+    frame = command(b"set", b"key", b"value")
+    aof.write_bytes(frame.resp_encode() * 10)
+    datastore = Datastore({b"key": b"value"})
+    persister = AppendOnlyPersister(aof, "no", auto_rewrite_percentage=100, auto_rewrite_min_size=0)
+
+    # Growth is measured from the size when opened, then from each rewrite.
+    for _ in range(2):
+        size = aof.stat().st_size
+        while aof.stat().st_size < 2 * size:
+            assert not persister.rewrite_if_needed(datastore)
+            handle_command(frame, datastore, persister)
+        assert persister.rewrite_if_needed(datastore)
+        persister.wait_for_child()
+        assert aof.stat().st_size < 2 * size
+    persister.close()
+
+
+def test_rewrite_if_needed_min_size(aof):
+    persister = AppendOnlyPersister(aof, "no", auto_rewrite_percentage=100, auto_rewrite_min_size=10_000)
+    datastore = Datastore()
+    for _ in range(100):
+        handle_command(command(b"set", b"key", b"value"), datastore, persister)
+    assert not persister.rewrite_if_needed(datastore)
+    persister.close()
+
+
+def test_rewrite_if_needed_disabled(aof):
+    persister = AppendOnlyPersister(aof, "no", auto_rewrite_percentage=0, auto_rewrite_min_size=0)
+    handle_command(command(b"set", b"key", b"value"), Datastore(), persister)
+    assert not persister.rewrite_if_needed(Datastore())
+    persister.close()
+
+
+def test_rewrite_without_aof():
+    result = handle_command(command(b"bgrewriteaof"), Datastore())
+    assert result == Error("ERR append only file is not enabled")
+
+
+def test_load_missing_file(tmp_path):
+    assert load_aof(tmp_path / "missing.aof", Datastore())
+
+
+def test_load_truncates_torn_command(aof):
+    aof.write_bytes(b"*2\r\n$4\r\nincr\r\n$1\r\nc\r\n*2\r\n$4\r\nincr\r\n$1\r")
+    datastore = Datastore()
+    assert load_aof(aof, datastore)
+    assert datastore[b"c"] == b"1"
+    assert aof.read_bytes() == b"*2\r\n$4\r\nincr\r\n$1\r\nc\r\n"
+
+
+@pytest.mark.parametrize("contents", [
+    b"+OK\r\n",
+    b"*2\r\n$4\r\nincr\r\n:1\r\n",
+    b"*2\r\n$3\r\nfoo\r\n$1\r\nc\r\n",
+    b"*1\r\n$3\r\nget\r\n",
+])
+def test_load_corrupt(aof, contents):
+    aof.write_bytes(contents)
+    assert not load_aof(aof, Datastore())
+
+
+def test_load_reports_progress(aof, monkeypatch):
+    monkeypatch.setattr("pyredis.persistence.LOAD_PROGRESS_INTERVAL", 100)
+    monkeypatch.setattr("pyredis.persistence.LOAD_WINDOW_SIZE", 100)
+    record = encoded_command(b"incr", b"c")
+    aof.write_bytes(record * 20)
+    reports = []
+    assert load_aof(aof, Datastore(), lambda loaded, total: reports.append((loaded, total)))
+    size = len(record) * 20
+    assert reports[-1] == (size, size)
+    assert len(reports) > 2
+    assert [loaded for loaded, _ in reports] == sorted(loaded for loaded, _ in reports)
+
+
+@pytest.mark.parametrize("window_size", [16, 64, 4 * 1024 * 1024])
+def test_load_values_with_separators(aof, monkeypatch, window_size):
+    monkeypatch.setattr("pyredis.persistence.LOAD_WINDOW_SIZE", window_size)
+    persister = AppendOnlyPersister(aof, "no")
+    datastore = Datastore()
+    values = [b"plain", b"with\r\ncrlf", b"\r\n", b"", b"$3\r\nfoo", b"x" * 1000]
+    for i, value in enumerate(values * 3):
+        handle_command(command(b"rpush", b"l", value), datastore, persister)
+        handle_command(command(b"set", b"k%d" % i, value), datastore, persister)
+    persister.close()
+
+    restored = Datastore()
+    assert load_aof(aof, restored)
+    assert restored.lrange(b"l", 0, -1) == values * 3
+    for i, value in enumerate(values * 3):
+        assert restored[b"k%d" % i] == value
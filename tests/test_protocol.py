@@ -1,6 +1,8 @@
 import pytest
 
-from pyredis.protocol import extract_frame_from_buffer, encode_message
+from pyredis.protocol import (
+    PROTO_MAX_BULK_LEN, ProtocolError, RespDecoder, extract_frame_from_buffer, encode_message, parse_frame,
+)
 from pyredis.types import (
     Array,
     BulkString,
@@ -72,6 +74,12 @@ def test_read_frame(buffer, expected):
         (BulkString("This is a Bulk String"), b"$21\r\nThis is a Bulk String\r\n"),
         (BulkString(""), b"$0\r\n\r\n"),
         (BulkString(None), b"$-1\r\n"),
+        (BulkString(b"bytes"), b"$5\r\nbytes\r\n"),
+        (BulkString("h\u00e9"), b"$3\r\nh\xc3\xa9\r\n"),
+        (Integer(0), b":0\r\n"),
+        (Integer(-1), b":-1\r\n"),
+        (Integer(123456789), b":123456789\r\n"),
+        (SimpleString("PONG"), b"+PONG\r\n"),
         (Array([]), b"*0\r\n"),
         (Array(None), b"*-1\r\n"),
         (
@@ -83,3 +91,106 @@ def test_read_frame(buffer, expected):
 def test_encode_message(message, expected):
     encoded_message = encode_message(message)
     assert encoded_message == expected
+
+
+@pytest.mark.parametrize(
+    "buffer, offset, expected",
+    [
+        (b"+OK\r\n+Next\r\n", 5, (SimpleString("Next"), 12)),
+        (b"+OK\r\n+Ne", 5, (None, 5)),
+        (b"+OK\r\n", 5, (None, 5)),
+        (b"+OK\r\n$-1\r\n", 5, (BulkString(None), 10)),
+        (b":1\r\n$5\r\nhello\r\n", 4, (BulkString(b"hello"), 15)),
+        (
+                b"+OK\r\n*2\r\n$5\r\nhello\r\n$-1\r\n",
+                5,
+                (Array([BulkString(b"hello"), BulkString(None)]), 25),
+        ),
+        (b"+OK\r\n*2\r\n$5\r\nhello\r\n$5\r\nwor", 5, (None, 5)),
+    ],
+)
+def test_parse_frame_at_offset(buffer, offset, expected):
+    assert parse_frame(bytearray(buffer), offset) == expected
+
+
+def test_parse_frame_pipelined():
+    buffer = bytearray(b"*1\r\n$4\r\nPING\r\n" * 3)
+    offset = 0
+    frames = []
+    while True:
+        frame, offset = parse_frame(buffer, offset)
+        if frame is None:
+            break
+        frames.append(frame)
+    assert frames == [Array([BulkString(b"PING")])] * 3
+    assert offset == len(buffer)
+
+
+_DECODER_STREAM = (
+        b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$10\r\n0123456789\r\n"
+        b"+OK\r\n-Error\r\n:42\r\n$-1\r\n*0\r\n*-1\r\n"
+        b"*2\r\n*1\r\n$5\r\nhello\r\n$0\r\n\r\n"
+)
+
+_DECODER_FRAMES = [
+    Array([BulkString(b"SET"), BulkString(b"key"), BulkString(b"0123456789")]),
+    SimpleString("OK"),
+    Error("Error"),
+    Integer(42),
+    BulkString(None),
+    Array([]),
+    Array(None),
+    Array([Array([BulkString(b"hello")]), BulkString(b"")]),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, len(_DECODER_STREAM)])
+def test_decoder_chunked(chunk_size):
+    decoder = RespDecoder()
+    frames = []
+    for i in range(0, len(_DECODER_STREAM), chunk_size):
+        frames.extend(decoder.feed(_DECODER_STREAM[i:i + chunk_size]))
+    assert frames == _DECODER_FRAMES
+
+
+def test_decoder_large_bulk_string():
+    decoder = RespDecoder()
+    value = bytes(range(256)) * 1000
+    message = b"$%d\r\n%b\r\n" % (len(value), value)
+    frames = []
+    for i in range(0, len(message), 2048):
+        frames.extend(decoder.feed(message[i:i + 2048]))
+    assert frames == [BulkString(value)]
+
+
+def test_decoder_invalid_type():
+    decoder = RespDecoder()
+    with pytest.raises(ValueError):
+        decoder.feed(b"PING\r\n")
+
+
+@pytest.mark.parametrize("data", [
+    b"$%d\r\n" % (PROTO_MAX_BULK_LEN + 1),
+    b"$-2\r\n",
+    b"*-2\r\n",
+    b"*1\r\n$99999999999999999999\r\n",
+])
+def test_decoder_invalid_lengths(data):
+    decoder = RespDecoder()
+    with pytest.raises(ValueError):
+        decoder.feed(data)
+
+
+def test_decoder_error_keeps_earlier_frames():
+    decoder = RespDecoder()
+    with pytest.raises(ProtocolError) as error:
+        decoder.feed(b"+OK\r\n*1\r\n$4\r\nPING\r\n*x\r\n+LOST\r\n")
+    assert error.value.frames == [SimpleString("OK"), Array([BulkString(b"PING")])]
+
+
+def test_decoder_grows_bulk_string_as_it_arrives():
+    decoder = RespDecoder()
+    assert decoder.feed(b"$%d\r\nabc" % PROTO_MAX_BULK_LEN) == []
+    assert decoder.buffered == 3
+    assert decoder.feed(b"def") == []
+    assert decoder.buffered == 6
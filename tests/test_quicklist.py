@@ -0,0 +1,127 @@
+import random
+import sys
+
+import pytest
+
+from pyredis.quicklist import CHUNK_SIZE, QuickList
+
+from conftest import redis_range
+
+
+def _check(quicklist, expected):
+    assert len(quicklist) == len(expected)
+    assert quicklist.range(0, -1) == expected
+    assert list(quicklist) == expected
+
+
+def test_empty():
+    quicklist = QuickList()
+    _check(quicklist, [])
+    assert quicklist.range(0, 10) == []
+    with pytest.raises(IndexError):
+        quicklist.pop()
+    with pytest.raises(IndexError):
+        quicklist.popleft()
+    with pytest.raises(IndexError):
+        quicklist[0]
+
+
+def test_push_both_ends():
+    quicklist = QuickList()
+    expected = []
+    for i in range(CHUNK_SIZE * 3 + 7):
+        quicklist.append(i)
+        quicklist.appendleft(-i)
+        expected.append(i)
+        expected.insert(0, -i)
+    _check(quicklist, expected)
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 1, CHUNK_SIZE * 4])
+def test_range_matches_redis_semantics(size):
+    items = list(range(size))
+    quicklist = QuickList(items)
+    quicklist.appendleft(-1)
+    quicklist.popleft()
+    for start, stop in [(0, -1), (0, 0), (1, 3), (-3, -1), (-100000, 100000), (5, 2), (size, size + 5),
+                        (3, -100000), (CHUNK_SIZE - 1, CHUNK_SIZE), (0, CHUNK_SIZE - 1)]:
+        assert quicklist.range(start, stop) == redis_range(items, start, stop)
+
+
+def test_index_and_set():
+    quicklist = QuickList(range(1000))
+    assert quicklist[0] == 0
+    assert quicklist[-1] == 999
+    assert quicklist[500] == 500
+    quicklist[500] = "x"
+    quicklist[-1] = "y"
+    assert quicklist[500] == "x"
+    assert quicklist[999] == "y"
+    with pytest.raises(IndexError):
+        quicklist[1000]
+    with pytest.raises(IndexError):
+        quicklist[-1001]
+
+
+def test_random_operations():
+    rng = random.Random(42)
+    quicklist = QuickList()
+    expected = []
+    for _ in range(20000):
+        operation = rng.random()
+        if operation < 0.3:
+            quicklist.append(operation)
+            expected.append(operation)
+        elif operation < 0.6:
+            quicklist.appendleft(operation)
+            expected.insert(0, operation)
+        elif operation < 0.75 and expected:
+            assert quicklist.pop() == expected.pop()
+        elif operation < 0.9 and expected:
+            assert quicklist.popleft() == expected.pop(0)
+        elif operation < 0.91:
+            start = rng.randint(-len(expected) - 2, len(expected) + 2)
+            stop = rng.randint(-len(expected) - 2, len(expected) + 2)
+            quicklist.trim(start, stop)
+            expected = redis_range(expected, start, stop)
+    _check(quicklist, expected)
+
+
+@pytest.mark.parametrize("start, stop", [(0, -1), (1, -2), (CHUNK_SIZE, CHUNK_SIZE * 2), (-10, -1), (3, 1)])
+def test_trim(start, stop):
+    items = list(range(CHUNK_SIZE * 3))
+    quicklist = QuickList(items)
+    quicklist.trim(start, stop)
+    expected = redis_range(items, start, stop)
+    _check(quicklist, expected)
+    quicklist.append("tail")
+    quicklist.appendleft("head")
+    _check(quicklist, ["head"] + expected + ["tail"])
+
+
+def test_memory_usage_follows_changes():
+    rng = random.Random(7)
+    quicklist = QuickList([b"x" * n for n in range(300)])
+    expected = list(quicklist)
+    for _ in range(5000):
+        value = b"v" * rng.randrange(200)
+        operation = rng.random()
+        if operation < 0.3:
+            quicklist.append(value)
+            expected.append(value)
+        elif operation < 0.6:
+            quicklist.appendleft(value)
+            expected.insert(0, value)
+        elif operation < 0.7 and expected:
+            index = rng.randrange(len(expected))
+            quicklist[index] = expected[index] = value
+        elif operation < 0.8 and expected:
+            assert quicklist.pop() == expected.pop()
+        elif operation < 0.9 and expected:
+            assert quicklist.popleft() == expected.pop(0)
+        elif operation < 0.91:
+            start, stop = rng.randint(-50, 50), rng.randint(-50, len(expected))
+            quicklist.trim(start, stop)
+            expected = redis_range(expected, start, stop)
+        assert quicklist._element_bytes == sum(map(sys.getsizeof, expected))
+    assert quicklist.memory_usage() > sum(map(sys.getsizeof, expected))
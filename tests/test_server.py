@@ -0,0 +1,127 @@
+import socket
+import threading
+from dataclasses import replace
+from time import sleep
+
+import pytest
+
+from pyredis.commands import COMMANDS
+from pyredis.server import Server
+
+from conftest import encoded_command
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk, "connection closed"
+        data += chunk
+    return bytes(data)
+
+
+@pytest.fixture(params=[0, 2], ids=["inline", "pool"])
+def server(request):
+    server = Server(0, host="127.0.0.1", workers=request.param, max_connections=4)
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    assert server.ready.wait(5)
+    yield server
+    server.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def _connect(server):
+    return socket.create_connection(server.address, timeout=5)
+
+
+def test_set_and_get(server):
+    with _connect(server) as sock:
+        sock.sendall(encoded_command(b"SET", b"key", b"value"))
+        assert _recv_exactly(sock, 5) == b"+OK\r\n"
+        sock.sendall(encoded_command(b"GET", b"key"))
+        assert _recv_exactly(sock, 11) == b"$5\r\nvalue\r\n"
+
+
+def test_pipelined_replies_in_order(server):
+    expected = b"".join(b":%d\r\n" % i for i in range(1, 5001))
+    with _connect(server) as sock:
+        # Sent in pieces that split frames, so the commands arrive over many
+        # reads and may run as several batches.
+        commands = encoded_command(b"INCR", b"counter") * 5000
+        for i in range(0, len(commands), 1000):
+            sock.sendall(commands[i:i + 1000])
+        assert _recv_exactly(sock, len(expected)) == expected
+
+
+def test_partial_writes(server):
+    value = b"x" * (8 * 2 ** 20)
+    reply = b"$%d\r\n%b\r\n" % (len(value), value)
+
+    with _connect(server) as slow, _connect(server) as other:
+        slow.sendall(encoded_command(b"SET", b"big", value))
+        assert _recv_exactly(slow, 5) == b"+OK\r\n"
+
+        # The replies are far larger than the socket buffers, so the server
+        # has to keep most of them while the client is not reading.
+        slow.sendall(encoded_command(b"GET", b"big") * 4 + encoded_command(b"PING"))
+
+        # Meanwhile other clients are still served.
+        other.sendall(encoded_command(b"PING"))
+        assert _recv_exactly(other, 7) == b"+PONG\r\n"
+
+        assert _recv_exactly(slow, 4 * len(reply) + 7) == reply * 4 + b"+PONG\r\n"
+
+
+def test_max_connections(server):
+    clients = [_connect(server) for _ in range(4)]
+    try:
+        for sock in clients:
+            sock.sendall(encoded_command(b"PING"))
+            assert _recv_exactly(sock, 7) == b"+PONG\r\n"
+
+        with _connect(server) as rejected:
+            assert rejected.recv(100) == b"-ERR max number of clients reached\r\n"
+            assert rejected.recv(100) == b""
+
+        # A slot frees up once a client disconnects.
+        clients.pop().close()
+        for _ in range(100):
+            if server.connected_clients < 4:
+                break
+            sleep(0.01)
+        with _connect(server) as sock:
+            sock.sendall(encoded_command(b"PING"))
+            assert _recv_exactly(sock, 7) == b"+PONG\r\n"
+    finally:
+        for sock in clients:
+            sock.close()
+
+
+def test_protocol_error_closes_connection(server):
+    with _connect(server) as sock:
+        sock.sendall(b"*1\r\n$4\r\nPINGXX\r\n")
+        assert sock.recv(100) == b"-ERR Protocol error\r\n"
+        assert sock.recv(100) == b""
+
+
+def test_empty_command_does_not_stop_the_server(server):
+    with _connect(server) as sock, _connect(server) as other:
+        sock.sendall(b"*0\r\n")
+        assert _recv_exactly(sock, 20) == b"-ERR empty command\r\n"
+        other.sendall(encoded_command(b"PING"))
+        assert _recv_exactly(other, 7) == b"+PONG\r\n"
+
+
+def test_command_that_raises_gets_an_error(server, monkeypatch):
+    def broken(args, datastore):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(COMMANDS, b"ping", replace(COMMANDS[b"ping"], handler=broken))
+    with _connect(server) as sock, _connect(server) as other:
+        sock.sendall(encoded_command(b"ping") + encoded_command(b"ECHO", b"after"))
+        expected = b"-ERR internal error: RuntimeError: boom\r\n$5\r\nafter\r\n"
+        assert _recv_exactly(sock, len(expected)) == expected
+        other.sendall(encoded_command(b"ECHO", b"hi"))
+        assert _recv_exactly(other, 8) == b"$2\r\nhi\r\n"
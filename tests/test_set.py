@@ -0,0 +1,97 @@
+import random
+import sys
+
+import pytest
+
+from pyredis.set import ENCODING_HASHTABLE, ENCODING_INTSET, SET_MAX_INTSET_ENTRIES, Set
+
+
+def test_empty():
+    set_ = Set()
+    assert len(set_) == 0
+    assert list(set_) == []
+    assert b"1" not in set_
+    assert not set_.remove(b"1")
+    assert set_.encoding == ENCODING_INTSET
+
+
+def test_intset_is_sorted_and_dedupes():
+    set_ = Set([b"5", b"-3", b"100", b"5", b"0"])
+    assert set_.encoding == ENCODING_INTSET
+    assert list(set_) == [b"-3", b"0", b"5", b"100"]
+    assert not set_.add(b"100")
+    assert b"-3" in set_
+    assert set_.remove(b"0")
+    assert list(set_) == [b"-3", b"5", b"100"]
+
+
+@pytest.mark.parametrize("member", [b"1.5", b"007", b"+1", b" 1", b"abc", b"", b"9223372036854775808"])
+def test_non_integers_are_never_in_an_intset(member):
+    set_ = Set([b"1"])
+    assert member not in set_
+    assert not set_.remove(member)
+    assert set_.encoding == ENCODING_INTSET
+    assert set_.add(member)
+    assert set_.encoding == ENCODING_HASHTABLE
+    assert set(set_) == {b"1", member}
+
+
+def test_intset_widens_items():
+    set_ = Set([b"1", b"-2"])
+    assert set_._members.itemsize == 2
+    set_.add(b"70000")
+    assert set_._members.itemsize == 4
+    set_.add(b"%d" % -2 ** 63)
+    assert set_._members.itemsize == 8
+    assert list(set_) == [b"%d" % -2 ** 63, b"-2", b"1", b"70000"]
+
+
+def test_converted_past_entries():
+    set_ = Set(b"%d" % i for i in range(SET_MAX_INTSET_ENTRIES))
+    assert set_.encoding == ENCODING_INTSET
+    set_.add(b"-1")
+    assert set_.encoding == ENCODING_HASHTABLE
+    assert len(set_) == SET_MAX_INTSET_ENTRIES + 1
+    assert b"-1" in set_ and b"0" in set_
+
+
+@pytest.mark.parametrize("size", [20, SET_MAX_INTSET_ENTRIES * 2])
+def test_random_operations_match_set(size):
+    rng = random.Random(size)
+    set_ = Set()
+    expected = set()
+    for _ in range(size * 10):
+        member = b"%d" % rng.randrange(-size, size)
+        if rng.random() < 0.01:
+            member += b"x"
+        if rng.random() < 0.3:
+            assert set_.remove(member) == (member in expected)
+            expected.discard(member)
+        else:
+            assert set_.add(member) == (member not in expected)
+            expected.add(member)
+    assert set(set_) == expected
+    assert len(set_) == len(expected)
+    assert all(member in set_ for member in expected)
+
+
+def test_memory_usage_follows_changes():
+    set_ = Set()
+    for i in range(SET_MAX_INTSET_ENTRIES * 2):
+        set_.add(b"%d" % i)
+        if i % 3 == 0:
+            set_.remove(b"%d" % (i // 3))
+        if set_.encoding == ENCODING_HASHTABLE:
+            walked = sum(map(sys.getsizeof, set_))
+        else:
+            walked = 0
+        assert set_.memory_usage() == sys.getsizeof(set_) + sys.getsizeof(set_._members) + walked
+
+
+def test_intset_is_smaller():
+    members = [b"%d" % i for i in range(SET_MAX_INTSET_ENTRIES)]
+    intset = Set(members)
+    converted = Set(members)
+    converted.add(b"x")
+    converted.remove(b"x")
+    assert intset.memory_usage() * 10 < converted.memory_usage()
@@ -0,0 +1,208 @@
+import asyncio
+import types
+
+import pytest
+
+from pyredis.asyncserver import RedisServerProtocol
+from pyredis.commands import COMMANDS
+from pyredis.datastore import ALLKEYS_LRU, Datastore
+from pyredis.sharding import (
+    HASH_SLOTS, ShardedServerProtocol, ShardRouter, key_slot, run_shard, run_workers, shard_for_key,
+    shard_socket_path,
+)
+from pyredis.types import Error
+
+from conftest import FakeTransport, command
+
+
+def _keys_on_shard(shard, shards, count):
+    keys = (b"key:%d" % i for i in range(10_000))
+    return [key for key in keys if shard_for_key(key, shards) == shard][:count]
+
+
+@pytest.mark.parametrize("key, slot", [
+    (b"foo", 12182),
+    (b"bar", 5061),
+    (b"123456789", 0x31C3 % HASH_SLOTS),
+])
+def test_key_slot_matches_redis(key, slot):
+    assert key_slot(key) == slot
+
+
+@pytest.mark.parametrize("key, hashed", [
+    (b"{user1000}.following", b"user1000"),
+    (b"foo{}{bar}", b"foo{}{bar}"),
+    (b"foo{{bar}}zap", b"{bar"),
+    (b"foo{bar}{zap}", b"bar"),
+    (b"foo{bar", b"foo{bar"),
+])
+def test_key_slot_hash_tags(key, hashed):
+    assert key_slot(key) == key_slot(hashed)
+
+
+def test_shards_own_contiguous_slot_ranges():
+    owners = [slot * 4 // HASH_SLOTS for slot in range(HASH_SLOTS)]
+    assert owners == sorted(owners)
+    assert [owners.count(shard) for shard in range(4)] == [HASH_SLOTS // 4] * 4
+
+
+@pytest.mark.parametrize("args, keys", [
+    ([b"GET", b"k"], [b"k"]),
+    ([b"SET", b"k", b"v", b"EX", b"10"], [b"k"]),
+    ([b"DEL", b"a", b"b", b"c"], [b"a", b"b", b"c"]),
+    ([b"MSET", b"a", b"1", b"b", b"2"], [b"a", b"b"]),
+    ([b"SINTER", b"a", b"b", b"c"], [b"a", b"b", b"c"]),
+    ([b"ZADD", b"z", b"1", b"m"], [b"z"]),
+    ([b"PING"], []),
+])
+def test_command_keys(args, keys):
+    assert COMMANDS[args[0]].keys(args) == keys
+
+
+def test_router_shard_for(tmp_path):
+    router = ShardRouter(0, 2, tmp_path)
+    local = _keys_on_shard(0, 2, 2)
+    remote = _keys_on_shard(1, 2, 2)
+
+    assert router.shard_for(command(b"PING")) == 0
+    assert router.shard_for(command(b"GET", local[0])) == 0
+    assert router.shard_for(command(b"set", remote[0], b"v")) == 1
+    assert router.shard_for(command(b"DEL", *remote)) == 1
+    assert router.shard_for(command(b"MEMORY", b"USAGE", local[0])) == 0
+    assert router.shard_for(command(b"memory", b"usage", remote[0], b"SAMPLES", b"5")) == 1
+    assert router.shard_for(command(b"MEMORY", b"HELP")) == 0
+    assert router.shard_for(command(b"DEL", local[0], remote[0])) == Error(
+        "CROSSSLOT Keys in request don't hash to the same shard"
+    )
+
+
+def test_forwarding_keeps_reply_order(tmp_path):
+    local_key = _keys_on_shard(0, 2, 1)[0]
+    remote_key = _keys_on_shard(1, 2, 1)[0]
+
+    async def run():
+        stores = [Datastore(thread_safe=False), Datastore(thread_safe=False)]
+        peer_server = await asyncio.get_running_loop().create_unix_server(
+            lambda: RedisServerProtocol(stores[1]), shard_socket_path(tmp_path, 1)
+        )
+        protocol = ShardedServerProtocol(stores[0], None, ShardRouter(0, 2, tmp_path))
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+
+        protocol.data_received(
+            command(b"SET", remote_key, b"remote").resp_encode()
+            + command(b"SET", local_key, b"local").resp_encode()
+            + command(b"GET", remote_key).resp_encode()
+            + command(b"PING").resp_encode()
+        )
+        # The local replies wait behind the forwarded SET.
+        assert transport.writes == []
+
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if b"".join(transport.writes).count(b"\r\n") == 5:
+                break
+
+        peer_server.close()
+        await peer_server.wait_closed()
+        return stores, b"".join(transport.writes)
+
+    stores, replies = asyncio.run(run())
+    assert replies == b"+OK\r\n+OK\r\n$6\r\nremote\r\n+PONG\r\n"
+    assert stores[0][local_key] == b"local"
+    assert stores[1][remote_key] == b"remote"
+    assert stores[0].exists([remote_key]) == 0
+
+
+def test_unreachable_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr("pyredis.sharding.PEER_CONNECT_TIMEOUT", 0.1)
+    remote_key = _keys_on_shard(1, 2, 1)[0]
+
+    async def run():
+        protocol = ShardedServerProtocol(Datastore(thread_safe=False), None, ShardRouter(0, 2, tmp_path))
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        protocol.data_received(command(b"GET", remote_key).resp_encode() + command(b"PING").resp_encode())
+        await asyncio.sleep(0.5)
+        return transport.writes
+
+    assert asyncio.run(run()) == [b"-TRYAGAIN shard unavailable\r\n+PONG\r\n"]
+
+
+def test_protocol_error_waits_for_forwarded_replies(tmp_path, monkeypatch):
+    monkeypatch.setattr("pyredis.sharding.PEER_CONNECT_TIMEOUT", 0.1)
+    remote_key = _keys_on_shard(1, 2, 1)[0]
+
+    async def run():
+        protocol = ShardedServerProtocol(Datastore(thread_safe=False), None, ShardRouter(0, 2, tmp_path))
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        protocol.data_received(command(b"GET", remote_key).resp_encode() + command(b"PING").resp_encode() + b"*x\r\n")
+        assert transport.writes == [] and not transport.closed
+        # Nothing more is read from the client.
+        protocol.data_received(command(b"PING").resp_encode())
+        await asyncio.sleep(0.5)
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.writes == [b"-TRYAGAIN shard unavailable\r\n+PONG\r\n-ERR Protocol error\r\n"]
+    assert transport.closed
+
+
+class FakeProcess:
+    """A worker that has exited, with its status from exitcodes by shard, once joined."""
+    started = []
+    terminated = []
+    exitcodes = {}
+
+    def __init__(self, target, args):
+        self.args = args
+        self.sentinel = args[0]
+        self.exitcode = None
+
+    def start(self):
+        self.started.append(self.args)
+
+    def join(self):
+        self.exitcode = self.exitcodes.get(self.sentinel, 0)
+
+    def terminate(self):
+        self.terminated.append(self.sentinel)
+
+
+@pytest.fixture
+def fake_processes(monkeypatch):
+    monkeypatch.setattr("multiprocessing.get_context", lambda method: types.SimpleNamespace(Process=FakeProcess))
+    monkeypatch.setattr("pyredis.sharding.wait", lambda sentinels: sentinels[:1])
+    monkeypatch.setattr(FakeProcess, "started", [])
+    monkeypatch.setattr(FakeProcess, "terminated", [])
+    monkeypatch.setattr(FakeProcess, "exitcodes", {})
+    return FakeProcess
+
+
+@pytest.mark.parametrize("maxmemory, expected", [(0, 0), (1000, 250), (3, 1)])
+def test_run_workers_splits_maxmemory(fake_processes, maxmemory, expected):
+    assert run_workers(6379, "no", 4, maxmemory=maxmemory, maxmemory_policy=ALLKEYS_LRU) is None
+    assert [args[-2:] for args in fake_processes.started] == [(expected, ALLKEYS_LRU)] * 4
+
+
+def test_failed_worker_stops_the_others(fake_processes):
+    fake_processes.exitcodes[1] = 1
+    assert run_workers(6379, "no", 4) == -1
+    assert sorted(fake_processes.terminated) == [0, 1, 2, 3]
+
+
+def test_shard_that_fails_to_load_exits_non_zero(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "ccdb-0.aof").write_bytes(b"*1\r\n$3\r\nfoo\r\n")
+    with pytest.raises(SystemExit) as exit_info:
+        run_shard(0, 2, 0, "no", tmp_path, loop_backend="asyncio")
+    assert exit_info.value.code == 1
+
+
+def test_empty_command(tmp_path):
+    protocol = ShardedServerProtocol(Datastore(thread_safe=False), None, ShardRouter(0, 2, tmp_path))
+    transport = FakeTransport()
+    protocol.connection_made(transport)
+    protocol.data_received(b"*0\r\n" + command(b"PING").resp_encode())
+    assert transport.writes == [b"-ERR empty command\r\n+PONG\r\n"]
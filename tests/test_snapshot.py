@@ -0,0 +1,209 @@
+import os
+from time import sleep, time_ns
+
+import pytest
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.persistence import AppendOnlyPersister, load_data, read_aof_id
+from pyredis.snapshot import CorruptSnapshotError, load_snapshot, read_snapshot_aux, write_snapshot
+from pyredis.types import Error, OK, SimpleString
+
+from conftest import command
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return tmp_path / "test.rdb"
+
+
+@pytest.fixture
+def aof(tmp_path):
+    return tmp_path / "test.aof"
+
+
+def _populate(datastore):
+    datastore[b"string"] = b"value\r\nwith separator"
+    datastore[b"empty"] = b""
+    datastore[b"int"] = b"-12345"
+    datastore[b"big"] = b"9" * 300
+    datastore[b"padded"] = b"007"
+    datastore["str key"] = "str value"
+    datastore.append(b"list", *(b"item:%d" % i for i in range(1000)))
+    datastore.set_with_expiry(b"ttl", b"v", 100)
+    datastore.hset(b"hash", [(b"field", b"value"), (b"empty", b""), (b"n", b"12")])
+    datastore.hset(b"big hash", [(b"f%d" % i, b"v" * i) for i in range(300)])
+    datastore.sadd(b"intset", [b"3", b"-70000", b"1"])
+    datastore.sadd(b"set", [b"a", b"b", b"1"])
+    datastore.zadd(b"zset", [(b"m%d" % i, i / 3) for i in range(3000)] + [(b"inf", float("inf"))])
+
+
+def test_round_trip(snapshot):
+    datastore = Datastore()
+    _populate(datastore)
+    write_snapshot(datastore, snapshot, {b"name": b"value"})
+
+    restored = Datastore()
+    assert load_snapshot(snapshot, restored) == {b"name": b"value"}
+    assert restored[b"string"] == b"value\r\nwith separator"
+    assert restored[b"empty"] == b""
+    assert restored[b"int"] == b"-12345"
+    assert restored[b"big"] == b"9" * 300
+    assert restored[b"padded"] == b"007"
+    assert restored[b"str key"] == b"str value"
+    assert restored.lrange(b"list", 0, -1) == [b"item:%d" % i for i in range(1000)]
+    assert restored.hgetall(b"hash") == [(b"field", b"value"), (b"empty", b""), (b"n", b"12")]
+    assert restored.hgetall(b"big hash") == [(b"f%d" % i, b"v" * i) for i in range(300)]
+    assert restored.smembers(b"intset") == [b"-70000", b"1", b"3"]
+    assert sorted(restored.smembers(b"set")) == [b"1", b"a", b"b"]
+    assert restored.zrange(b"zset", 0, -1) == [(b"m%d" % i, i / 3) for i in range(3000)] + [(b"inf", float("inf"))]
+    assert 99 * 10 ** 9 < restored._expires[b"ttl"] - time_ns() <= 100 * 10 ** 9
+    assert restored._expiry_heap[0][1] == b"ttl"
+    assert not os.path.exists(f"{snapshot}.tmp")
+
+
+def test_integers_are_stored_compactly(snapshot):
+    datastore = Datastore({b"k": b"%d" % (2 ** 62)})
+    write_snapshot(datastore, snapshot)
+    assert b"%d" % (2 ** 62) not in snapshot.read_bytes()
+
+
+def test_expired_keys_are_skipped(snapshot):
+    datastore = Datastore()
+    datastore.set_with_expiry(b"gone", b"v", 0.05)
+    datastore[b"kept"] = b"v"
+    write_snapshot(datastore, snapshot)
+    sleep(0.1)
+
+    later = Datastore()
+    assert not later.load_entry(b"other", b"v", time_ns() - 1)
+    assert load_snapshot(snapshot, later) == {}
+    assert later._data.keys() == {b"kept"}
+
+
+def test_load_missing(snapshot):
+    assert load_snapshot(snapshot, Datastore()) is None
+    assert read_snapshot_aux(snapshot) is None
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:-1],
+    lambda data: data[:10],
+    lambda data: data[:20] + bytes([data[20] ^ 1]) + data[21:],
+    lambda data: b"NOTREDIS" + data[8:],
+])
+def test_load_corrupt(snapshot, corrupt):
+    datastore = Datastore()
+    _populate(datastore)
+    write_snapshot(datastore, snapshot)
+    snapshot.write_bytes(corrupt(snapshot.read_bytes()))
+
+    restored = Datastore()
+    with pytest.raises(CorruptSnapshotError):
+        load_snapshot(snapshot, restored)
+    assert restored.exists([b"string", b"list"]) == 0
+
+
+def test_save_and_bgsave(aof, snapshot):
+    persister = AppendOnlyPersister(aof, "no", snapshot_filename=snapshot)
+    datastore = Datastore()
+    handle_command(command(b"set", b"k", b"1"), datastore, persister)
+
+    assert handle_command(command(b"save"), datastore, persister) == OK
+    restored = Datastore()
+    load_snapshot(snapshot, restored)
+    assert restored[b"k"] == b"1"
+
+    handle_command(command(b"rpush", b"l", b"a"), datastore, persister)
+    assert handle_command(command(b"bgsave"), datastore, persister) == SimpleString("Background saving started")
+    assert handle_command(command(b"bgsave"), datastore, persister) == Error("ERR Background save already in progress")
+    assert not persister.rewrite(datastore)
+    persister.wait_for_child()
+    persister.close()
+
+    restored = Datastore()
+    aux = load_snapshot(snapshot, restored)
+    assert restored.lrange(b"l", 0, -1) == [b"a"]
+    assert int(aux[b"aof-offset"]) == os.path.getsize(aof)
+    assert aux[b"aof-id"] == read_aof_id(aof)
+
+
+def test_save_without_snapshot_file(aof):
+    persister = AppendOnlyPersister(aof, "no")
+    assert handle_command(command(b"save"), Datastore(), persister) == Error("ERR snapshotting is not enabled")
+    assert handle_command(command(b"bgsave"), Datastore()) == Error("ERR snapshotting is not enabled")
+    persister.close()
+
+
+def test_load_data_replays_aof_after_snapshot(aof, snapshot):
+    persister = AppendOnlyPersister(aof, "no", snapshot_filename=snapshot)
+    datastore = Datastore()
+    for _ in range(10):
+        handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.save(datastore)
+    for _ in range(5):
+        handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.close()
+
+    restored = Datastore()
+    assert load_data(restored, aof, snapshot)
+    assert restored[b"counter"] == b"15"
+
+
+def test_load_data_prefers_aof_from_another_file(aof, snapshot):
+    datastore = Datastore({b"k": b"old"})
+    write_snapshot(datastore, snapshot, {b"aof-id": b"other", b"aof-offset": b"0"})
+    aof.write_bytes(b"*3\r\n$3\r\nset\r\n$1\r\nk\r\n$3\r\nnew\r\n")
+
+    restored = Datastore()
+    assert load_data(restored, aof, snapshot)
+    assert restored[b"k"] == b"new"
+
+
+def test_load_data_after_rewrites(aof, snapshot):
+    persister = AppendOnlyPersister(aof, "no", snapshot_filename=snapshot)
+    datastore = Datastore()
+    handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.save(datastore)
+
+    # Each rewrite replaces the AOF with a new file, so the second takes
+    # the inode of the file the snapshot was taken alongside, and then
+    # grows past the offset the snapshot recorded, but has another id.
+    for _ in range(2):
+        assert persister.rewrite(datastore)
+        persister.wait_for_child()
+    for _ in range(20):
+        handle_command(command(b"incr", b"counter"), datastore, persister)
+    persister.close()
+
+    restored = Datastore()
+    assert load_data(restored, aof, snapshot)
+    assert restored[b"counter"] == b"21"
+
+
+def test_new_aof_starts_with_loaded_data(aof, snapshot):
+    write_snapshot(Datastore({b"k": b"v"}), snapshot)
+    datastore = Datastore()
+    assert load_data(datastore, aof, snapshot)
+    AppendOnlyPersister(aof, "no", snapshot_filename=snapshot, datastore=datastore).close()
+
+    restored = Datastore()
+    assert load_data(restored, aof, snapshot)
+    assert restored[b"k"] == b"v"
+
+
+def test_load_data_without_aof(aof, snapshot):
+    write_snapshot(Datastore({b"k": b"v"}), snapshot)
+    restored = Datastore()
+    assert load_data(restored, aof, snapshot)
+    assert restored[b"k"] == b"v"
+
+
+def test_load_data_corrupt_snapshot(aof, snapshot):
+    snapshot.write_bytes(b"garbage")
+    assert not load_data(Datastore(), aof, snapshot)
+
+    aof.write_bytes(b"*2\r\n$4\r\nincr\r\n$1\r\nc\r\n")
+    restored = Datastore()
+    assert load_data(restored, aof, snapshot)
+    assert restored[b"c"] == b"1"
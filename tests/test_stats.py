@@ -0,0 +1,180 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pyredis.commands import handle_command
+from pyredis.datastore import Datastore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.stats import (
+    LATENCY_MONITOR_THRESHOLD_MS, STATS, CommandStats, Stats, bucket_index, bucket_lowest, percentile,
+)
+from pyredis.types import Array, BulkString, Error, Integer
+
+from conftest import command
+
+
+def _info(datastore, *sections, client=None):
+    reply = handle_command(command(b"INFO", *sections), datastore, client=client)
+    fields = {}
+    for line in reply.data.decode().split("\r\n"):
+        if line and not line.startswith("#"):
+            name, _, value = line.partition(":")
+            fields[name] = value
+    return fields
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    STATS.enabled = True
+    STATS.reset()
+    yield
+    STATS.enabled = True
+    STATS.reset()
+
+
+def test_buckets_cover_every_value_once():
+    values = list(range(200)) + [10 ** 6, 2 ** 40 + 12345, 2 ** 63]
+    for value in values:
+        index = bucket_index(value)
+        assert bucket_lowest(index) <= value < bucket_lowest(index + 1)
+    assert [bucket_index(v) for v in range(200)] == sorted(bucket_index(v) for v in range(200))
+
+
+def test_bucket_width_is_bounded():
+    for value in (100, 12_345, 10 ** 9):
+        index = bucket_index(value)
+        assert bucket_lowest(index + 1) - bucket_lowest(index) <= value / 8
+
+
+def test_percentiles():
+    stats = Stats()
+    for value in range(1, 1001):
+        stats.record_command(b"GET", value * 1000, False)
+    counts = stats.commands[b"GET"].counts
+
+    assert percentile(counts, 50) == pytest.approx(500_000, rel=0.125)
+    assert percentile(counts, 99) == pytest.approx(990_000, rel=0.125)
+    assert percentile(counts, 100) >= 1_000_000
+    assert percentile(CommandStats().counts, 50) == 0
+
+
+def test_command_stats():
+    datastore = Datastore()
+    handle_command(command(b"SET", b"k", b"v"), datastore)
+    handle_command(command(b"get", b"k"), datastore)
+    handle_command(command(b"GET", b"k"), datastore)
+    handle_command(command(b"INCR", b"k"), datastore)
+    handle_command(command(b"NOSUCH"), datastore)
+
+    assert STATS.commands[b"GET"].calls == 2
+    assert STATS.commands[b"INCR"].failed_calls == 1
+    assert STATS.total_commands == 4
+
+    info = _info(datastore, b"commandstats", b"latencystats")
+    assert info["cmdstat_get"].startswith("calls=2,usec=")
+    assert info["cmdstat_incr"].endswith("failed_calls=1")
+    assert info["latency_percentiles_usec_set"].startswith("p50=")
+
+
+def test_disabled_records_nothing():
+    STATS.enabled = False
+    datastore = Datastore()
+    handle_command(command(b"SET", b"k", b"v"), datastore)
+    STATS.latency_event("expire-cycle", 10 ** 9)
+    STATS.track_ops()
+    assert STATS.commands == {}
+    assert STATS.latency_events == {}
+
+
+def test_info_stats_and_keyspace(tmp_path):
+    datastore = Datastore()
+    persister = AppendOnlyPersister(tmp_path / "stats.aof", "no")
+    handle_command(command(b"SET", b"a", b"1"), datastore, persister)
+    handle_command(command(b"SET", b"b", b"2", b"PX", b"100000"), datastore, persister)
+    datastore.set_with_expiry(b"c", b"3", -1)
+    datastore.remove_expired_keys()
+
+    client = SimpleNamespace(clients={1: None, 2: None}, persister=persister)
+    info = _info(datastore, client=client)
+    persister.close()
+
+    assert info["connected_clients"] == "2"
+    assert info["total_commands_processed"] == "2"
+    assert info["expired_keys"] == "1"
+    assert info["db0"] == "keys=2,expires=1,avg_ttl=0"
+    assert info["aof_enabled"] == "1"
+    assert int(info["aof_bytes_written"]) == (tmp_path / "stats.aof").stat().st_size
+    assert "cmdstat_set" not in info
+
+
+def test_info_without_a_connection():
+    info = _info(Datastore())
+    assert "connected_clients" not in info
+    assert info["aof_enabled"] == "0"
+    assert "db0" not in info
+
+
+def test_ops_per_sec(monkeypatch):
+    stats = Stats()
+    now = [100.0]
+    monkeypatch.setattr("pyredis.stats.monotonic", lambda: now[0])
+    stats.track_ops()
+    for _ in range(500):
+        stats.record_command(b"GET", 1000, False)
+    now[0] += 0.5
+    stats.track_ops()
+    assert stats.ops_per_sec == 1000
+
+
+def test_latency_monitor():
+    datastore = Datastore()
+    STATS.latency_event("expire-cycle", 5 * 10 ** 6)
+    assert handle_command(command(b"LATENCY", b"LATEST"), datastore) == Array([])
+
+    STATS.latency_event("expire-cycle", 30 * 10 ** 6)
+    STATS.latency_event("expire-cycle", 20 * 10 ** 6)
+    STATS.latency_event("event-loop", 15 * 10 ** 6)
+
+    latest = handle_command(command(b"LATENCY", b"LATEST"), datastore)
+    assert [(item[0], item[2], item[3]) for item in latest] == [
+        (BulkString(b"expire-cycle"), Integer(20), Integer(30)),
+        (BulkString(b"event-loop"), Integer(15), Integer(15)),
+    ]
+    history = handle_command(command(b"LATENCY", b"HISTORY", b"expire-cycle"), datastore)
+    assert [item[1] for item in history] == [Integer(30), Integer(20)]
+
+    assert handle_command(command(b"LATENCY", b"RESET", b"event-loop"), datastore) == Integer(1)
+    assert handle_command(command(b"LATENCY", b"RESET"), datastore) == Integer(1)
+    assert handle_command(command(b"LATENCY", b"LATEST"), datastore) == Array([])
+    assert isinstance(handle_command(command(b"LATENCY", b"DOCTOR"), datastore), Error)
+
+
+def test_slow_command_is_a_latency_event():
+    STATS.threshold_ms = 1
+    try:
+        STATS.record_command(b"KEYS", 2 * 10 ** 6, False)
+        STATS.record_command(b"GET", 10 ** 5, False)
+    finally:
+        STATS.threshold_ms = LATENCY_MONITOR_THRESHOLD_MS
+    assert [event for event, *_ in STATS.latency_latest()] == ["command"]
+
+
+def test_info_memory_and_hit_ratio():
+    datastore = Datastore()
+    handle_command(command(b"SET", b"a", b"1"), datastore)
+    handle_command(command(b"GET", b"a"), datastore)
+    handle_command(command(b"GET", b"missing"), datastore)
+    handle_command(command(b"CONFIG", b"SET", b"maxmemory", b"1mb"), datastore)
+
+    info = _info(datastore)
+    assert int(info["used_memory"]) == datastore.used_memory > 0
+    assert info["maxmemory"] == "1048576"
+    assert info["maxmemory_human"] == "1.00M"
+    assert info["maxmemory_policy"] == "noeviction"
+    assert (info["keyspace_hits"], info["keyspace_misses"], info["keyspace_hit_ratio"]) == ("1", "1", "0.5000")
+    assert info["evicted_keys"] == "0"
+
+    handle_command(command(b"CONFIG", b"RESETSTAT"), datastore)
+    info = _info(datastore)
+    # The CONFIG RESETSTAT itself is counted.
+    assert (info["keyspace_hits"], info["total_commands_processed"]) == ("0", "1")
@@ -0,0 +1,32 @@
+import pytest
+
+from pyredis.utils import as_integer, normalise_range
+
+
+@pytest.mark.parametrize("value, expected", [
+    (b"0", 0),
+    (b"-12", -12),
+    (b"9223372036854775807", 2 ** 63 - 1),
+    (b"-9223372036854775808", -2 ** 63),
+    (b"9223372036854775808", None),
+    (b"007", None),
+    (b"+1", None),
+    (b" 1", None),
+    (b"1_000", None),
+    (b"-0", None),
+    (b"", None),
+    (b"x", None),
+])
+def test_as_integer(value, expected):
+    assert as_integer(value) == expected
+
+
+@pytest.mark.parametrize("start, stop, expected", [
+    (0, -1, (0, 10)),
+    (2, 4, (2, 5)),
+    (-3, -1, (7, 10)),
+    (-100, 100, (0, 10)),
+    (5, 2, (5, 3)),
+])
+def test_normalise_range(start, stop, expected):
+    assert normalise_range(start, stop, 10) == expected
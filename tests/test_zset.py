@@ -0,0 +1,100 @@
+import random
+import sys
+
+import pytest
+
+from pyredis import zset
+from pyredis.zset import SortedSet, format_score
+
+from conftest import redis_range
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Small chunks so that splits and removals of chunks happen often.
+    monkeypatch.setattr(zset, "CHUNK_SIZE", 4)
+
+
+def _ordered(scores):
+    return sorted(scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def test_empty():
+    zset_ = SortedSet()
+    assert len(zset_) == 0
+    assert zset_.items() == []
+    assert zset_.range(0, -1) == []
+    assert zset_.rank(b"a") is None
+    assert zset_.score(b"a") is None
+    assert zset_.score_range(float("-inf"), float("inf")) == (0, 0)
+    assert not zset_.remove(b"a")
+
+
+def test_orders_by_score_then_member():
+    zset_ = SortedSet([(b"b", 1.0), (b"a", 1.0), (b"c", 0.5), (b"d", 2.0), (b"a", 3.0)])
+    assert zset_.items() == [(b"c", 0.5), (b"b", 1.0), (b"d", 2.0), (b"a", 3.0)]
+    assert zset_.add(b"e", 1.0) is None
+    assert zset_.add(b"a", 0.0) == 3.0
+    assert zset_.items() == [(b"a", 0.0), (b"c", 0.5), (b"b", 1.0), (b"e", 1.0), (b"d", 2.0)]
+    assert [zset_.rank(member) for member in (b"a", b"b", b"e", b"d")] == [0, 2, 3, 4]
+
+
+@pytest.mark.parametrize("initial", [0, 50])
+def test_random_operations_match_sorted_list(small_chunks, initial):
+    rng = random.Random(initial)
+    zset_ = SortedSet((b"m%d" % i, float(rng.randrange(20))) for i in range(initial))
+    expected = dict(zset_.items())
+    for _ in range(3000):
+        member = b"m%d" % rng.randrange(100)
+        if rng.random() < 0.4:
+            assert zset_.remove(member) == (expected.pop(member, None) is not None)
+        else:
+            score = rng.choice([float(rng.randrange(30)), 0.5, float("inf"), float("-inf")])
+            assert zset_.add(member, score) == expected.get(member)
+            expected[member] = score
+
+        ordered = _ordered(expected)
+        assert zset_.items() == ordered
+        if ordered:
+            member = rng.choice(ordered)[0]
+            assert zset_.rank(member) == ordered.index((member, expected[member]))
+        start, stop = rng.randrange(-120, 120), rng.randrange(-120, 120)
+        assert zset_.range(start, stop) == redis_range(ordered, start, stop)
+
+        minimum, maximum = rng.randrange(-5, 30), rng.randrange(-5, 30)
+        exclude_minimum, exclude_maximum = rng.random() < 0.5, rng.random() < 0.5
+        first, stop = zset_.score_range(minimum, maximum, exclude_minimum, exclude_maximum)
+        assert zset_.slice(first, stop) == [
+            (member, score) for member, score in ordered
+            if (score > minimum if exclude_minimum else score >= minimum)
+            and (score < maximum if exclude_maximum else score <= maximum)
+        ]
+
+
+def test_large_set_ranks(small_chunks):
+    scores = {b"m%d" % i: float(i * 7919 % 1000) for i in range(2000)}
+    zset_ = SortedSet(scores.items())
+    ordered = _ordered(scores)
+    assert all(zset_.rank(member) == rank for rank, (member, _) in enumerate(ordered))
+    assert zset_.range(-3, -1) == ordered[-3:]
+    assert zset_.slice(1000, 1010) == ordered[1000:1010]
+
+
+def test_memory_usage_follows_changes(small_chunks):
+    zset_ = SortedSet()
+    for i in range(200):
+        zset_.add(b"m%d" % i, float(i % 7))
+        if i % 3 == 0:
+            zset_.remove(b"m%d" % (i // 3))
+        walked = sum(sys.getsizeof(member) + sys.getsizeof(score) for member, score in zset_)
+        assert zset_._element_bytes == walked
+        assert zset_.memory_usage() > walked
+
+
+@pytest.mark.parametrize("score, formatted", [
+    (1.0, b"1"), (-2.0, b"-2"), (1.5, b"1.5"), (0.1, b"0.1"), (1e20, b"1e+20"),
+    (float("inf"), b"inf"), (float("-inf"), b"-inf"), (2.0 ** 53, b"9007199254740992"),
+])
+def test_format_score(score, formatted):
+    assert format_score(score) == formatted
+    assert float(formatted) == score